@@ -0,0 +1,224 @@
+# Non-interactive batch mode: one JSON command per input line, all answered over one connection.
+#
+# Each input line is an object naming a command and its arguments, for example
+#   {"command": "monthly_ridership", "station": "Clark/Lake", "year": 2021}
+#   {"id": 7, "command": "daily_comparison", "stations": ["Clark/Lake", "UIC-Halsted"], "year": 2024}
+# and produces one output line, {"line": n, "command": ..., "result": ...} on success or
+# {"line": n, "command": ..., "error": ...} on failure; an "id" given in the input is echoed back.
+# A bad line never stops the batch. Statements are prepared once and reused from the
+# connection's statement cache (connect_db's cached_statements), and repeated commands are
+# answered from the QueryCache, so a job of thousands of queries pays startup once.
+
+import datetime
+import json
+import math
+import sqlite3
+import sys
+import time
+
+from cta_analytics import to_json, year_range
+from sketches import DEFAULT_QUANTILES
+
+MIN_INTEGER = -2 ** 63
+MAX_INTEGER = 2 ** 63 - 1
+
+
+class BatchError(Exception):
+    def __init__(self, message, extra=None):
+        super().__init__(message)
+        self.message = message
+        self.extra = extra or {}
+
+
+def arg(args, name, convert=None, default=None):
+    value = args.get(name)
+    if value is None:
+        if default is not None:
+            return default
+        raise BatchError(f"missing argument '{name}'")
+    try:
+        return (convert or to_text)(value)
+    except (TypeError, ValueError):
+        raise BatchError(f"invalid value for '{name}'")
+
+
+def optional(args, name, convert=None):
+    return None if args.get(name) is None else arg(args, name, convert)
+
+
+# Converters check the JSON type instead of coercing, so 1.5 is not a year and [1] not a name
+def to_text(value):
+    if not isinstance(value, str):
+        raise ValueError(value)
+    return value
+
+
+def to_int(value):
+    # Also within SQLite's 64-bit INTEGER, which larger Python ints overflow when bound
+    if not isinstance(value, int) or isinstance(value, bool) or not MIN_INTEGER <= value <= MAX_INTEGER:
+        raise ValueError(value)
+    return value
+
+
+def to_number(value):
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or not math.isfinite(value):
+        raise ValueError(value)
+    return float(value)
+
+
+def to_texts(value):
+    return [to_text(item) for item in to_list(value)]
+
+
+def to_bool(value):
+    if not isinstance(value, bool):
+        raise ValueError(value)
+    return value
+
+
+def to_list(value):
+    if not isinstance(value, list):
+        raise ValueError(value)
+    return value
+
+
+def to_date(value):
+    # ISO YYYY-MM-DD only, so every date compares correctly against Ride_Date
+    if not isinstance(value, str):
+        raise ValueError(value)
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+def resolve_station(analytics, value):
+    # An integer is a Station_ID; a string is a wildcard pattern that must match exactly one station
+    if isinstance(value, int) and not isinstance(value, bool):
+        if not MIN_INTEGER <= value <= MAX_INTEGER:
+            raise BatchError(f"no station found for {value!r}")
+        return value
+    if not isinstance(value, str):
+        raise BatchError("a station is a Station_ID or a name pattern")
+    matches = analytics.match_stations(value)
+    if not matches:
+        raise BatchError(f"no station found for {value!r}")
+    if len(matches) > 1:
+        raise BatchError(f"multiple stations found for {value!r}", {'matches': to_json(matches)})
+    return matches[0].station_id
+
+
+def station(analytics, args):
+    return resolve_station(analytics, args['station_id'] if 'station_id' in args else arg(args, 'station'))
+
+
+def date_range(args):
+    # Either a year or start_date/end_date (end exclusive)
+    if 'year' in args:
+        return year_range(arg(args, 'year', to_int))
+    return arg(args, 'start_date', to_date), arg(args, 'end_date', to_date)
+
+
+def daily_comparison(analytics, args):
+    station_ids = [resolve_station(analytics, value) for value in arg(args, 'stations', to_list)]
+    if not station_ids:
+        raise BatchError("'stations' is empty")
+    start_date, end_date = date_range(args)
+    return {'station_ids': station_ids, 'rows': list(analytics.iter_daily_ridership(station_ids, start_date, end_date))}
+
+
+def ridership_distribution(analytics, args):
+    station_ids = None
+    if 'stations' in args:
+        station_ids = tuple(resolve_station(analytics, value) for value in arg(args, 'stations', to_list))
+    start_date, end_date = date_range(args) if 'year' in args or 'start_date' in args else (None, None)
+    fractions = tuple(arg(args, 'fractions', to_list, list(DEFAULT_QUANTILES)))
+    if not all(isinstance(fraction, (int, float)) and not isinstance(fraction, bool) and 0 <= fraction <= 1 for fraction in fractions):
+        raise BatchError("'fractions' must be numbers between 0 and 1")
+    return analytics.ridership_distribution(station_ids, start_date, end_date, fractions, arg(args, 'exact', to_bool, False))
+
+
+def nearby(analytics, args):
+    latitude = arg(args, 'lat', to_number)
+    longitude = arg(args, 'lon', to_number)
+    if 'k' in args:
+        return analytics.nearest_stops(latitude, longitude, arg(args, 'k', to_int))
+    return analytics.stations_within(latitude, longitude, arg(args, 'radius', to_number, 1.0))
+
+
+# command -> function(analytics, args), the same analyses as the interactive menu and the HTTP API
+COMMANDS = {
+    'statistics': lambda a, args: a.statistics(),
+    'find_stations': lambda a, args: a.find_stations(arg(args, 'name')),
+    'ridership_percentages': lambda a, args: a.ridership_percentages(arg(args, 'station')),
+    'weekday_ridership': lambda a, args: a.weekday_ridership(),
+    'stops_by_line_color': lambda a, args: a.stops_by_line_color(arg(args, 'color'), arg(args, 'direction')),
+    'stops_count_by_color': lambda a, args: a.stops_count_by_color(),
+    'yearly_ridership': lambda a, args: a.yearly_ridership(arg(args, 'station')),
+    'monthly_ridership': lambda a, args: a.monthly_ridership(station(a, args), arg(args, 'year', to_int)),
+    'daily_ridership': lambda a, args: a.daily_ridership(station(a, args), arg(args, 'year', to_int)),
+    'daily_comparison': daily_comparison,
+    'nearby': nearby,
+    'ridership_distribution': ridership_distribution,
+    'line_ridership': lambda a, args: a.line_ridership(optional(args, 'year', to_int), optional(args, 'day_type'),
+                                                       arg(args, 'split', to_bool, False)),
+    'line_monthly_ridership': lambda a, args: a.line_monthly_ridership(
+        tuple(arg(args, 'colors', to_texts)), optional(args, 'year', to_int), optional(args, 'day_type'),
+        optional(args, 'direction'), arg(args, 'match_all', to_bool, False)),
+}
+
+
+def run_command(analytics, line_number, text):
+    record = {'line': line_number}
+    try:
+        args = json.loads(text)
+        if not isinstance(args, dict):
+            raise BatchError("each line must be a JSON object")
+        if 'id' in args:
+            record['id'] = args['id']
+        name = args.get('command')
+        record['command'] = name
+        if not isinstance(name, str) or name not in COMMANDS:
+            raise BatchError(f"unknown command {name!r}")
+        record['result'] = to_json(COMMANDS[name](analytics, args))
+    except BatchError as e:
+        record['error'] = e.message
+        record.update(e.extra)
+    except json.JSONDecodeError as e:
+        record['error'] = f"invalid JSON: {e}"
+    except sqlite3.Error as e:
+        record['error'] = f"database error: {e}"
+    except (AttributeError, OverflowError, TypeError, ValueError) as e:
+        # An argument of the wrong shape that slipped past the checks above; one bad line
+        # must not end the batch
+        record['error'] = f"invalid arguments: {e}"
+    return record
+
+
+def run_batch(analytics, lines, out):
+    # Runs every non-blank line and writes one JSON line per command; returns (commands, errors)
+    commands = errors = 0
+    for line_number, text in enumerate(lines, 1):
+        if not text.strip():
+            continue
+        record = run_command(analytics, line_number, text)
+        commands += 1
+        errors += 'error' in record
+        out.write(json.dumps(record, separators=(',', ':')) + '\n')
+    return commands, errors
+
+
+def run_batch_file(analytics, input_path, output_path=None):
+    # '-' (or None) reads stdin / writes stdout; the summary goes to stderr so stdout stays JSON
+    started = time.perf_counter()
+    source = sys.stdin if input_path in (None, '-') else open(input_path)
+    out = sys.stdout if output_path in (None, '-') else open(output_path, 'w')
+    try:
+        commands, errors = run_batch(analytics, source, out)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    print(f"Ran {commands} commands ({errors} failed) in {elapsed:.2f}s", file=sys.stderr)
+    if analytics.cache is not None:
+        print("Query cache:", analytics.cache.stats(), file=sys.stderr)
+    return commands, errors
@@ -0,0 +1,231 @@
+import argparse
+import collections
+import csv
+import multiprocessing
+import sqlite3
+import sys
+
+import numpy as np
+
+from spatial import EARTH_RADIUS_MILES
+
+# Points per chunk; a chunk's distance matrix is CHUNK_SIZE x number of stops float64 values
+CHUNK_SIZE = 20000
+
+POINT_COLUMNS = {
+    'id': ('id', 'point_id', 'rider_id'),
+    'latitude': ('latitude', 'lat', 'Latitude'),
+    'longitude': ('longitude', 'lon', 'lng', 'Longitude'),
+}
+
+NEAREST_FIELDS = ['point_id', 'latitude', 'longitude', 'nearest_stop_id', 'nearest_stop', 'nearest_miles', 'stops_within']
+WITHIN_FIELDS = ['point_id', 'stop_id', 'stop_name', 'miles']
+
+
+def load_stops(cursor):
+    # All stop coordinates as parallel arrays, loaded once per process
+    cursor.execute("SELECT Stop_ID, Stop_Name, Latitude, Longitude FROM Stops WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL ORDER BY Stop_ID")
+    rows = cursor.fetchall()
+    stop_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    names = [row[1] for row in rows]
+    lat = np.radians(np.array([row[2] for row in rows], dtype=np.float64))
+    lon = np.radians(np.array([row[3] for row in rows], dtype=np.float64))
+    return stop_ids, names, lat, lon
+
+
+def haversine_matrix(point_lat, point_lon, stop_lat, stop_lon):
+    # Distances in miles between every point (rows) and every stop (columns); inputs in radians
+    d_lat = stop_lat[np.newaxis, :] - point_lat[:, np.newaxis]
+    d_lon = stop_lon[np.newaxis, :] - point_lon[:, np.newaxis]
+    a = np.sin(d_lat / 2) ** 2 + np.cos(point_lat)[:, np.newaxis] * np.cos(stop_lat)[np.newaxis, :] * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def find_column(header, names, required=True):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    if required:
+        raise ValueError(f"Missing column, expected one of: {', '.join(names)}")
+    return None
+
+
+def iter_point_chunks(path, chunk_size=CHUNK_SIZE):
+    # Yields (ids, latitudes, longitudes) lists; '-' reads from stdin
+    f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+    try:
+        reader = csv.reader(f)
+        header = [column.strip() for column in next(reader)]
+        id_col = find_column(header, POINT_COLUMNS['id'], required=False)
+        lat_col = find_column(header, POINT_COLUMNS['latitude'])
+        lon_col = find_column(header, POINT_COLUMNS['longitude'])
+
+        ids, lats, lons = [], [], []
+        for line_number, row in enumerate(reader, start=1):
+            if not row:
+                continue
+            ids.append(row[id_col] if id_col is not None else line_number)
+            lats.append(float(row[lat_col]))
+            lons.append(float(row[lon_col]))
+            if len(ids) >= chunk_size:
+                yield ids, lats, lons
+                ids, lats, lons = [], [], []
+        if ids:
+            yield ids, lats, lons
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def process_chunk(stops, chunk, radius):
+    stop_ids, names, stop_lat, stop_lon = stops
+    ids, lats, lons = chunk
+    point_lat = np.radians(np.asarray(lats, dtype=np.float64))
+    point_lon = np.radians(np.asarray(lons, dtype=np.float64))
+
+    distances = haversine_matrix(point_lat, point_lon, stop_lat, stop_lon)
+    nearest = np.argmin(distances, axis=1)
+    nearest_miles = distances[np.arange(len(ids)), nearest]
+
+    within = distances <= radius
+    within_counts = within.sum(axis=1)
+    point_rows, stop_cols = np.nonzero(within)
+    # Stops within the radius, nearest first for each point
+    order = np.lexsort((distances[point_rows, stop_cols], point_rows))
+    point_rows, stop_cols = point_rows[order], stop_cols[order]
+
+    nearest_rows = [
+        (ids[i], lats[i], lons[i], int(stop_ids[nearest[i]]), names[nearest[i]], round(float(nearest_miles[i]), 4), int(within_counts[i]))
+        for i in range(len(ids))
+    ]
+    within_rows = [
+        (ids[i], int(stop_ids[j]), names[j], round(float(distances[i, j]), 4))
+        for i, j in zip(point_rows.tolist(), stop_cols.tolist())
+    ]
+    return nearest_rows, within_rows
+
+
+# Each worker process loads the stop arrays once in its initializer
+_worker_stops = None
+
+
+def _init_worker(stops):
+    global _worker_stops
+    _worker_stops = stops
+
+
+def _worker_process_chunk(chunk, radius):
+    return process_chunk(_worker_stops, chunk, radius)
+
+
+class CsvOutput:
+    def __init__(self, path, fields):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(fields)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetOutput:
+    # One row group per chunk, so memory stays bounded by the chunk size
+    def __init__(self, path, fields):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing Parquet files requires pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.fields = fields
+        self.writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = {field: [row[i] for row in rows] for i, field in enumerate(self.fields)}
+        # Point ids may be numbers or strings depending on the input file
+        if 'point_id' in columns:
+            columns['point_id'] = [str(value) for value in columns['point_id']]
+        table = self.pa.table(columns)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_output(path, fields):
+    if path is None:
+        return None
+    if path.lower().endswith('.parquet'):
+        return ParquetOutput(path, fields)
+    return CsvOutput(path, fields)
+
+
+def run_batch(stops, input_path, output_path, within_path=None, radius=1.0, chunk_size=CHUNK_SIZE, workers=1):
+    nearest_out = open_output(output_path, NEAREST_FIELDS)
+    within_out = open_output(within_path, WITHIN_FIELDS)
+    total = 0
+
+    def write(result):
+        nearest_rows, within_rows = result
+        nearest_out.write(nearest_rows)
+        if within_out is not None:
+            within_out.write(within_rows)
+        return len(nearest_rows)
+
+    try:
+        chunks = iter_point_chunks(input_path, chunk_size)
+        if workers <= 1:
+            for chunk in chunks:
+                total += write(process_chunk(stops, chunk, radius))
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(stops,)) as pool:
+                # At most two chunks per worker are in flight, which bounds memory and keeps order
+                pending = collections.deque()
+                for chunk in chunks:
+                    pending.append(pool.apply_async(_worker_process_chunk, (chunk, radius)))
+                    if len(pending) >= workers * 2:
+                        total += write(pending.popleft().get())
+                while pending:
+                    total += write(pending.popleft().get())
+    finally:
+        nearest_out.close()
+        if within_out is not None:
+            within_out.close()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nearest CTA stop and stops within a radius for a file of points")
+    parser.add_argument('input', help="CSV with latitude/longitude columns (and optional id), or - for stdin")
+    parser.add_argument('output', help="nearest-stop output, .csv or .parquet")
+    parser.add_argument('--within-output', help="optional long-format output of every stop within the radius")
+    parser.add_argument('--radius', type=float, default=1.0, help="radius in miles (default: 1)")
+    parser.add_argument('--db', default='cta_database.db', help="database file (default: cta_database.db)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="points processed per chunk")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes (default: 1)")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        stops = load_stops(conn.cursor())
+    finally:
+        conn.close()
+    if len(stops[0]) == 0:
+        parser.error("No stops with coordinates in the database")
+
+    total = run_batch(stops, args.input, args.output, args.within_output, args.radius, args.chunk_size, args.workers)
+    print(f"Processed {total:,} points against {len(stops[0]):,} stops")
+
+
+if __name__ == "__main__":
+    main()
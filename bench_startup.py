@@ -0,0 +1,60 @@
+# Cold-start guard for the CLI: imports cta_database in fresh interpreters and fails when the
+# median import time exceeds the budget or when matplotlib gets pulled in at startup.
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# Seconds for a fresh interpreter to import cta_database, interpreter startup included
+DEFAULT_BUDGET = 0.25
+
+PROBE = (
+    "import sys, time; start = time.perf_counter(); import cta_database; "
+    "print(time.perf_counter() - start, 'matplotlib' in sys.modules)"
+)
+
+
+def measure(runs):
+    import_times = []
+    total_times = []
+    loaded_matplotlib = False
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, check=True)
+        import_time, matplotlib_loaded = result.stdout.split()
+        import_times.append(float(import_time))
+        loaded_matplotlib = loaded_matplotlib or matplotlib_loaded == 'True'
+
+    # Whole process lifetime, interpreter startup included
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import cta_database'], check=True)
+        total_times.append(time.perf_counter() - start)
+    return import_times, total_times, loaded_matplotlib
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the CLI cold-start time budget")
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters to measure (default: 5)")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help=f"seconds allowed (default: {DEFAULT_BUDGET})")
+    args = parser.parse_args(argv)
+
+    import_times, total_times, loaded_matplotlib = measure(args.runs)
+    import_median = statistics.median(import_times)
+    total_median = statistics.median(total_times)
+    print(f"import cta_database: median {import_median * 1000:.1f} ms over {args.runs} runs")
+    print(f"interpreter + import: median {total_median * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+
+    failed = False
+    if loaded_matplotlib:
+        print("FAIL: matplotlib is imported at startup")
+        failed = True
+    if total_median > args.budget:
+        print("FAIL: cold start is over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
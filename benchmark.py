@@ -0,0 +1,214 @@
+# Latency benchmark for the nine analyses.
+#
+# Each analysis is timed cold (fresh connection, so an empty SQLite page cache and no stop index)
+# and warm (repeated on one connection), without the query cache. p50/p95 and the process's peak
+# RSS are reported and can be saved as a baseline; later runs fail loudly when an analysis gets
+# slower than the baseline by more than the allowed ratio. A baseline is only compared against
+# runs of the same backend on the same number of ridership rows.
+#
+#   python generate_dataset.py --db cta_database_bench.db
+#   python benchmark.py --db cta_database_bench.db --save-baseline
+#   python benchmark.py --db cta_database_bench.db            # exits 1 on a regression, 2 on a mismatched baseline
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from create_cta_database import SchemaError
+from cta_analytics import CTAAnalytics, connect_db
+from load_ridership import peak_memory_mb
+
+DEFAULT_BASELINE = 'bench_baseline.json'
+# A regression is a p50 above baseline * ratio; differences under the slack are timer noise
+DEFAULT_RATIO = 1.5
+SLACK_MS = 0.5
+
+
+def pick_parameters(analytics):
+    # Benchmark against the busiest station and the most recent full year in the database
+    cursor = analytics.conn.cursor()
+    try:
+        busiest = cursor.execute("""
+            SELECT s.Station_ID, s.Station_Name
+            FROM StationStats st JOIN Stations s ON s.Station_ID = st.Station_ID
+            ORDER BY st.Num_Entries DESC, s.Station_ID
+            LIMIT 2
+        """).fetchall()
+        last_date = cursor.execute("SELECT MAX(Last_Date) FROM StationStats").fetchone()[0]
+        color = cursor.execute("SELECT Color FROM Lines ORDER BY Line_ID LIMIT 1").fetchone()
+        location = cursor.execute("SELECT AVG(Latitude), AVG(Longitude) FROM Stops").fetchone()
+    finally:
+        cursor.close()
+
+    if not busiest or last_date is None:
+        raise SystemExit("The database has no ridership to benchmark")
+    (station_id, station_name) = busiest[0]
+    (other_id, _) = busiest[-1]
+    return {
+        'station_id': station_id,
+        'station_name': station_name,
+        'other_id': other_id,
+        'year': int(last_date[:4]) - 1 if int(last_date[:4]) > 1 else int(last_date[:4]),
+        'color': color[0] if color else 'Red',
+        'latitude': location[0] or 41.8781,
+        'longitude': location[1] or -87.6298,
+    }
+
+
+def dataset_rows(analytics):
+    # Ridership rows behind the timings, archived years included
+    cursor = analytics.conn.cursor()
+    try:
+        return cursor.execute("SELECT COALESCE(SUM(Num_Entries), 0) FROM StationStats").fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def analyses(p):
+    # (name, function(analytics)) for the nine CLI commands
+    return [
+        ('1 find_stations', lambda a: a.find_stations(f"%{p['station_name'][:4]}%")),
+        ('2 ridership_percentages', lambda a: a.ridership_percentages(p['station_name'])),
+        ('3 weekday_ridership', lambda a: a.weekday_ridership()),
+        ('4 stops_by_line_color', lambda a: a.stops_by_line_color(p['color'], 'N')),
+        ('5 stops_count_by_color', lambda a: a.stops_count_by_color()),
+        ('6 yearly_ridership', lambda a: a.yearly_ridership(p['station_name'])),
+        ('7 monthly_ridership', lambda a: (a.match_stations(p['station_name']), a.monthly_ridership(p['station_id'], p['year']))),
+        ('8 daily_ridership_comparison', lambda a: (a.daily_ridership(p['station_id'], p['year']), a.daily_ridership(p['other_id'], p['year']))),
+        ('9 stations_within_mile', lambda a: a.stations_within(p['latitude'], p['longitude'], 1)),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {'p50_ms': percentile(samples, 0.50) * 1000, 'p95_ms': percentile(samples, 0.95) * 1000}
+
+
+def backend_class(name):
+    if name == 'columnar':
+        from columnar import ColumnarAnalytics
+        return ColumnarAnalytics
+    return CTAAnalytics
+
+
+def run_benchmarks(path, runs, backend='sqlite'):
+    # Fails up front on an outdated schema instead of in the first timed run
+    connect_db(path).close()
+
+    analytics_class = backend_class(backend)
+    warm = analytics_class.open(path)
+    parameters = pick_parameters(warm)
+    rows = dataset_rows(warm)
+    results = {}
+    for name, func in analyses(parameters):
+        cold_samples = []
+        for _ in range(runs):
+            analytics = analytics_class.open(path)
+            start = time.perf_counter()
+            func(analytics)
+            cold_samples.append(time.perf_counter() - start)
+            analytics.close()
+
+        func(warm)
+        warm_samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            func(warm)
+            warm_samples.append(time.perf_counter() - start)
+
+        results[name] = {'cold': summarize(cold_samples), 'warm': summarize(warm_samples)}
+    warm.close()
+    return parameters, results, rows
+
+
+def baseline_mismatches(report, baseline):
+    # Why the baseline's timings do not apply to this run, if they don't
+    mismatches = []
+    for key, label in (('backend', 'backend'), ('rows', 'ridership rows')):
+        if baseline.get(key) != report[key]:
+            mismatches.append(f"{label}: {report[key]} vs baseline {baseline.get(key, 'not recorded')}")
+    return mismatches
+
+
+def compare(results, baseline, ratio):
+    regressions = []
+    for name, result in results.items():
+        for mode in ('cold', 'warm'):
+            before = baseline.get('results', {}).get(name, {}).get(mode)
+            if not before:
+                continue
+            now_ms = result[mode]['p50_ms']
+            limit_ms = before['p50_ms'] * ratio
+            if now_ms > limit_ms and now_ms - before['p50_ms'] > SLACK_MS:
+                regressions.append(f"{name} ({mode}): p50 {now_ms:.2f} ms vs baseline {before['p50_ms']:.2f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the nine analyses cold and warm")
+    parser.add_argument('--db', default='cta_database_bench.db', help="database to benchmark (see generate_dataset.py)")
+    parser.add_argument('--runs', type=int, default=20, help="timed runs per analysis and mode (default: 20)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help=f"baseline file (default: {DEFAULT_BASELINE})")
+    parser.add_argument('--backend', choices=['sqlite', 'columnar'], default='sqlite',
+                        help="query backend to benchmark; columnar cold runs include loading the arrays")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run as the new baseline")
+    parser.add_argument('--ratio', type=float, default=DEFAULT_RATIO, help=f"allowed slowdown vs baseline (default: {DEFAULT_RATIO})")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"No such database: {args.db} (create one with generate_dataset.py)")
+
+    try:
+        parameters, results, rows = run_benchmarks(args.db, args.runs, args.backend)
+    except SchemaError as e:
+        sys.exit(str(e))
+
+    print(f"{'analysis':<32}{'cold p50':>10}{'cold p95':>10}{'warm p50':>10}{'warm p95':>10}  (ms)")
+    for name, result in results.items():
+        print(f"{name:<32}{result['cold']['p50_ms']:>10.2f}{result['cold']['p95_ms']:>10.2f}"
+              f"{result['warm']['p50_ms']:>10.2f}{result['warm']['p95_ms']:>10.2f}")
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"Peak RSS: {peak:,.1f} MB")
+
+    report = {'db': os.path.abspath(args.db), 'backend': args.backend, 'rows': rows, 'runs': args.runs,
+              'parameters': parameters, 'results': results, 'peak_rss_mb': peak}
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    mismatches = baseline_mismatches(report, baseline)
+    if mismatches:
+        print(f"Baseline {args.baseline} was recorded on a different setup; not comparing:")
+        for line in mismatches:
+            print(f"  {line}")
+        print("Run with --save-baseline to replace it")
+        sys.exit(2)
+    if baseline.get('db') != report['db']:
+        print(f"Warning: baseline was recorded on {baseline.get('db')}, this run used {report['db']}")
+    regressions = compare(results, baseline, args.ratio)
+    if regressions:
+        print("REGRESSION:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"No regressions against {args.baseline} (ratio {args.ratio})")
+
+
+if __name__ == "__main__":
+    main()
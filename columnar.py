@@ -0,0 +1,247 @@
+# Columnar in-memory backend for CTAAnalytics.
+#
+# ColumnarAnalytics loads Ridership once into four NumPy arrays (int16 station index, int32 day
+# number since 1970-01-01, int32 riders, uint8 day type) sorted by station then date, and answers
+# the ridership analyses with vectorized group-bys instead of SQL. Everything else (stops, lines,
+# station names, proximity) is inherited from CTAAnalytics. The arrays are reloaded whenever the
+# data version changes. Select it with `python cta_database.py --backend columnar`.
+#
+# ColumnarAnalytics.open() keeps the arrays in a snapshot file next to the database, so later
+# starts memory-map them instead of reading Ridership row by row.
+
+import numpy as np
+
+from cta_analytics import (
+    DB_PATH, CTAAnalytics, DailyRow, DayTotal, MonthTotal, Statistics, StationShare, YearTotal, connect_db,
+)
+from partitions import PartitionRouter
+from query_cache import cached
+from snapshot import fingerprint, load_snapshot, snapshot_file, write_snapshot
+
+# Type_of_Day codes, in the order SQL's GROUP BY Type_of_Day returns them
+DAY_TYPES = ['A', 'U', 'W']
+
+# Three integers per row (day type packed into the low bits of riders) in table order: fetching
+# Python objects is the cost of a load, and sorting in NumPy is cheaper than ORDER BY. Run once
+# per partitions.PartitionRouter scan
+COLUMNS_SQL = """
+    SELECT Station_ID,
+           CAST(julianday(Ride_Date) - 2440587.5 AS INTEGER),
+           IFNULL(Num_Riders, 0) * 4 + CASE Type_of_Day WHEN 'A' THEN 0 WHEN 'U' THEN 1 ELSE 2 END
+    FROM {ridership}
+    WHERE Ride_Date >= ? AND Ride_Date < ?
+"""
+
+ROW_DTYPE = np.dtype([('station', np.int64), ('day', np.int64), ('packed', np.int64)])
+
+
+def day_numbers(start_date, end_date):
+    return int(np.datetime64(start_date, 'D').astype(np.int64)), int(np.datetime64(end_date, 'D').astype(np.int64))
+
+
+def day_strings(days):
+    return np.datetime_as_string(days.astype('datetime64[D]')).tolist()
+
+
+class RidershipColumns:
+    def __init__(self, ids, station, day, riders, day_type, starts, first_day, last_day, version=None):
+        # Arrays already sorted by station index then day; see from_rows(). They may be read-only
+        # views of a memory-mapped snapshot (snapshot.py)
+        self.version = version
+        self.ids = ids
+        self.station = station
+        self.day = day
+        self.riders = riders
+        self.day_type = day_type
+        # Row range [starts[i], starts[i + 1]) per station index; rows are sorted by date within it
+        self.starts = starts
+        self.first_day = first_day
+        self.last_day = last_day
+
+    @classmethod
+    def from_rows(cls, station_ids, days, riders, day_types, version=None):
+        # Row-aligned arrays in any order: Station_ID, day number, riders, day type code
+        order = np.lexsort((days, station_ids))
+        ids, station_index = np.unique(station_ids[order], return_inverse=True)
+        station = station_index.astype(np.int16)
+        day = days[order].astype(np.int32)
+        starts = np.searchsorted(station, np.arange(len(ids) + 1)).astype(np.int64)
+        first_day = int(day.min()) if len(day) else None
+        last_day = int(day.max()) if len(day) else None
+        return cls(ids.astype(np.int64), station, day, riders[order].astype(np.int32), day_types[order].astype(np.uint8),
+                   starts, first_day, last_day, version)
+
+    @classmethod
+    def from_cursor(cls, cursor, version=None, router=None):
+        # Whole history, archived partitions included
+        if router is None:
+            router = PartitionRouter.from_connection(cursor.connection)
+        parts = []
+        for table, start_date, end_date in router.scans():
+            cursor.execute(COLUMNS_SQL.format(ridership=table), (start_date, end_date))
+            parts.append(np.fromiter(cursor, dtype=ROW_DTYPE))
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=ROW_DTYPE)
+        return cls.from_rows(rows['station'], rows['day'], rows['packed'] >> 2, rows['packed'] & 3, version)
+
+    def __len__(self):
+        return len(self.day)
+
+    def rows_for(self, station_id):
+        # Slice of rows for one Station_ID (empty when it has no ridership)
+        idx = np.searchsorted(self.ids, station_id)
+        if idx == len(self.ids) or self.ids[idx] != station_id:
+            return slice(0, 0)
+        return slice(self.starts[idx], self.starts[idx + 1])
+
+    def rows_between(self, station_id, start_day, end_day):
+        # Slice of one station's rows with start_day <= day < end_day
+        rows = self.rows_for(station_id)
+        days = self.day[rows]
+        return slice(rows.start + np.searchsorted(days, start_day), rows.start + np.searchsorted(days, end_day))
+
+
+class ColumnarAnalytics(CTAAnalytics):
+    # snapshot_path: optional snapshot file (see snapshot.py) memory-mapped instead of reading
+    # Ridership, and rewritten whenever it no longer matches the database
+    def __init__(self, conn, cache=None, snapshot_path=None):
+        super().__init__(conn, cache)
+        self.snapshot_path = snapshot_path
+        self._columns = None
+
+    @classmethod
+    def open(cls, path=DB_PATH, cache=None, snapshot=True, cached_statements=128, migrate=False):
+        return cls(connect_db(path, cached_statements, migrate), cache, snapshot_file(path) if snapshot else None)
+
+    @property
+    def columns(self):
+        version = self.data_version()
+        if self._columns is None or self._columns.version != version:
+            cursor = self.conn.cursor()
+            try:
+                self._columns = self._load_columns(cursor, version)
+            finally:
+                cursor.close()
+        return self._columns
+
+    def _load_columns(self, cursor, version):
+        if self.snapshot_path is None:
+            return RidershipColumns.from_cursor(cursor, version, self.partitions)
+
+        current = fingerprint(cursor)
+        arrays = load_snapshot(self.snapshot_path, current)
+        if arrays is not None:
+            return RidershipColumns(**arrays, version=version)
+
+        columns = RidershipColumns.from_cursor(cursor, version, self.partitions)
+        try:
+            write_snapshot(self.snapshot_path, columns, current)
+        except OSError:
+            pass  # A read-only location only costs the next start another full load
+        return columns
+
+    def _station_rows(self, station_ids):
+        # Row indexes of every given station, concatenated
+        columns = self.columns
+        slices = [columns.rows_for(station_id) for station_id in sorted(set(station_ids))]
+        return np.concatenate([np.arange(rows.start, rows.stop) for rows in slices]) if slices else np.array([], dtype=np.int64)
+
+    def daily_columns(self, station_ids, start_date, end_date):
+        columns = self.columns
+        start_day, end_day = day_numbers(start_date, end_date)
+        if station_ids is None:
+            station_ids = columns.ids.tolist()
+        slices = [columns.rows_between(station_id, start_day, end_day) for station_id in sorted(set(station_ids))]
+        rows = np.concatenate([np.arange(rows.start, rows.stop) for rows in slices]) if slices else np.array([], dtype=np.int64)
+        return columns.ids[columns.station[rows]], columns.day[rows].astype(np.int64), columns.riders[rows], columns.day_type[rows]
+
+    @cached
+    def statistics(self):
+        columns = self.columns
+        if not len(columns):
+            return Statistics(0, 0, None, None)
+        first, last = day_strings(np.array([columns.first_day, columns.last_day]))
+        return Statistics(len(columns.ids), len(columns), first, last)
+
+    def _day_type_totals(self, station_ids):
+        columns = self.columns
+        rows = self._station_rows(station_ids)
+        totals = np.bincount(columns.day_type[rows], weights=columns.riders[rows], minlength=len(DAY_TYPES))
+        present = np.bincount(columns.day_type[rows], minlength=len(DAY_TYPES)) > 0
+        return [(int(totals[code]), day_type) for code, day_type in enumerate(DAY_TYPES) if present[code]]
+
+    @cached
+    def weekday_ridership(self):
+        columns = self.columns
+        if not len(columns):
+            return []
+        # Rows are grouped by station, so one reduceat over the station boundaries is the group-by
+        weekday = columns.day_type == DAY_TYPES.index('W')
+        totals = np.add.reduceat(np.where(weekday, columns.riders, 0), columns.starts[:-1], dtype=np.int64)
+        present = np.logical_or.reduceat(weekday, columns.starts[:-1])
+
+        # Grouped by name like the SQL version: stations sharing a name are added together
+        names = {station_id: name for station_id, name, _ in self.station_catalog.stations}
+        by_name = {}
+        for idx in np.flatnonzero(present):
+            name = names.get(int(columns.ids[idx]))
+            if name is not None:
+                by_name[name] = by_name.get(name, 0) + int(totals[idx])
+        results = sorted(by_name.items(), key=lambda item: (-item[1], item[0]))
+
+        total_weekday_riders = sum(count for _, count in results)
+        return [
+            StationShare(station_name, count, (count / total_weekday_riders) * 100 if total_weekday_riders > 0 else 0)
+            for station_name, count in results
+        ]
+
+    def _yearly_totals(self, station_ids):
+        columns = self.columns
+        rows = self._station_rows(station_ids)
+        if not len(rows):
+            return []
+        years = columns.day[rows].astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+        first = years.min()
+        totals = np.bincount(years - first, weights=columns.riders[rows])
+        present = np.bincount(years - first) > 0
+        return [YearTotal(int(first + offset), int(totals[offset])) for offset in np.flatnonzero(present)]
+
+    @cached
+    def monthly_ridership(self, station_id, year):
+        columns = self.columns
+        start_date = f"{int(year):04d}-01-01"
+        end_date = f"{int(year) + 1:04d}-01-01"
+        rows = columns.rows_between(station_id, *day_numbers(start_date, end_date))
+        months = columns.day[rows].astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12
+        totals = np.bincount(months, weights=columns.riders[rows], minlength=12)
+        return [MonthTotal(month, int(totals[month - 1])) for month in range(1, 13)]
+
+    @cached
+    def daily_ridership(self, station_id, year):
+        columns = self.columns
+        start_date = f"{int(year):04d}-01-01"
+        end_date = f"{int(year) + 1:04d}-01-01"
+        rows = columns.rows_between(station_id, *day_numbers(start_date, end_date))
+        return [DayTotal(ride_date, int(riders)) for ride_date, riders in zip(day_strings(columns.day[rows]), columns.riders[rows])]
+
+    def iter_daily_ridership(self, station_ids, start_date, end_date, batch_size=None):
+        # Same rows as the SQL version: every date at least one station has data for, in order
+        station_ids = list(station_ids)
+        if not station_ids:
+            return
+        columns = self.columns
+        start_day, end_day = day_numbers(start_date, end_date)
+        per_station = []
+        for station_id in station_ids:
+            rows = columns.rows_between(station_id, start_day, end_day)
+            per_station.append((columns.day[rows], columns.riders[rows]))
+
+        days = np.unique(np.concatenate([days for days, _ in per_station]))
+        matrix = np.zeros((len(days), len(station_ids)), dtype=np.int64)
+        present = np.zeros((len(days), len(station_ids)), dtype=bool)
+        for idx, (station_days, riders) in enumerate(per_station):
+            positions = np.searchsorted(days, station_days)
+            matrix[positions, idx] = riders
+            present[positions, idx] = True
+
+        for ride_date, values, flags in zip(day_strings(days), matrix.tolist(), present.tolist()):
+            yield DailyRow(ride_date, tuple(value if flag else None for value, flag in zip(values, flags)))
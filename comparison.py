@@ -0,0 +1,86 @@
+# Dense date x station ridership matrices for comparing many stations at once.
+#
+# StationMatrix.load() needs two statements whatever the number of stations: one resolves every
+# station pattern and one scans the requested date range for all stations (the pivoted
+# daily_comparison_sql). Values live in a float64 NumPy array with NaN where a station has no
+# row for a day, so correlations, deltas and percent changes are vectorized over all stations.
+
+import csv
+import datetime
+
+import numpy as np
+
+
+class StationMatrix:
+    def __init__(self, stations, dates, values):
+        self.stations = stations    # list of cta_analytics.Station, one per column
+        self.dates = dates          # datetime64[D] array, one per row, every day in the range
+        self.values = values        # float64 array (len(dates), len(stations)), NaN = no data
+
+    @classmethod
+    def load(cls, analytics, stations, start_date, end_date):
+        # stations: list of Station; start_date/end_date: ISO dates, end exclusive
+        start = np.datetime64(start_date, 'D')
+        end = np.datetime64(end_date, 'D')
+        dates = np.arange(start, end, dtype='datetime64[D]')
+        values = np.full((len(dates), len(stations)), np.nan)
+
+        station_ids = [station.station_id for station in stations]
+        for row in analytics.iter_daily_ridership(station_ids, start_date, end_date):
+            offset = (datetime.date.fromisoformat(row.ride_date) - datetime.date.fromisoformat(start_date)).days
+            values[offset] = [np.nan if riders is None else riders for riders in row.riders]
+        return cls(stations, dates, values)
+
+    @property
+    def names(self):
+        return [station.name for station in self.stations]
+
+    def totals(self):
+        return np.nansum(self.values, axis=0)
+
+    def daily_means(self):
+        # Mean over days that have data; all-NaN columns give NaN
+        with np.errstate(invalid='ignore'):
+            counts = np.sum(~np.isnan(self.values), axis=0)
+            return np.where(counts > 0, np.nansum(self.values, axis=0) / np.maximum(counts, 1), np.nan)
+
+    def correlation(self):
+        # Pearson correlation between every pair of stations over the days both have data
+        n = len(self.stations)
+        present = ~np.isnan(self.values)
+        if present.all() and len(self.dates) > 1 and (self.values.std(axis=0) > 0).all():
+            # Dense case: one vectorized call for every pair
+            return np.atleast_2d(np.corrcoef(self.values, rowvar=False))
+
+        result = np.full((n, n), np.nan)
+        for i in range(n):
+            for j in range(i, n):
+                both = present[:, i] & present[:, j]
+                if both.sum() < 2:
+                    continue
+                x = self.values[both, i]
+                y = self.values[both, j]
+                if x.std() == 0 or y.std() == 0:
+                    continue
+                result[i, j] = result[j, i] = np.corrcoef(x, y)[0, 1]
+        return result
+
+    def deltas(self, base=0):
+        # Each station's daily riders minus the base station's
+        return self.values - self.values[:, [base]]
+
+    def pct_change(self, periods=1):
+        # Day-over-day (or periods-over-periods) percent change per station
+        result = np.full_like(self.values, np.nan)
+        if periods < len(self.dates):
+            previous = self.values[:-periods]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result[periods:] = np.where(previous != 0, (self.values[periods:] - previous) / previous * 100, np.nan)
+        return result
+
+    def write_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Ride_Date', *self.names])
+            for date, row in zip(self.dates.astype(str), self.values):
+                writer.writerow([date, *('' if np.isnan(value) else int(value) for value in row)])
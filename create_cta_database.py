@@ -1,142 +1,446 @@
-import sqlite3
-import math
-
-def create_database():
-    # Connect to the SQLite database (this will create the database file)
-    conn = sqlite3.connect('cta_database.db')
-    cursor = conn.cursor()
-
-    # Create tables
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS Stations (
-        Station_ID INTEGER PRIMARY KEY,
-        Station_Name TEXT NOT NULL UNIQUE
-    );
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS Stops (
-        Stop_ID INTEGER PRIMARY KEY,
-        Station_ID INTEGER,
-        Stop_Name TEXT NOT NULL,
-        Direction TEXT NOT NULL CHECK(Direction IN ('N', 'E', 'S', 'W')),
-        ADA INTEGER CHECK(ADA IN (0, 1)),
-        Latitude REAL,
-        Longitude REAL,
-        FOREIGN KEY (Station_ID) REFERENCES Stations(Station_ID)
-    );
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS Lines (
-        Line_ID INTEGER PRIMARY KEY,
-        Color TEXT NOT NULL UNIQUE
-    );
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS StopDetails (
-        StopDetail_ID INTEGER PRIMARY KEY,
-        Stop_ID INTEGER,
-        Line_ID INTEGER,
-        FOREIGN KEY (Stop_ID) REFERENCES Stops(Stop_ID),
-        FOREIGN KEY (Line_ID) REFERENCES Lines(Line_ID),
-        UNIQUE (Stop_ID, Line_ID)
-    );
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS Ridership (
-        Ride_ID INTEGER PRIMARY KEY,
-        Station_ID INTEGER,
-        Ride_Date TEXT,
-        Num_Riders INTEGER,
-        Type_of_Day TEXT CHECK(Type_of_Day IN ('W', 'A', 'U')),
-        FOREIGN KEY (Station_ID) REFERENCES Stations(Station_ID)
-    );
-    ''')
-
-    # Insert sample data into Stations
-    stations = [
-        ('UIC-Halsted',),
-        ('Clark/Lake',),
-        ('Sheridan',),
-        ('Union Station',)
-    ]
-    
-    cursor.executemany("INSERT OR IGNORE INTO Stations (Station_Name) VALUES (?)", stations)
-
-    # Insert sample data into Stops
-    stops = [
-        (1, 'Stop 1', 'N', 1, 41.8721, -87.6505),
-        (1, 'Stop 2', 'S', 0, 41.8722, -87.6506),
-        (2, 'Stop 3', 'E', 1, 41.8839, -87.6322),
-        (2, 'Stop 4', 'W', 0, 41.8840, -87.6323),
-        (3, 'Stop 5', 'N', 1, 41.9470, -87.6550),
-        (4, 'Stop 6', 'E', 1, 41.8795, -87.6320)
-    ]
-    
-    cursor.executemany("INSERT OR IGNORE INTO Stops (Station_ID, Stop_Name, Direction, ADA, Latitude, Longitude) VALUES (?, ?, ?, ?, ?, ?)", stops)
-
-    # Insert sample data into Lines
-    lines = [
-        ('Red',),
-        ('Blue',),
-        ('Yellow',)
-    ]
-    
-    cursor.executemany("INSERT OR IGNORE INTO Lines (Color) VALUES (?)", lines)
-
-    # Insert sample data into StopDetails
-    stop_details = [
-        (1, 1), 
-        (2, 1), 
-        (3, 2), 
-        (4, 3), 
-        (5, 2), 
-        (6, 1)
-    ]
-    
-    cursor.executemany("INSERT OR IGNORE INTO StopDetails (Stop_ID, Line_ID) VALUES (?, ?)", stop_details)
-
-    # Insert sample data into Ridership
-    ridership_data = [
-        (1, '2021-01-01', 1143302, 'W'),
-        (1, '2021-01-02', 1350077, 'W'),
-        (1, '2021-01-03', 1398751, 'W'),
-        (1, '2021-01-04', 1364987, 'W'),
-        (1, '2021-01-05', 1414985, 'W'),
-        (1, '2021-01-06', 1417008, 'W'),
-        (1, '2021-01-07', 1286209, 'W'),
-        (1, '2021-01-08', 1406969, 'W'),
-        (1, '2021-01-09', 1340464, 'W'),
-        (1, '2021-01-10', 1461571, 'W'),
-        (1, '2021-01-11', 1653511, 'W'),
-        (1, '2021-01-12', 1726553, 'W'),
-        (1, '2021-01-13', 1715302, 'W'),
-        (1, '2021-01-14', 1695108, 'W'),
-        (1, '2021-01-15', 1676810, 'W'),
-        (1, '2021-01-16', 1725557, 'W'),
-        (1, '2021-01-17', 1702964, 'W'),
-        (1, '2021-01-18', 1722221, 'W'),
-        (1, '2021-01-19', 1729039, 'W'),
-        (1, '2021-01-20', 524093, 'W'),
-        (1, '2021-01-21', 157614, 'W'),
-        (1, '2022-01-01', 1650000, 'W'),  # Example year 2022
-        (1, '2022-01-02', 1500000, 'W'),  # Example year 2022
-        (1, '2022-01-03', 1600000, 'W'),  # Example year 2022
-        (2, '2021-01-01', 800, 'W'),      # Additional station
-        (3, '2021-01-02', 600, 'W'),      # Additional station
-        (2, '2021-01-03', 1200, 'W')       # Additional station
-    ]
-    
-    cursor.executemany("INSERT OR IGNORE INTO Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day) VALUES (?, ?, ?, ?)", ridership_data)
-
-    # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
-
-
-if __name__ == "__main__":
-    create_database()
-
+import argparse
+import sqlite3
+import math
+import os
+import sys
+import time
+
+from rollups import create_rollup_tables, create_rollup_triggers, drop_rollup_triggers, rebuild_rollups
+from sketches import create_sketch_tables
+
+# Conflicting (Station_ID, Ride_Date) keys listed in a DuplicateRidershipError
+MAX_REPORTED_DUPLICATES = 20
+
+
+class DuplicateRidershipError(Exception):
+    # Ridership has several rows for one (station, day), so the natural key cannot be enforced
+    def __init__(self, num_keys, examples):
+        listed = ', '.join(f"({station_id}, {ride_date}) x{count}" for station_id, ride_date, count in examples)
+        more = f" and {num_keys - len(examples)} more" if num_keys > len(examples) else ""
+        super().__init__(
+            f"Ridership has {num_keys} (Station_ID, Ride_Date) keys with more than one row: {listed}{more}. "
+            "Nothing was changed; fix them, or run python create_cta_database.py --migrate DB --merge-duplicates "
+            "to add each key's rows into one (Num_Riders summed)")
+        self.num_keys = num_keys
+        self.examples = examples
+
+def create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Stations (
+        Station_ID INTEGER PRIMARY KEY,
+        Station_Name TEXT NOT NULL UNIQUE
+    );
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Stops (
+        Stop_ID INTEGER PRIMARY KEY,
+        Station_ID INTEGER,
+        Stop_Name TEXT NOT NULL,
+        Direction TEXT NOT NULL CHECK(Direction IN ('N', 'E', 'S', 'W')),
+        ADA INTEGER CHECK(ADA IN (0, 1)),
+        Latitude REAL,
+        Longitude REAL,
+        FOREIGN KEY (Station_ID) REFERENCES Stations(Station_ID)
+    );
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Lines (
+        Line_ID INTEGER PRIMARY KEY,
+        Color TEXT NOT NULL UNIQUE
+    );
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS StopDetails (
+        StopDetail_ID INTEGER PRIMARY KEY,
+        Stop_ID INTEGER,
+        Line_ID INTEGER,
+        FOREIGN KEY (Stop_ID) REFERENCES Stops(Stop_ID),
+        FOREIGN KEY (Line_ID) REFERENCES Lines(Line_ID),
+        UNIQUE (Stop_ID, Line_ID)
+    );
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Ridership (
+        Ride_ID INTEGER PRIMARY KEY,
+        Station_ID INTEGER,
+        Ride_Date TEXT,
+        Num_Riders INTEGER,
+        Type_of_Day TEXT CHECK(Type_of_Day IN ('W', 'A', 'U')),
+        FOREIGN KEY (Station_ID) REFERENCES Stations(Station_ID)
+    );
+    ''')
+
+def update_load_state(cursor):
+    # Recompute every station's high-water mark from the loaded rows
+    cursor.execute('''
+    INSERT OR REPLACE INTO LoadState (Station_ID, Last_Ride_Date)
+    SELECT Station_ID, MAX(Ride_Date) FROM Ridership GROUP BY Station_ID;
+    ''')
+
+class SchemaError(Exception):
+    # The database predates the current schema; code that only reads never migrates it
+    pass
+
+def duplicate_ridership(cursor):
+    # (number of repeated (Station_ID, Ride_Date) keys, the first few as (station, date, rows))
+    num_keys = cursor.execute('''
+    SELECT COUNT(*) FROM (SELECT 1 FROM Ridership GROUP BY Station_ID, Ride_Date HAVING COUNT(*) > 1);
+    ''').fetchone()[0]
+    examples = cursor.execute('''
+    SELECT Station_ID, Ride_Date, COUNT(*) FROM Ridership
+    GROUP BY Station_ID, Ride_Date HAVING COUNT(*) > 1
+    ORDER BY Station_ID, Ride_Date LIMIT ?;
+    ''', (MAX_REPORTED_DUPLICATES,)).fetchall()
+    return num_keys, examples
+
+def merge_duplicate_ridership(cursor):
+    # Explicit, opt-in rule (--merge-duplicates): the rows of a repeated (station, day) are added
+    # into the latest of them, keeping its day type, so every ridership total stays the same.
+    # Returns the number of rows merged away
+    cursor.execute('''
+    UPDATE Ridership
+    SET Num_Riders = (SELECT SUM(d.Num_Riders) FROM Ridership d
+                      WHERE d.Station_ID = Ridership.Station_ID AND d.Ride_Date = Ridership.Ride_Date)
+    WHERE Ride_ID IN (SELECT MAX(Ride_ID) FROM Ridership GROUP BY Station_ID, Ride_Date HAVING COUNT(*) > 1);
+    ''')
+    cursor.execute('''
+    DELETE FROM Ridership
+    WHERE Ride_ID NOT IN (SELECT MAX(Ride_ID) FROM Ridership GROUP BY Station_ID, Ride_Date);
+    ''')
+    return cursor.rowcount
+
+def migrate_to_v1(cursor):
+    # The natural key can only be enforced once every (station, day) has one row; repeated rows
+    # are never dropped here, see merge_duplicate_ridership()
+    num_keys, examples = duplicate_ridership(cursor)
+    if num_keys:
+        raise DuplicateRidershipError(num_keys, examples)
+
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_ridership_station_date ON Ridership (Station_ID, Ride_Date);
+    ''')
+
+    # Per-station high-water mark used by the incremental loader
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS LoadState (
+        Station_ID INTEGER PRIMARY KEY,
+        Last_Ride_Date TEXT NOT NULL,
+        FOREIGN KEY (Station_ID) REFERENCES Stations(Station_ID)
+    );
+    ''')
+
+    update_load_state(cursor)
+
+def migrate_to_v2(cursor):
+    # Integer year/month derived from the ISO date so grouping never needs strftime()
+    cursor.execute('''
+    ALTER TABLE Ridership ADD COLUMN Ride_Year INTEGER GENERATED ALWAYS AS (CAST(substr(Ride_Date, 1, 4) AS INTEGER)) VIRTUAL;
+    ''')
+
+    cursor.execute('''
+    ALTER TABLE Ridership ADD COLUMN Ride_Month INTEGER GENERATED ALWAYS AS (CAST(substr(Ride_Date, 6, 2) AS INTEGER)) VIRTUAL;
+    ''')
+
+    # (Station_ID, Ride_Date) is already covered by idx_ridership_station_date
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_ridership_daytype_station ON Ridership (Type_of_Day, Station_ID);
+    ''')
+
+def migrate_to_v3(cursor):
+    # Station/month/day-type rollups and per-station stats, kept current by triggers
+    create_rollup_tables(cursor)
+    rebuild_rollups(cursor)
+    create_rollup_triggers(cursor)
+
+def migrate_to_v4(cursor):
+    # Single-row stamp bumped by every data load; query caches compare against it
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS DataVersion (
+        Version INTEGER NOT NULL
+    );
+    ''')
+
+    cursor.execute('''
+    INSERT INTO DataVersion (Version) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM DataVersion);
+    ''')
+
+def create_partition_tables(cursor):
+    # Catalog of years moved out of Ridership into read-only partition files (partitions.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS RidershipPartitions (
+        Ride_Year INTEGER PRIMARY KEY,
+        File TEXT NOT NULL,
+        Num_Entries INTEGER NOT NULL,
+        First_Date TEXT,
+        Last_Date TEXT
+    );
+    ''')
+
+    # Per-station counts of the archived rows, so StationStats can be rebuilt without them
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS PartitionStationStats (
+        Station_ID INTEGER NOT NULL,
+        Ride_Year INTEGER NOT NULL,
+        Num_Entries INTEGER NOT NULL,
+        First_Date TEXT,
+        Last_Date TEXT,
+        PRIMARY KEY (Station_ID, Ride_Year)
+    ) WITHOUT ROWID;
+    ''')
+
+def migrate_to_v5(cursor):
+    # The triggers are recreated so StationStats refreshes fold in archived years
+    create_partition_tables(cursor)
+    drop_rollup_triggers(cursor)
+    create_rollup_triggers(cursor)
+
+def migrate_to_v6(cursor):
+    # Case-normalized, indexed line color so color lookups never wrap Lines.Color in LOWER()
+    cursor.execute('''
+    ALTER TABLE Lines ADD COLUMN Color_Key TEXT GENERATED ALWAYS AS (LOWER(TRIM(Color))) VIRTUAL;
+    ''')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_lines_color_key ON Lines (Color_Key);
+    ''')
+
+    # StopDetails is otherwise only indexed by (Stop_ID, Line_ID)
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_stopdetails_line ON StopDetails (Line_ID, Stop_ID);
+    ''')
+
+def migrate_to_v7(cursor):
+    # Quantile sketches next to RidershipMonthly; the triggers are recreated to maintain them
+    create_sketch_tables(cursor)
+    drop_rollup_triggers(cursor)
+    rebuild_rollups(cursor)
+    create_rollup_triggers(cursor)
+
+def migrate_to_v8(cursor):
+    # The insert trigger now adds the new row to its month instead of recomputing the month
+    drop_rollup_triggers(cursor)
+    create_rollup_triggers(cursor)
+
+def bump_data_version(cursor):
+    cursor.execute("UPDATE DataVersion SET Version = Version + 1")
+
+def get_data_version(cursor):
+    row = cursor.execute("SELECT Version FROM DataVersion").fetchone()
+    return row[0] if row else 0
+
+def readonly_uri(path):
+    # file: URI that opens path read-only; the path is percent-quoted so a '?', '#' or '%' in it
+    # cannot end the file name early or drop mode=ro. Imported here, off the startup path
+    from urllib.parse import quote
+    path = os.path.abspath(path).replace(os.sep, '/')
+    if not path.startswith('/'):
+        path = '/' + path  # Windows drive letter
+    return f"file:{quote(path)}?mode=ro"
+
+# Schema migrations in order; PRAGMA user_version records how many have been applied
+MIGRATIONS = [
+    migrate_to_v1,
+    migrate_to_v2,
+    migrate_to_v3,
+    migrate_to_v4,
+    migrate_to_v5,
+    migrate_to_v6,
+    migrate_to_v7,
+    migrate_to_v8,
+]
+
+def backup_database(conn):
+    # Copies a file database that holds ridership to <file>.v<version>-<time>.bak next to it;
+    # returns the backup's path, or None for in-memory and still empty databases
+    path = next((file for _, name, file in conn.execute("PRAGMA database_list") if name == 'main'), '')
+    has_rows = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'Ridership'").fetchone() and \
+        conn.execute("SELECT 1 FROM Ridership LIMIT 1").fetchone()
+    if not path or not has_rows:
+        return None
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    backup_path = f"{path}.v{version}-{time.strftime('%Y%m%d-%H%M%S')}.bak"
+    target = sqlite3.connect(backup_path)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+    return backup_path
+
+def check_schema(conn, path):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < len(MIGRATIONS):
+        raise SchemaError(f"{path} is at schema version {version}, this version needs {len(MIGRATIONS)}; "
+                          f"upgrade it with python create_cta_database.py --migrate {path} (it is backed up first)")
+
+def migrate_schema(conn, merge_duplicates=False):
+    # Applies pending migrations, backing a file database up first. merge_duplicates opts in to
+    # merge_duplicate_ridership() before v1 instead of stopping on repeated (station, day) rows
+    # Each migration and its user_version bump is one transaction, so one that fails (ALTER TABLE
+    # steps cannot be repeated) leaves the schema as it was and is simply retried next time
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return
+    backup_path = backup_database(conn)
+    if backup_path:
+        print(f"Backed up {backup_path} before migrating from schema version {version}", file=sys.stderr)
+
+    if conn.in_transaction:
+        conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # BEGIN/COMMIT below are explicit
+    cursor = conn.cursor()
+    try:
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            cursor.execute("BEGIN")
+            try:
+                if number == 1 and merge_duplicates:
+                    merged = merge_duplicate_ridership(cursor)
+                    if merged:
+                        print(f"Merged {merged} repeated ridership rows into their (Station_ID, Ride_Date) key", file=sys.stderr)
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {number}")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+    finally:
+        cursor.close()
+        conn.isolation_level = isolation_level
+
+def create_database(csv_paths=None):
+    # Connect to the SQLite database (this will create the database file)
+    conn = sqlite3.connect('cta_database.db')
+    cursor = conn.cursor()
+
+    # Create tables
+    create_tables(cursor)
+    conn.commit()
+    migrate_schema(conn)
+
+    # Real ridership exports go through the streaming loader instead of the sample rows below
+    if csv_paths:
+        import load_ridership
+        conn.commit()
+        cursor.close()
+        load_ridership.load_files(conn, csv_paths)
+        conn.close()
+        return
+
+    # Insert sample data into Stations
+    stations = [
+        ('UIC-Halsted',),
+        ('Clark/Lake',),
+        ('Sheridan',),
+        ('Union Station',)
+    ]
+    
+    cursor.executemany("INSERT OR IGNORE INTO Stations (Station_Name) VALUES (?)", stations)
+
+    # Insert sample data into Stops
+    stops = [
+        (1, 'Stop 1', 'N', 1, 41.8721, -87.6505),
+        (1, 'Stop 2', 'S', 0, 41.8722, -87.6506),
+        (2, 'Stop 3', 'E', 1, 41.8839, -87.6322),
+        (2, 'Stop 4', 'W', 0, 41.8840, -87.6323),
+        (3, 'Stop 5', 'N', 1, 41.9470, -87.6550),
+        (4, 'Stop 6', 'E', 1, 41.8795, -87.6320)
+    ]
+    
+    cursor.executemany("INSERT OR IGNORE INTO Stops (Station_ID, Stop_Name, Direction, ADA, Latitude, Longitude) VALUES (?, ?, ?, ?, ?, ?)", stops)
+
+    # Insert sample data into Lines
+    lines = [
+        ('Red',),
+        ('Blue',),
+        ('Yellow',)
+    ]
+    
+    cursor.executemany("INSERT OR IGNORE INTO Lines (Color) VALUES (?)", lines)
+
+    # Insert sample data into StopDetails
+    stop_details = [
+        (1, 1), 
+        (2, 1), 
+        (3, 2), 
+        (4, 3), 
+        (5, 2), 
+        (6, 1)
+    ]
+    
+    cursor.executemany("INSERT OR IGNORE INTO StopDetails (Stop_ID, Line_ID) VALUES (?, ?)", stop_details)
+
+    # Insert sample data into Ridership
+    ridership_data = [
+        (1, '2021-01-01', 1143302, 'W'),
+        (1, '2021-01-02', 1350077, 'W'),
+        (1, '2021-01-03', 1398751, 'W'),
+        (1, '2021-01-04', 1364987, 'W'),
+        (1, '2021-01-05', 1414985, 'W'),
+        (1, '2021-01-06', 1417008, 'W'),
+        (1, '2021-01-07', 1286209, 'W'),
+        (1, '2021-01-08', 1406969, 'W'),
+        (1, '2021-01-09', 1340464, 'W'),
+        (1, '2021-01-10', 1461571, 'W'),
+        (1, '2021-01-11', 1653511, 'W'),
+        (1, '2021-01-12', 1726553, 'W'),
+        (1, '2021-01-13', 1715302, 'W'),
+        (1, '2021-01-14', 1695108, 'W'),
+        (1, '2021-01-15', 1676810, 'W'),
+        (1, '2021-01-16', 1725557, 'W'),
+        (1, '2021-01-17', 1702964, 'W'),
+        (1, '2021-01-18', 1722221, 'W'),
+        (1, '2021-01-19', 1729039, 'W'),
+        (1, '2021-01-20', 524093, 'W'),
+        (1, '2021-01-21', 157614, 'W'),
+        (1, '2022-01-01', 1650000, 'W'),  # Example year 2022
+        (1, '2022-01-02', 1500000, 'W'),  # Example year 2022
+        (1, '2022-01-03', 1600000, 'W'),  # Example year 2022
+        (2, '2021-01-01', 800, 'W'),      # Additional station
+        (3, '2021-01-02', 600, 'W'),      # Additional station
+        (2, '2021-01-03', 1200, 'W')       # Additional station
+    ]
+    
+    cursor.executemany("INSERT OR IGNORE INTO Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day) VALUES (?, ?, ?, ?)", ridership_data)
+
+    update_load_state(cursor)
+    bump_data_version(cursor)
+
+    # Commit the changes and close the connection
+    conn.commit()
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create cta_database.db, or upgrade an existing database's schema")
+    parser.add_argument('csv_paths', nargs='*', help="ridership CSV exports to load instead of the sample rows")
+    parser.add_argument('--migrate', metavar='DB', help="only upgrade DB to the current schema (it is backed up first)")
+    parser.add_argument('--merge-duplicates', action='store_true',
+                        help="with --migrate: add repeated (Station_ID, Ride_Date) rows into one instead of stopping")
+    args = parser.parse_args(argv)
+    if args.merge_duplicates and not args.migrate:
+        parser.error("--merge-duplicates needs --migrate")
+
+    try:
+        if args.migrate:
+            if not os.path.exists(args.migrate):
+                parser.error(f"No such database: {args.migrate}")
+            conn = sqlite3.connect(args.migrate)
+            try:
+                migrate_schema(conn, args.merge_duplicates)
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+            finally:
+                conn.close()
+            print(f"{args.migrate} is at schema version {version}")
+        else:
+            create_database(args.csv_paths)
+    except DuplicateRidershipError as e:
+        sys.exit(f"Migration stopped: {e}")
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,644 @@
+# Query layer for the CTA L analysis app.
+#
+# CTAAnalytics wraps one SQLite connection and answers each of the app's commands with plain
+# result objects: nothing here prints, prompts or plots. cta_database.main() is the interactive
+# presenter built on top of it. Cached results are shared objects and must not be mutated.
+
+import functools
+import sqlite3
+from dataclasses import dataclass, fields, is_dataclass
+from typing import List, Optional, Tuple
+
+from create_cta_database import check_schema, get_data_version, migrate_schema
+from partitions import PartitionRouter
+from query_cache import cached
+from sketches import DEFAULT_QUANTILES, QuantileSketch, exact_quantiles, split_months
+from line_index import LineIndex
+from spatial import StopIndex
+from station_catalog import StationCatalog
+
+DB_PATH = 'cta_database.db'
+
+# Station names are resolved in memory by station_catalog.StationCatalog, so queries below take
+# Station_ID lists rather than joining Stations (or scanning Ridership to see who has data).
+# Yearly/monthly totals come from the RidershipMonthly rollup keyed by (Station_ID, year, month).
+# Daily rows filter on Station_ID plus a Ride_Date range so they are answered from
+# idx_ridership_station_date; wrapping Ride_Date in strftime() would force a full table scan.
+# Daily queries read {ridership}, filled in per partitions.PartitionRouter scan, since archived
+# years live in attached partition files
+STATISTICS_SQL = """
+    SELECT COUNT(*), SUM(Num_Entries), MIN(First_Date), MAX(Last_Date)
+    FROM StationStats
+"""
+
+def ridership_percentages_sql(num_stations):
+    placeholders = ", ".join(["?"] * num_stations)
+    return f"""
+        SELECT SUM(Total_Riders), Type_of_Day
+        FROM RidershipMonthly
+        WHERE Station_ID IN ({placeholders})
+        GROUP BY Type_of_Day
+    """
+
+WEEKDAY_RIDERSHIP_SQL = """
+    SELECT s.Station_Name, SUM(r.Total_Riders) AS Total_Riders
+    FROM RidershipMonthly r
+    JOIN Stations s ON r.Station_ID = s.Station_ID
+    WHERE r.Type_of_Day = 'W'
+    GROUP BY s.Station_Name
+    ORDER BY Total_Riders DESC
+"""
+
+# Line colors are matched on the indexed Lines.Color_Key, LOWER(TRIM(Color))
+LINE_EXISTS_SQL = """
+    SELECT COUNT(*) FROM Lines WHERE Color_Key = LOWER(TRIM(?))
+"""
+
+STOPS_BY_LINE_SQL = """
+    SELECT s.Stop_Name
+    FROM Lines l
+    JOIN StopDetails sd ON sd.Line_ID = l.Line_ID
+    JOIN Stops s ON s.Stop_ID = sd.Stop_ID
+    WHERE l.Color_Key = LOWER(TRIM(?)) AND UPPER(s.Direction) = UPPER(?)
+    ORDER BY s.Stop_Name
+"""
+
+STOPS_COUNT_BY_COLOR_SQL = """
+    SELECT l.Color, s.Direction, COUNT(s.Stop_ID) AS Stop_Count
+    FROM Stops s
+    JOIN StopDetails sd ON s.Stop_ID = sd.Stop_ID
+    JOIN Lines l ON sd.Line_ID = l.Line_ID
+    GROUP BY l.Color, s.Direction
+    ORDER BY l.Color, s.Direction
+"""
+
+def station_totals_sql(year=None, day_type=None):
+    # Riders per station from the rollup, optionally for one year and/or day type
+    filters = []
+    if year is not None:
+        filters.append("Ride_Year = :year")
+    if day_type is not None:
+        filters.append("Type_of_Day = :day_type")
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    return f"""
+        SELECT Station_ID, SUM(Total_Riders)
+        FROM RidershipMonthly
+        {where}
+        GROUP BY Station_ID
+    """
+
+def line_monthly_sql(num_stations, year=None, day_type=None):
+    # Monthly riders summed over a set of stations, each counted once
+    placeholders = ", ".join(["?"] * num_stations)
+    filters = [f"Station_ID IN ({placeholders})"]
+    if year is not None:
+        filters.append("Ride_Year = ?")
+    if day_type is not None:
+        filters.append("Type_of_Day = ?")
+    return f"""
+        SELECT Ride_Year, Ride_Month, SUM(Total_Riders)
+        FROM RidershipMonthly
+        WHERE {' AND '.join(filters)}
+        GROUP BY Ride_Year, Ride_Month
+        ORDER BY Ride_Year, Ride_Month
+    """
+
+def yearly_ridership_sql(num_stations):
+    placeholders = ", ".join(["?"] * num_stations)
+    return f"""
+        SELECT Ride_Year, SUM(Total_Riders)
+        FROM RidershipMonthly
+        WHERE Station_ID IN ({placeholders})
+        GROUP BY Ride_Year
+        ORDER BY Ride_Year
+    """
+
+MONTHLY_RIDERSHIP_SQL = """
+    SELECT Ride_Month, SUM(Total_Riders) AS Total_Riders
+    FROM RidershipMonthly
+    WHERE Station_ID = ? AND Ride_Year = ?
+    GROUP BY Ride_Month
+    ORDER BY Ride_Month
+"""
+
+DAILY_RIDERSHIP_SQL = """
+    SELECT Ride_Date, SUM(Num_Riders) AS Total_Riders
+    FROM {ridership}
+    WHERE Station_ID = ? AND Ride_Date >= ? AND Ride_Date < ?
+    GROUP BY Ride_Date
+    ORDER BY Ride_Date
+"""
+
+# Rows fetched per round trip when streaming daily series
+FETCH_BATCH_SIZE = 1000
+
+
+def daily_comparison_sql(num_stations):
+    # One pass over the (Station_ID, Ride_Date) index for all stations, pivoted so each row is
+    # one date with a column per station (NULL where that station has no row for the day)
+    columns = ", ".join(["SUM(CASE WHEN Station_ID = ? THEN Num_Riders END)"] * num_stations)
+    placeholders = ", ".join(["?"] * num_stations)
+    return f"""
+        SELECT Ride_Date, {columns}
+        FROM {{ridership}}
+        WHERE Station_ID IN ({placeholders}) AND Ride_Date >= ? AND Ride_Date < ?
+        GROUP BY Ride_Date
+        ORDER BY Ride_Date
+    """
+
+
+def daily_columns_sql(num_stations=None):
+    # Station_ID, day number since 1970-01-01, riders and Type_of_Day code (0 = A, 1 = U, 2 = W),
+    # fetched as plain integers for NumPy. Without a station list it is a sequential scan, which
+    # beats an index search per station once most stations are wanted
+    stations = ""
+    if num_stations is not None:
+        stations = f"Station_ID IN ({', '.join(['?'] * num_stations)}) AND "
+    return f"""
+        SELECT Station_ID,
+               CAST(julianday(Ride_Date) - 2440587.5 AS INTEGER),
+               IFNULL(Num_Riders, 0),
+               CASE Type_of_Day WHEN 'A' THEN 0 WHEN 'U' THEN 1 ELSE 2 END
+        FROM {{ridership}}
+        WHERE {stations}Ride_Date >= ? AND Ride_Date < ?
+    """
+
+
+def sketch_buckets_sql(num_stations=None):
+    # Merged sketch of whole months (sketches.py): days per (Type_of_Day, bucket) over the
+    # stations, for (year, month) >= (?, ?) and < (?, ?)
+    stations = ""
+    if num_stations is not None:
+        stations = f"Station_ID IN ({', '.join(['?'] * num_stations)}) AND "
+    return f"""
+        SELECT Type_of_Day, Bucket, SUM(Num_Days)
+        FROM RidershipSketches
+        WHERE {stations}(Ride_Year, Ride_Month) >= (?, ?) AND (Ride_Year, Ride_Month) < (?, ?)
+        GROUP BY Type_of_Day, Bucket
+    """
+
+
+def daily_riders_sql(num_stations=None):
+    stations = ""
+    if num_stations is not None:
+        stations = f"Station_ID IN ({', '.join(['?'] * num_stations)}) AND "
+    return f"""
+        SELECT Type_of_Day, Num_Riders
+        FROM {{ridership}}
+        WHERE {stations}Ride_Date >= ? AND Ride_Date < ? AND Num_Riders IS NOT NULL
+    """
+
+
+@dataclass(frozen=True)
+class Statistics:
+    num_stations: int
+    num_entries: int
+    first_date: Optional[str]
+    last_date: Optional[str]
+
+
+@dataclass(frozen=True)
+class Station:
+    station_id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class DayTypeShare:
+    day_type: str
+    riders: int
+    percentage: float
+
+
+@dataclass(frozen=True)
+class RidershipPercentages:
+    station_name: str
+    shares: List[DayTypeShare]
+    total_riders: int
+
+
+@dataclass(frozen=True)
+class StationShare:
+    station_name: str
+    riders: int
+    percentage: float
+
+
+@dataclass(frozen=True)
+class LineStops:
+    color: str
+    direction: str
+    line_exists: bool
+    stops: List[str]
+
+
+@dataclass(frozen=True)
+class LineDirectionCount:
+    color: str
+    direction: str
+    count: int
+    percentage: float
+
+
+@dataclass(frozen=True)
+class YearTotal:
+    year: int
+    riders: int
+
+
+@dataclass(frozen=True)
+class MonthTotal:
+    month: int
+    riders: int
+
+
+@dataclass(frozen=True)
+class LineMonthTotal:
+    year: int
+    month: int
+    riders: int
+
+
+@dataclass(frozen=True)
+class LineTotal:
+    color: str
+    num_stations: int
+    riders: float  # fractional when shared stations are split between lines
+    percentage: float
+
+
+@dataclass(frozen=True)
+class RidershipDistribution:
+    day_type: str
+    num_days: int
+    fractions: Tuple[float, ...]
+    # Daily riders at each fraction; within sketches.RELATIVE_ERROR of the true value unless exact
+    riders: Tuple[Optional[float], ...]
+    exact: bool
+
+
+@dataclass(frozen=True)
+class DayTotal:
+    ride_date: str
+    riders: int
+
+
+@dataclass(frozen=True)
+class DailyRow:
+    # Riders per requested station, in request order; None where a station has no data that day
+    ride_date: str
+    riders: Tuple[Optional[int], ...]
+
+
+@dataclass(frozen=True)
+class NearbyStop:
+    stop_name: str
+    latitude: float
+    longitude: float
+    miles: float
+
+
+@functools.lru_cache(maxsize=None)
+def field_names(cls):
+    return tuple(field.name for field in fields(cls))
+
+
+def to_json(value):
+    # Result objects as JSON-ready dicts and lists, for the HTTP server and batch mode. Field by
+    # field rather than dataclasses.asdict, which deep-copies every value it visits
+    if is_dataclass(value):
+        return {name: to_json(getattr(value, name)) for name in field_names(type(value))}
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    return value
+
+
+def year_range(year):
+    # [start, end) date bounds for a calendar year, usable as an indexed range predicate
+    year = int(year)
+    return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+
+
+def connect_db(path=DB_PATH, cached_statements=128, migrate=False):
+    # cached_statements: prepared statements sqlite3 keeps per connection; every distinct SQL
+    # string (including each IN-list length) takes a slot, so long batches want more than 128
+    # uri=True lets partitions.py attach archived years read-only through file: URIs; a plain
+    # path is still opened as a plain path
+    conn = sqlite3.connect(path, cached_statements=cached_statements, uri=True)
+    # Older database files are only upgraded when asked (migrate=True, which backs them up first);
+    # otherwise opening one raises SchemaError instead of rewriting it
+    try:
+        if migrate:
+            migrate_schema(conn)
+        else:
+            check_schema(conn, path)
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+class CTAAnalytics:
+    # cache is an optional query_cache.QueryCache, which may be shared between instances
+    def __init__(self, conn, cache=None):
+        self.conn = conn
+        self.cache = cache
+        self._stop_index = None
+        self._station_catalog = None
+        self._line_index = None
+        self._partitions = None
+
+    @classmethod
+    def open(cls, path=DB_PATH, cache=None, cached_statements=128, migrate=False):
+        return cls(connect_db(path, cached_statements, migrate), cache)
+
+    def data_version(self):
+        cursor = self.conn.cursor()
+        try:
+            return get_data_version(cursor)
+        finally:
+            cursor.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _fetchall(self, sql, params=()):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    @property
+    def stop_index(self):
+        # Stop locations are indexed on first use so proximity lookups never hit the database
+        if self._stop_index is None:
+            cursor = self.conn.cursor()
+            try:
+                self._stop_index = StopIndex.from_cursor(cursor)
+            finally:
+                cursor.close()
+        return self._stop_index
+
+    @property
+    def station_catalog(self):
+        # Station names and which stations have ridership, reloaded when the data version moves
+        version = self.data_version()
+        if self._station_catalog is None or self._station_catalog.version != version:
+            cursor = self.conn.cursor()
+            try:
+                self._station_catalog = StationCatalog.from_cursor(cursor, version)
+            finally:
+                cursor.close()
+        return self._station_catalog
+
+    @property
+    def line_index(self):
+        # Which lines stop at which stations (see line_index.py), reloaded with the data version
+        version = self.data_version()
+        if self._line_index is None or self._line_index.version != version:
+            cursor = self.conn.cursor()
+            try:
+                self._line_index = LineIndex.from_cursor(cursor, version)
+            finally:
+                cursor.close()
+        return self._line_index
+
+    @property
+    def partitions(self):
+        # Archived years of Ridership (see partitions.py), re-read when the data version moves
+        version = self.data_version()
+        if self._partitions is None or self._partitions.version != version:
+            if self._partitions is not None:
+                self._partitions.close()
+            self._partitions = PartitionRouter.from_connection(self.conn, version)
+        return self._partitions
+
+    @cached
+    def statistics(self):
+        num_stations, num_entries, first_date, last_date = self._fetchall(STATISTICS_SQL)[0]
+        return Statistics(num_stations, num_entries or 0, first_date, last_date)
+
+    def find_stations(self, partial_name):
+        return [Station(station_id, name) for station_id, name in self.station_catalog.match(partial_name)]
+
+    def match_stations(self, station_name):
+        # Stations matching a wildcard pattern that have ridership data
+        return [Station(station_id, name) for station_id, name in self.station_catalog.match(station_name, with_data=True)]
+
+    def match_stations_many(self, patterns):
+        # One list of matching Station objects (with ridership data) per pattern, in order
+        catalog = self.station_catalog
+        return [[Station(station_id, name) for station_id, name in catalog.match(pattern, with_data=True)] for pattern in patterns]
+
+    def suggest_stations(self, text, limit=5):
+        # Station names close to a misspelled name or pattern, closest first
+        return self.station_catalog.suggest(text, limit)
+
+    def station_matrix(self, stations, start_date, end_date):
+        # Dense date x station NumPy matrix for start_date <= day < end_date (see comparison.py)
+        from comparison import StationMatrix
+        return StationMatrix.load(self, stations, start_date, end_date)
+
+    def daily_columns(self, station_ids, start_date, end_date):
+        # NumPy arrays (Station_ID, day number, riders, day type code) with one entry per row of
+        # the given stations (None = every station) for start_date <= Ride_Date < end_date, in
+        # no particular order
+        import numpy as np
+        row_dtype = np.dtype([('station', np.int64), ('day', np.int64), ('riders', np.int64), ('day_type', np.int8)])
+        station_ids = None if station_ids is None else list(station_ids)
+        parts = []
+        if station_ids is None or station_ids:
+            sql = daily_columns_sql(None if station_ids is None else len(station_ids))
+            cursor = self.conn.cursor()
+            try:
+                for table, scan_start, scan_end in self.partitions.scans(start_date, end_date):
+                    cursor.execute(sql.format(ridership=table), (*(station_ids or ()), scan_start, scan_end))
+                    parts.append(np.fromiter(cursor, dtype=row_dtype))
+            finally:
+                cursor.close()
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=row_dtype)
+        return rows['station'], rows['day'], rows['riders'], rows['day_type']
+
+    def trends(self, station_ids=None, start_date=None, end_date=None):
+        # Rolling, year-over-year and weekday-adjusted series for many stations (see trends.py).
+        # Keep the table and call its refresh() to bring it up to date after a load
+        from trends import TrendTable
+        return TrendTable.load(self, station_ids, start_date, end_date)
+
+    @cached
+    def ridership_percentages(self, station_name):
+        station_ids = [station_id for station_id, _ in self.station_catalog.exact(station_name)]
+        return self._percentages(station_name, station_ids)
+
+    @cached
+    def station_ridership_percentages(self, station_id):
+        # By Station_ID like monthly_ridership, so stations that share a name stay apart
+        names = {entry[0]: entry[1] for entry in self.station_catalog.stations}
+        return self._percentages(names.get(station_id), [station_id])
+
+    def _day_type_totals(self, station_ids):
+        # [(riders, Type_of_Day)] of the stations together, in Type_of_Day order
+        return self._fetchall(ridership_percentages_sql(len(station_ids)), station_ids) if station_ids else []
+
+    def _percentages(self, station_name, station_ids):
+        results = self._day_type_totals(station_ids)
+        total_riders = sum(count for count, _ in results)
+        shares = []
+        if total_riders:
+            shares = [DayTypeShare(day_type, count, (count / total_riders) * 100) for count, day_type in results]
+        return RidershipPercentages(station_name, shares, total_riders)
+
+    @cached
+    def weekday_ridership(self):
+        results = self._fetchall(WEEKDAY_RIDERSHIP_SQL)
+        total_weekday_riders = sum(count for _, count in results)
+        return [
+            StationShare(station_name, count, (count / total_weekday_riders) * 100 if total_weekday_riders > 0 else 0)
+            for station_name, count in results
+        ]
+
+    @cached
+    def stops_by_line_color(self, line_color, direction):
+        line_exists = self._fetchall(LINE_EXISTS_SQL, (line_color,))[0][0] > 0
+        stops = []
+        if line_exists:
+            stops = [row[0] for row in self._fetchall(STOPS_BY_LINE_SQL, (line_color, direction))]
+        return LineStops(line_color, direction, line_exists, stops)
+
+    @cached
+    def stops_count_by_color(self):
+        results = self._fetchall(STOPS_COUNT_BY_COLOR_SQL)
+        total_stops = sum(count for _, _, count in results)
+        return [
+            LineDirectionCount(color, direction, count, (count / total_stops) * 100 if total_stops > 0 else 0)
+            for color, direction, count in results
+        ]
+
+    @cached
+    def line_ridership(self, year=None, day_type=None, split=False):
+        # Riders per line, summed from per-station rollup totals. A station served by several
+        # lines counts in full for each unless split, which divides it evenly between them;
+        # percentages are of the riders at every station on any line
+        index = self.line_index
+        params = {'year': None if year is None else int(year), 'day_type': day_type}
+        station_totals = dict(self._fetchall(station_totals_sql(params['year'], day_type), params))
+        on_a_line = sum(riders for station_id, riders in station_totals.items() if station_id in index.station_masks)
+        results = []
+        for key, (num_stations, riders) in index.line_totals(station_totals, split).items():
+            results.append(LineTotal(index.colors[key], num_stations, riders, (riders / on_a_line) * 100 if on_a_line else 0))
+        return sorted(results, key=lambda line: (-line.riders, line.color))
+
+    @cached
+    def line_monthly_ridership(self, colors, year=None, day_type=None, direction=None, match_all=False):
+        # colors: one color or a tuple of colors (any case). Monthly riders at the stations served
+        # by any (or, with match_all, every) of the lines, each station counted once
+        if isinstance(colors, str):
+            colors = (colors,)
+        station_ids = self.line_index.stations(colors, direction, match_all)
+        if not station_ids:
+            return []
+        params = [*station_ids, *([int(year)] if year is not None else []), *([day_type] if day_type is not None else [])]
+        rows = self._fetchall(line_monthly_sql(len(station_ids), year, day_type), params)
+        return [LineMonthTotal(ride_year, month, riders) for ride_year, month, riders in rows]
+
+    @cached
+    def ridership_distribution(self, station_ids=None, start_date=None, end_date=None, fractions=DEFAULT_QUANTILES,
+                               exact=False):
+        # Percentiles of daily riders per day type (W, A, U) over a group of stations (None = every
+        # station) for start_date <= Ride_Date < end_date (None = unbounded). Whole months come
+        # from the merged monthly sketches and only partial months at the edges are read row by
+        # row; exact sorts every row instead, for verification
+        station_ids = None if station_ids is None else tuple(station_ids)
+        if station_ids == ():
+            return []
+        sketches = {}
+        values = {}
+        if exact:
+            for day_type, riders in self._daily_riders(station_ids, start_date, end_date):
+                values.setdefault(day_type, []).append(riders)
+        else:
+            whole, edges = split_months(start_date, end_date)
+            if whole is not None:
+                sql = sketch_buckets_sql(None if station_ids is None else len(station_ids))
+                for day_type, bucket, days in self._fetchall(sql, (*(station_ids or ()), *whole[0], *whole[1])):
+                    sketches.setdefault(day_type, QuantileSketch()).counts[bucket] = days
+            for edge_start, edge_end in edges:
+                for day_type, riders in self._daily_riders(station_ids, edge_start, edge_end):
+                    sketches.setdefault(day_type, QuantileSketch()).add(riders)
+
+        distributions = []
+        for day_type in ('W', 'A', 'U'):
+            if exact and day_type in values:
+                riders = exact_quantiles(values[day_type], fractions)
+                distributions.append(RidershipDistribution(day_type, len(values[day_type]), tuple(fractions), tuple(riders), True))
+            elif not exact and day_type in sketches:
+                sketch = sketches[day_type]
+                distributions.append(RidershipDistribution(day_type, len(sketch), tuple(fractions),
+                                                           tuple(sketch.quantiles(fractions)), False))
+        return distributions
+
+    def _daily_riders(self, station_ids, start_date, end_date):
+        # (Type_of_Day, Num_Riders) of every row in the range, across partitions
+        sql = daily_riders_sql(None if station_ids is None else len(station_ids))
+        rows = []
+        for table, scan_start, scan_end in self.partitions.scans(start_date, end_date):
+            rows += self._fetchall(sql.format(ridership=table), (*(station_ids or ()), scan_start, scan_end))
+        return rows
+
+    @cached
+    def yearly_ridership(self, station_name):
+        return self._yearly_totals([station_id for station_id, _ in self.station_catalog.match(station_name)])
+
+    @cached
+    def station_yearly_ridership(self, station_id):
+        # By Station_ID like monthly_ridership, so stations that share a name stay apart
+        return self._yearly_totals([station_id])
+
+    def _yearly_totals(self, station_ids):
+        if not station_ids:
+            return []
+        return [YearTotal(year, total) for year, total in self._fetchall(yearly_ridership_sql(len(station_ids)), station_ids)]
+
+    @cached
+    def monthly_ridership(self, station_id, year):
+        # All twelve months, zero-filled where there is no data
+        totals = dict(self._fetchall(MONTHLY_RIDERSHIP_SQL, (station_id, int(year))))
+        return [MonthTotal(month, totals.get(month, 0)) for month in range(1, 13)]
+
+    @cached
+    def daily_ridership(self, station_id, year):
+        rows = []
+        for table, start_date, end_date in self.partitions.scans(*year_range(year)):
+            rows += self._fetchall(DAILY_RIDERSHIP_SQL.format(ridership=table), (station_id, start_date, end_date))
+        return [DayTotal(ride_date, total) for ride_date, total in rows]
+
+    def iter_daily_ridership(self, station_ids, start_date, end_date, batch_size=FETCH_BATCH_SIZE):
+        # Streams DailyRow objects for start_date <= Ride_Date < end_date, aligned by date across
+        # any number of stations, fetching batch_size rows at a time
+        station_ids = list(station_ids)
+        if not station_ids:
+            return
+        sql = daily_comparison_sql(len(station_ids))
+        cursor = self.conn.cursor()
+        try:
+            # One query per partition window; windows come in date order
+            for table, scan_start, scan_end in self.partitions.scans(start_date, end_date):
+                cursor.execute(sql.format(ridership=table), (*station_ids, *station_ids, scan_start, scan_end))
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield DailyRow(row[0], tuple(row[1:]))
+        finally:
+            cursor.close()
+
+    def stations_within(self, latitude, longitude, radius=1):
+        return [NearbyStop(name, lat, lon, miles) for miles, name, lat, lon in self.stop_index.within(latitude, longitude, radius)]
+
+    def nearest_stops(self, latitude, longitude, k=1):
+        return [NearbyStop(name, lat, lon, miles) for miles, name, lat, lon in self.stop_index.nearest(latitude, longitude, k)]
@@ -1,447 +1,578 @@
-import sqlite3
-import math
-import matplotlib.pyplot as plt
-import matplotlib
-
-# Ensure the correct backend is used for plotting
-matplotlib.use('TkAgg')
-
-def connect_db():
-    return sqlite3.connect('cta_database.db')
-
-def display_statistics(cursor):
-    cursor.execute("SELECT COUNT(DISTINCT Station_ID), COUNT(*), MIN(Ride_Date), MAX(Ride_Date) FROM Ridership")
-    stats = cursor.fetchone()
-    
-    print("Welcome to CTA L analysis app")
-    
-    if stats:
-        print(f"General Statistics: # of stations: {stats[0]} # of ride entries: {stats[1]} date range: {stats[2]} - {stats[3]}")
-
-def find_stations(cursor, partial_name):
-    cursor.execute("SELECT Station_ID, Station_Name FROM Stations WHERE Station_Name LIKE ?", (partial_name,))
-    results = cursor.fetchall()
-    
-    if results:
-        for station in results:
-            print(f"{station[0]} : {station[1]}")
-    else:
-        print("No stations found...")
-
-def ridership_percentages(cursor, station_name):
-    cursor.execute("SELECT SUM(Num_Riders), Type_of_Day FROM Ridership WHERE Station_ID IN (SELECT Station_ID FROM Stations WHERE Station_Name = ?) GROUP BY Type_of_Day", (station_name,))
-    results = cursor.fetchall()
-    
-    total_riders = sum(count for count, _ in results)
-    
-    if total_riders == 0:
-        print("No data found...")
-        return
-    
-    percentages = {}
-    for count, day_type in results:
-        percentages[day_type] = (count, (count / total_riders) * 100)
-    
-    print(f"Percentage of ridership for the {station_name} station:")
-    for day_type, (count, percentage) in percentages.items():
-        print(f"{day_type} ridership: {count:,} ({percentage:.2f}%)")
-    print(f"Total ridership: {total_riders:,}")
-
-def weekday_ridership(cursor):
-    cursor.execute("""SELECT s.Station_Name, SUM(r.Num_Riders) AS Total_Riders 
-                      FROM Ridership r 
-                      JOIN Stations s ON r.Station_ID = s.Station_ID 
-                      WHERE r.Type_of_Day = 'W' 
-                      GROUP BY s.Station_Name 
-                      ORDER BY Total_Riders DESC""")
-    
-    results = cursor.fetchall()
-    total_weekday_riders = sum(count for _, count in results)
-    
-    for station_name, count in results:
-        percentage = (count / total_weekday_riders) * 100 if total_weekday_riders > 0 else 0
-        print(f"{station_name} : {count:,} ({percentage:.2f}%)")
-
-def stops_by_line_color(cursor, line_color, direction):
-    # Check if the line color exists
-    cursor.execute("SELECT COUNT(*) FROM Lines WHERE LOWER(Color) = LOWER(?)", (line_color,))
-    line_count = cursor.fetchone()[0]
-    
-    if line_count == 0:
-        print(f"**No such line '{line_color}'...")
-        return
-    
-    # Get the stops for the specified line color and direction
-    cursor.execute("""SELECT s.Stop_Name 
-                      FROM Stops s 
-                      JOIN StopDetails sd ON s.Stop_ID = sd.Stop_ID 
-                      JOIN Lines l ON sd.Line_ID = l.Line_ID 
-                      WHERE LOWER(l.Color) = LOWER(?) AND UPPER(s.Direction) = UPPER(?)
-                      ORDER BY s.Stop_Name""", (line_color, direction))
-    
-    results = cursor.fetchall()
-    
-    if results:
-        print(f"Stops for the {line_color} line going {direction}:")
-        for stop in results:
-            print(stop[0])
-    else:
-        print(f"No stops found for the {line_color} line going {direction}...")
-
-def stops_count_by_color(cursor):
-    cursor.execute("""SELECT l.Color, s.Direction, COUNT(s.Stop_ID) AS Stop_Count 
-                      FROM Stops s 
-                      JOIN StopDetails sd ON s.Stop_ID = sd.Stop_ID 
-                      JOIN Lines l ON sd.Line_ID = l.Line_ID 
-                      GROUP BY l.Color, s.Direction 
-                      ORDER BY l.Color, s.Direction""")
-    
-    results = cursor.fetchall()
-    total_stops = sum(count for _, _, count in results)
-    
-    for color, direction, count in results:
-        percentage = (count / total_stops) * 100 if total_stops > 0 else 0
-        print(f"{color} going {direction} : {count} ({percentage:.2f}%)")
-
-def yearly_ridership(cursor, station_name):
-    cursor.execute("""SELECT strftime('%Y', Ride_Date), SUM(Num_Riders) 
-                      FROM Ridership 
-                      WHERE Station_ID IN (SELECT Station_ID FROM Stations WHERE Station_Name LIKE ?) 
-                      GROUP BY strftime('%Y', Ride_Date)
-                      ORDER BY strftime('%Y', Ride_Date)""", (station_name,))
-    
-    results = cursor.fetchall()
-    
-    if not results:
-        print("**No station found...")
-        return
-    
-    print(f"Yearly Ridership at {station_name}:")
-    for year, total in results:
-        print(f"{year} : {total:,}")
-
-    # Prepare for plotting
-    years, totals = zip(*results)
-
-    # Prompt to plot data
-    plot_option = input("Plot? (y/n): ")
-    if plot_option.lower() == 'y':
-        plt.figure(figsize=(10, 5))
-        plt.plot(years, totals, marker='o', label='Total Ridership')
-        plt.xlabel('Year')
-        plt.ylabel('Total Ridership')
-        plt.title(f'Yearly Ridership at {station_name}')
-        plt.xticks(rotation=45)
-        plt.legend()
-        plt.tight_layout()
-        plt.show()
-
-def monthly_ridership(cursor):
-    station_name = input("Enter a station name (wildcards _ and %): ")
-    year = input("Enter a year: ")
-
-    # Query to find distinct stations matching the provided name
-    cursor.execute("""
-        SELECT DISTINCT s.Station_ID, s.Station_Name
-        FROM Stations s
-        JOIN Ridership r ON s.Station_ID = r.Station_ID
-        WHERE s.Station_Name LIKE ?
-        """, (station_name,))
-    
-    matching_stations = cursor.fetchall()
-
-    # Handle cases where no station is found or multiple stations are found
-    if len(matching_stations) == 0:
-        print("**No station found...")
-        return
-    elif len(matching_stations) > 1:
-        print("**Multiple stations found...")
-        for idx, station in enumerate(matching_stations, start=1):
-            print(f"{idx}: {station[1]}")
-        
-        choice = input("Choose a station number: ")
-        if not choice.isdigit() or int(choice) < 1 or int(choice) > len(matching_stations):
-            print("Invalid choice. Exiting...")
-            return
-
-        station_id = matching_stations[int(choice) - 1][0]
-        station_full_name = matching_stations[int(choice) - 1][1]
-    else:
-        station_id = matching_stations[0][0]
-        station_full_name = matching_stations[0][1]
-
-    print(f"\nMonthly Ridership at {station_full_name} for {year}")
-
-    # Fetch monthly ridership data for the selected station and year
-    cursor.execute("""
-        SELECT strftime('%m', Ride_Date) AS Month, SUM(Num_Riders) AS Total_Riders
-        FROM Ridership
-        WHERE Station_ID = ? AND strftime('%Y', Ride_Date) = ?
-        GROUP BY Month
-        ORDER BY Month
-    """, (station_id, year))
-
-    results = cursor.fetchall()
-
-    # Prepare data for all months (filling missing months with zeroes)
-    months = [f"{i:02d}/{year}" for i in range(1, 13)]  # Generate list of months 01/202X - 12/202X
-    totals = {f"{i:02d}": 0 for i in range(1, 13)}  # Initialize totals dictionary with zeroes
-
-    # Update totals with actual ridership data
-    for month, total in results:
-        totals[month] = total
-
-    # Print the results for each month
-    for month in months:
-        print(f"{month} : {totals[month[:2]]:,}")  # Use the first two characters for the month key
-
-    # Ask the user if they want to plot the results
-    plot_response = input("Plot? (y/n): ")
-    if plot_response.lower() == 'y':
-        # Plotting the data as a simple line chart
-        plt.figure(figsize=(8, 6))  # Set figure size for better readability
-        plt.plot(months, [totals[month[:2]] for month in months], marker='o', linestyle='-', color='b', label='Ridership')  # Draw the line with markers
-        plt.xlabel('Month')
-        plt.ylabel('Total Ridership')
-        plt.title(f'Monthly Ridership at {station_full_name} for {year}')
-        plt.xticks(rotation=45)
-        plt.legend()  # Add a legend to the plot
-        plt.grid(True)  # Add grid lines for clarity
-        plt.tight_layout()  # Ensure everything fits within the plot
-        plt.show()  # Display the plot
-    else:
-        print(f"No data found for {station_full_name} in {year}.")
-
-
-def daily_ridership_comparison(cursor):
-    year = input("Year to compare against? ")
-    station_1_name = input("Enter station 1 (wildcards _ and %): ")
-    station_2_name = input("Enter station 2 (wildcards _ and %): ")
-
-    # Query to find distinct stations matching station 1
-    cursor.execute("""
-        SELECT DISTINCT s.Station_ID, s.Station_Name
-        FROM Stations s
-        JOIN Ridership r ON s.Station_ID = r.Station_ID
-        WHERE s.Station_Name LIKE ?
-    """, (station_1_name,))
-    station_1_matches = cursor.fetchall()
-
-    if len(station_1_matches) == 0:
-        print(f"**No station found for {station_1_name}")
-        return
-    elif len(station_1_matches) > 1:
-        print("**Multiple stations found for station 1...")
-        for idx, station in enumerate(station_1_matches, start=1):
-            print(f"{idx}: {station[1]}")
-        choice = input("Choose a station number for station 1: ")
-        if not choice.isdigit() or int(choice) < 1 or int(choice) > len(station_1_matches):
-            print("Invalid choice. Exiting...")
-            return
-        station_1_id = station_1_matches[int(choice) - 1][0]
-        station_1_full_name = station_1_matches[int(choice) - 1][1]
-    else:
-        station_1_id = station_1_matches[0][0]
-        station_1_full_name = station_1_matches[0][1]
-
-    # Query to find distinct stations matching station 2
-    cursor.execute("""
-        SELECT DISTINCT s.Station_ID, s.Station_Name
-        FROM Stations s
-        JOIN Ridership r ON s.Station_ID = r.Station_ID
-        WHERE s.Station_Name LIKE ?
-    """, (station_2_name,))
-    station_2_matches = cursor.fetchall()
-
-    if len(station_2_matches) == 0:
-        print(f"**No station found for {station_2_name}")
-        return
-    elif len(station_2_matches) > 1:
-        print("**Multiple stations found for station 2...")
-        for idx, station in enumerate(station_2_matches, start=1):
-            print(f"{idx}: {station[1]}")
-        choice = input("Choose a station number for station 2: ")
-        if not choice.isdigit() or int(choice) < 1 or int(choice) > len(station_2_matches):
-            print("Invalid choice. Exiting...")
-            return
-        station_2_id = station_2_matches[int(choice) - 1][0]
-        station_2_full_name = station_2_matches[int(choice) - 1][1]
-    else:
-        station_2_id = station_2_matches[0][0]
-        station_2_full_name = station_2_matches[0][1]
-
-    # Fetch daily ridership data for both stations
-    cursor.execute("""
-        SELECT Ride_Date, SUM(Num_Riders) AS Total_Riders
-        FROM Ridership
-        WHERE Station_ID = ? AND strftime('%Y', Ride_Date) = ?
-        GROUP BY Ride_Date
-        ORDER BY Ride_Date
-    """, (station_1_id, year))
-    station_1_data = cursor.fetchall()
-
-    cursor.execute("""
-        SELECT Ride_Date, SUM(Num_Riders) AS Total_Riders
-        FROM Ridership
-        WHERE Station_ID = ? AND strftime('%Y', Ride_Date) = ?
-        GROUP BY Ride_Date
-        ORDER BY Ride_Date
-    """, (station_2_id, year))
-    station_2_data = cursor.fetchall()
-
-    # Print first 5 and last 5 records for each station
-    print(f"Station 1: {station_1_id} {station_1_full_name}")
-    if station_1_data:
-        for entry in station_1_data[:5]:  # First 5 days
-            print(f"{entry[0]} {entry[1]:,}")
-        for entry in station_1_data[-5:]:  # Last 5 days
-            print(f"{entry[0]} {entry[1]:,}")
-    else:
-        print(f"No data found for {station_1_full_name} in {year}.")
-
-    print(f"\nStation 2: {station_2_id} {station_2_full_name}")
-    if station_2_data:
-        for entry in station_2_data[:5]:  # First 5 days
-            print(f"{entry[0]} {entry[1]:,}")
-        for entry in station_2_data[-5:]:  # Last 5 days
-            print(f"{entry[0]} {entry[1]:,}")
-    else:
-        print(f"No data found for {station_2_full_name} in {year}.")
-
-    # Ask if the user wants to plot the results
-    plot_response = input("Plot? (y/n): ")
-    if plot_response.lower() == 'y':
-        # Extract dates and ridership numbers
-        station_1_dates = [entry[0] for entry in station_1_data]
-        station_1_ridership = [entry[1] for entry in station_1_data]
-
-        station_2_dates = [entry[0] for entry in station_2_data]
-        station_2_ridership = [entry[1] for entry in station_2_data]
-
-        # Plot the data
-        plt.figure(figsize=(10, 6))  # Adjust the figure size
-        plt.plot(station_1_dates, station_1_ridership, label=station_1_full_name, marker='o')
-        plt.plot(station_2_dates, station_2_ridership, label=station_2_full_name, marker='x')
-
-        # Customize the plot
-        plt.xlabel('Date')
-        plt.ylabel('Ridership')
-        plt.title(f'Daily Ridership Comparison for {year}')
-        plt.xticks(rotation=45)
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-        plt.show()
-
-# Function to check bounds and find stations within a mile
-
-
-
-def get_stations_within_mile(cursor, latitude, longitude):
-    # Calculate the latitude and longitude boundaries for 1 mile
-    radius = 1  # 1 mile
-    min_latitude = latitude - (radius / 69)
-    max_latitude = latitude + (radius / 69)
-    min_longitude = longitude - (radius / (69 * math.cos(math.radians(latitude))))
-    max_longitude = longitude + (radius / (69 * math.cos(math.radians(latitude))))
-
-    # Query to select stops (or stations) within the specified boundaries
-    query = """
-    SELECT Stop_Name, latitude, longitude FROM Stops
-    WHERE latitude BETWEEN ? AND ?
-    AND longitude BETWEEN ? AND ?
-    """
-    
-    cursor.execute(query, (min_latitude, max_latitude, min_longitude, max_longitude))
-    
-    # Fetching results
-    rows = cursor.fetchall()
-    
-    if rows:
-        print("List of Stations Within a Mile:")
-        x = []
-        y = []
-        for row in rows:
-            print(f"{row[0]} : ({row[1]}, {row[2]})")
-            x.append(row[2])  # longitude
-            y.append(row[1])  # latitude
-
-        # Plot option
-        plot_choice = input("Plot? (y/n) ")
-        if plot_choice.lower() == 'y':
-            plot_stations_on_map(x, y)
-    else:
-        print("No stops found within the specified area.")
-
-def plot_stations_on_map(x, y):
-    image = plt.imread("chicago.png")
-    xydims = [-87.9277, -87.5569, 41.7012, 42.0868]  # area covered by the map
-    plt.imshow(image, extent=xydims)
-    plt.title("Stations within a Mile")
-    plt.plot(x, y, 'ro')  # 'ro' for red points
-    plt.xlim([-87.9277, -87.5569])
-    plt.ylim([41.7012, 42.0868])
-    
-    # Annotate each point with station name
-    for (longitude, latitude) in zip(x, y):
-        plt.annotate(f"({latitude}, {longitude})", (longitude, latitude))
-
-    plt.show()
-
-
-def main():
-    conn = connect_db()
-    cursor = conn.cursor()
-
-   
-
-    # Display general statistics
-    display_statistics(cursor)
-
-    while True:
-        command = input("Please enter a command (1-9,x to exit): ")
-        
-        if command == "1":
-            partial_name = input("Enter partial station name (wildcards _ and %): ")
-            find_stations(cursor, partial_name)
-        
-        elif command == "2":
-            station_name = input("Enter the name of the station you would like to analyze: ")
-            ridership_percentages(cursor, station_name)
-        
-        elif command == "3":
-            weekday_ridership(cursor)
-        
-        elif command == "4":
-            line_color = input("Enter a line color (e.g. Red or Yellow): ")
-            direction = input("Enter a direction (N/S/W/E): ")
-            stops_by_line_color(cursor, line_color, direction)
-        
-        elif command == "5":
-            stops_count_by_color(cursor)
-        
-        elif command == "6":
-            station_name = input("Enter a station name (wildcards _ and %): ")
-            yearly_ridership(cursor, station_name)
-        
-        elif command == "7":  # Monthly ridership
-            monthly_ridership(cursor)
-
-        elif command == "8":  # Daily ridership comparison
-            daily_ridership_comparison(cursor)
-
-        elif command == '9':
-            latitude = float(input("Enter a latitude: "))
-            longitude = float(input("Enter a longitude: "))
-            get_stations_within_mile(cursor, latitude, longitude)
-
-        elif command.lower() == 'x':
-            break
-
-    cursor.close()  # Close the cursor
-    conn.close()    # Close the database connection
-
-if __name__ == "__main__":
-    main()
-
-
+import argparse
+import csv
+import datetime
+import sys
+from collections import deque
+
+import plotting
+from create_cta_database import DuplicateRidershipError, SchemaError
+from cta_analytics import CTAAnalytics, year_range
+from query_cache import QueryCache
+
+# Interactive presenter: every function below asks for input, calls CTAAnalytics and prints
+# or plots the returned results. All SQL lives in cta_analytics.py, and matplotlib is only
+# loaded (by plotting.py) the first time a chart is drawn.
+
+# Where charts go; main() switches this to file output for --plot-dir or headless machines
+plot_output = plotting.PlotOutput()
+# When set (--daily-csv), daily comparisons also stream their full series to this CSV file
+daily_csv_path = None
+
+def display_statistics(analytics):
+    stats = analytics.statistics()
+
+    print("Welcome to CTA L analysis app")
+
+    if stats.num_stations:
+        print(f"General Statistics: # of stations: {stats.num_stations} # of ride entries: {stats.num_entries} date range: {stats.first_date} - {stats.last_date}")
+
+def find_stations(analytics, partial_name):
+    results = analytics.find_stations(partial_name)
+
+    if results:
+        for station in results:
+            print(f"{station.station_id} : {station.name}")
+    else:
+        print("No stations found...")
+        print_suggestions(analytics, partial_name)
+
+def ridership_percentages(analytics, station_name):
+    result = analytics.ridership_percentages(station_name)
+
+    if result.total_riders == 0:
+        print("No data found...")
+        return
+
+    print(f"Percentage of ridership for the {station_name} station:")
+    for share in result.shares:
+        print(f"{share.day_type} ridership: {share.riders:,} ({share.percentage:.2f}%)")
+    print(f"Total ridership: {result.total_riders:,}")
+
+def weekday_ridership(analytics):
+    for share in analytics.weekday_ridership():
+        print(f"{share.station_name} : {share.riders:,} ({share.percentage:.2f}%)")
+
+def stops_by_line_color(analytics, line_color, direction):
+    result = analytics.stops_by_line_color(line_color, direction)
+
+    if not result.line_exists:
+        print(f"**No such line '{line_color}'...")
+        return
+
+    if result.stops:
+        print(f"Stops for the {line_color} line going {direction}:")
+        for stop_name in result.stops:
+            print(stop_name)
+    else:
+        print(f"No stops found for the {line_color} line going {direction}...")
+
+def stops_count_by_color(analytics):
+    for row in analytics.stops_count_by_color():
+        print(f"{row.color} going {row.direction} : {row.count} ({row.percentage:.2f}%)")
+
+def yearly_ridership(analytics, station_name):
+    results = analytics.yearly_ridership(station_name)
+
+    if not results:
+        print("**No station found...")
+        print_suggestions(analytics, station_name)
+        return
+
+    print(f"Yearly Ridership at {station_name}:")
+    for row in results:
+        print(f"{row.year} : {row.riders:,}")
+
+    # Prepare for plotting
+    years = [str(row.year) for row in results]
+    totals = [row.riders for row in results]
+
+    # Prompt to plot data
+    plot_option = input("Plot? (y/n): ")
+    if plot_option.lower() == 'y':
+        plotting.plot_yearly(plot_output, station_name, years, totals)
+
+def print_suggestions(analytics, station_name):
+    # Typo-tolerant hint after a pattern matched nothing
+    suggestions = analytics.suggest_stations(station_name)
+    if suggestions:
+        print(f"Did you mean: {', '.join(suggestions)}?")
+
+def choose_station(analytics, station_name, label=""):
+    # Resolve a wildcard pattern to one station with ridership data, asking the user when
+    # several match. Returns None (after printing why) when nothing was chosen.
+    matching_stations = analytics.match_stations(station_name)
+    suffix = f" for {label}" if label else ""
+
+    if len(matching_stations) == 0:
+        print(f"**No station found for {station_name}" if label else "**No station found...")
+        print_suggestions(analytics, station_name)
+        return None
+    elif len(matching_stations) > 1:
+        print(f"**Multiple stations found{suffix}...")
+        for idx, station in enumerate(matching_stations, start=1):
+            print(f"{idx}: {station.name}")
+
+        choice = input(f"Choose a station number{suffix}: ")
+        if not choice.isdigit() or int(choice) < 1 or int(choice) > len(matching_stations):
+            print("Invalid choice. Exiting...")
+            return None
+
+        return matching_stations[int(choice) - 1]
+    return matching_stations[0]
+
+def monthly_ridership(analytics):
+    station_name = input("Enter a station name (wildcards _ and %): ")
+    year = input("Enter a year: ")
+
+    if not year.strip().isdigit():
+        print("**Invalid year...")
+        return
+    year = year.strip()
+
+    # Handle cases where no station is found or multiple stations are found
+    station = choose_station(analytics, station_name)
+    if station is None:
+        return
+
+    print(f"\nMonthly Ridership at {station.name} for {year}")
+
+    # Monthly ridership for the selected station and year, missing months filled with zeroes
+    results = analytics.monthly_ridership(station.station_id, year)
+    months = [f"{row.month:02d}/{year}" for row in results]  # 01/202X - 12/202X
+    totals = [row.riders for row in results]
+
+    # Print the results for each month
+    for month, total in zip(months, totals):
+        print(f"{month} : {total:,}")
+
+    # Ask the user if they want to plot the results
+    plot_response = input("Plot? (y/n): ")
+    if plot_response.lower() == 'y':
+        # Plotting the data as a simple line chart
+        plotting.plot_monthly(plot_output, station.name, year, months, totals)
+    else:
+        print(f"No data found for {station.name} in {year}.")
+
+
+def parse_period(text):
+    # "2021" is that calendar year, "2021-03-01:2021-06-30" an inclusive date range.
+    # Returns [start, end) ISO dates plus a label, or None when the text is neither.
+    text = text.strip()
+    if text.isdigit():
+        start, end = year_range(text)
+        return start, end, text
+    if ':' in text:
+        first, last = (part.strip() for part in text.split(':', 1))
+        try:
+            start = datetime.date.fromisoformat(first)
+            end = datetime.date.fromisoformat(last)
+        except ValueError:
+            return None
+        if end < start:
+            return None
+        return start.isoformat(), (end + datetime.timedelta(days=1)).isoformat(), f"{first} - {last}"
+    return None
+
+def summarize_daily(rows, num_stations, csv_writer=None):
+    # One streaming pass: keeps only the first and last 5 days per station, optionally copying
+    # every aligned row to a CSV writer on the way through
+    heads = [[] for _ in range(num_stations)]
+    tails = [deque(maxlen=5) for _ in range(num_stations)]
+    for row in rows:
+        if csv_writer is not None:
+            csv_writer.writerow([row.ride_date, *('' if riders is None else riders for riders in row.riders)])
+        for idx, riders in enumerate(row.riders):
+            if riders is None:
+                continue
+            if len(heads[idx]) < 5:
+                heads[idx].append((row.ride_date, riders))
+            tails[idx].append((row.ride_date, riders))
+    return heads, tails
+
+def daily_ridership_comparison(analytics):
+    period = parse_period(input("Year to compare against? "))
+    if period is None:
+        print("**Invalid year...")
+        return
+    start_date, end_date, label = period
+
+    station_names = [
+        input("Enter station 1 (wildcards _ and %): "),
+        input("Enter station 2 (wildcards _ and %): "),
+    ]
+    # Any number of further stations, ended by a blank line
+    while True:
+        station_name = input(f"Enter station {len(station_names) + 1} (wildcards _ and %, blank to compare): ")
+        if not station_name.strip():
+            break
+        station_names.append(station_name)
+
+    stations = []
+    for number, station_name in enumerate(station_names, start=1):
+        station = choose_station(analytics, station_name, f"station {number}")
+        if station is None:
+            return
+        stations.append(station)
+    station_ids = [station.station_id for station in stations]
+
+    # Stream the date-aligned series once for the summary (and the CSV copy, if requested)
+    if daily_csv_path:
+        with open(daily_csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Ride_Date', *(station.name for station in stations)])
+            heads, tails = summarize_daily(analytics.iter_daily_ridership(station_ids, start_date, end_date), len(stations), writer)
+        print(f"Saved daily ridership to {daily_csv_path}")
+    else:
+        heads, tails = summarize_daily(analytics.iter_daily_ridership(station_ids, start_date, end_date), len(stations))
+
+    # Print first 5 and last 5 records for each station
+    for idx, station in enumerate(stations):
+        if idx > 0:
+            print()
+        print(f"Station {idx + 1}: {station.station_id} {station.name}")
+        if heads[idx]:
+            for ride_date, riders in heads[idx]:  # First 5 days
+                print(f"{ride_date} {riders:,}")
+            for ride_date, riders in tails[idx]:  # Last 5 days
+                print(f"{ride_date} {riders:,}")
+        else:
+            print(f"No data found for {station.name} in {label}.")
+
+    # Ask if the user wants to plot the results
+    plot_response = input("Plot? (y/n): ")
+    if plot_response.lower() == 'y':
+        # Second streaming pass straight into the per-station plot series
+        markers = ['o', 'x', 's', '^', 'd', 'v', '*', '+']
+        series = [(station.name, [], [], markers[idx % len(markers)]) for idx, station in enumerate(stations)]
+        for row in analytics.iter_daily_ridership(station_ids, start_date, end_date):
+            for idx, riders in enumerate(row.riders):
+                if riders is not None:
+                    series[idx][1].append(row.ride_date)
+                    series[idx][2].append(riders)
+        plotting.plot_daily_comparison(plot_output, label, series)
+
+def station_comparison_matrix(analytics):
+    # Any number of station patterns; every station a pattern matches joins the comparison
+    period = parse_period(input("Year or date range (YYYY-MM-DD:YYYY-MM-DD) to compare? "))
+    if period is None:
+        print("**Invalid year...")
+        return
+    start_date, end_date, label = period
+
+    patterns = []
+    while True:
+        pattern = input(f"Enter station pattern {len(patterns) + 1} (wildcards _ and %, blank to compare): ")
+        if not pattern.strip():
+            break
+        patterns.append(pattern)
+    if not patterns:
+        return
+
+    # One statement resolves every pattern, one scan loads the whole date x station matrix
+    stations = []
+    seen = set()
+    for pattern, matches in zip(patterns, analytics.match_stations_many(patterns)):
+        if not matches:
+            print(f"**No station with ridership matches '{pattern}'...")
+            print_suggestions(analytics, pattern)
+        for station in matches:
+            if station.station_id not in seen:
+                seen.add(station.station_id)
+                stations.append(station)
+    if len(stations) < 2:
+        print("**At least two stations are needed for a comparison...")
+        return
+
+    matrix = analytics.station_matrix(stations, start_date, end_date)
+    print(f"Comparing {len(stations)} stations for {label}:")
+    for idx, (station, total, mean) in enumerate(zip(stations, matrix.totals(), matrix.daily_means()), start=1):
+        mean_text = "-" if mean != mean else f"{mean:,.0f}"
+        print(f"{idx:>3}. {station.station_id} {station.name}: total {int(total):,}, daily mean {mean_text}")
+
+    print("Correlation of daily ridership:")
+    print("     " + "".join(f"{idx:>7}" for idx in range(1, len(stations) + 1)))
+    for idx, row in enumerate(matrix.correlation(), start=1):
+        print(f"{idx:>3}. " + "".join("      -" if value != value else f"{value:>7.3f}" for value in row))
+
+    if daily_csv_path:
+        matrix.write_csv(daily_csv_path)
+        print(f"Saved daily ridership to {daily_csv_path}")
+
+    plot_response = input("Plot? (y/n): ")
+    if plot_response.lower() == 'y':
+        plotting.plot_station_matrix(plot_output, label, matrix)
+
+def ridership_trends(analytics):
+    # Rolling means, year-over-year change, weekday-adjusted trend and z-score anomalies for one
+    # station pattern or every station, all computed in one pass (see trends.py)
+    pattern = input("Enter a station name (wildcards _ and %, blank for every station): ")
+    period_text = input("Year or date range (YYYY-MM-DD:YYYY-MM-DD, blank for the full history)? ")
+    start_date = end_date = None
+    label = "the full history"
+    if period_text.strip():
+        period = parse_period(period_text)
+        if period is None:
+            print("**Invalid year...")
+            return
+        start_date, end_date, label = period
+    threshold_text = input("Anomaly z-score threshold (default 3): ").strip()
+    try:
+        threshold = float(threshold_text) if threshold_text else 3.0
+    except ValueError:
+        print("**Invalid threshold...")
+        return
+
+    if pattern.strip():
+        stations = analytics.match_stations(pattern)
+        if not stations:
+            print("**No station found...")
+            print_suggestions(analytics, pattern)
+            return
+        table = analytics.trends([station.station_id for station in stations], start_date, end_date)
+    else:
+        table = analytics.trends(start_date=start_date, end_date=end_date)
+    names = dict(analytics.station_catalog.match('%'))
+
+    def show(value, spec=',.0f', suffix=''):
+        return "-" if value is None else format(value, spec) + suffix
+
+    print(f"Ridership trends for {len(table.station_ids)} stations over {label}:")
+    for station_id in table.station_ids[:10]:
+        latest = table.latest(station_id)
+        if latest is None:
+            print(f"{station_id} {names.get(station_id)}: no data")
+            continue
+        print(f"{station_id} {names.get(station_id)} on {latest['date']}: {latest['riders']:,} riders, "
+              f"7-day {show(latest['mean_7'])}, 28-day {show(latest['mean_28'])}, "
+              f"YoY {show(latest['yoy_pct'], '+.1f', '%')}, weekday-adjusted {show(latest['trend'])}")
+    if len(table.station_ids) > 10:
+        print(f"... and {len(table.station_ids) - 10} more stations")
+
+    anomalies = table.anomalies(threshold)
+    print(f"{len(anomalies):,} anomalous days (|z| > {threshold:g})" + (", largest first:" if anomalies else ""))
+    for ride_date, station_id, riders, score in anomalies[:10]:
+        print(f"{ride_date} {names.get(station_id)}: {riders:,} riders, z = {score:+.1f}")
+
+    if daily_csv_path:
+        table.write_csv(daily_csv_path, threshold)
+        print(f"Saved daily trends to {daily_csv_path}")
+
+def line_ridership(analytics):
+    # Ridership by line from per-station totals: every line at once, or month by month for the
+    # stations on one or more lines (a station shared by them counted once)
+    colors_text = input("Enter line colors separated by commas (blank for every line): ")
+    year_text = input("Enter a year (blank for every year): ").strip()
+    day_type = input("Day type W/A/U (blank for every day): ").strip().upper() or None
+    if year_text and not year_text.isdigit():
+        print("**Invalid year...")
+        return
+    if day_type is not None and day_type not in ('W', 'A', 'U'):
+        print("**Invalid day type...")
+        return
+    year = int(year_text) if year_text else None
+    period = year_text or "every year"
+
+    colors = tuple(color.strip() for color in colors_text.split(',') if color.strip())
+    if not colors:
+        split = input("Split stations shared by several lines evenly between them? (y/n): ").lower() == 'y'
+        lines = analytics.line_ridership(year, day_type, split)
+        print(f"Ridership by line for {period}:")
+        for line in lines:
+            print(f"{line.color} Line ({line.num_stations} stations): {line.riders:,.0f} ({line.percentage:.2f}%)")
+        return
+
+    unknown = analytics.line_index.unknown(colors)
+    if unknown:
+        print(f"**No line with color {', '.join(unknown)}...")
+        return
+    label = " + ".join(colors)
+    totals = analytics.line_monthly_ridership(colors, year, day_type)
+    if not totals:
+        print(f"No data found for the {label} Line in {period}.")
+        return
+    print(f"Monthly Ridership on the {label} Line for {period}:")
+    for row in totals:
+        print(f"{row.month:02d}/{row.year} : {row.riders:,}")
+
+    plot_response = input("Plot? (y/n): ")
+    if plot_response.lower() == 'y':
+        plotting.plot_monthly(plot_output, f"the {label} Line", period,
+                              [f"{row.month:02d}/{row.year}" for row in totals], [row.riders for row in totals])
+
+def ridership_distribution(analytics):
+    # Median, p90 and p99 of daily riders per day type for every station a pattern matches,
+    # merged from the monthly quantile sketches (within 1%) or computed exactly from every row
+    station_name = input("Enter a station pattern (wildcards _ and %, blank for every station): ")
+    period_text = input("Year or date range (YYYY-MM-DD:YYYY-MM-DD, blank for all data)? ")
+    if period_text.strip():
+        period = parse_period(period_text)
+        if period is None:
+            print("**Invalid year...")
+            return
+        start_date, end_date, label = period
+    else:
+        start_date, end_date, label = None, None, "all data"
+
+    station_ids = None
+    group = "every station"
+    if station_name.strip():
+        stations = analytics.match_stations(station_name)
+        if not stations:
+            print("**No station found...")
+            print_suggestions(analytics, station_name)
+            return
+        station_ids = tuple(station.station_id for station in stations)
+        group = stations[0].name if len(stations) == 1 else f"{len(stations)} stations matching '{station_name}'"
+    exact = input("Exact percentiles (slower)? (y/n): ").lower() == 'y'
+
+    distributions = analytics.ridership_distribution(station_ids, start_date, end_date, exact=exact)
+    if not distributions:
+        print(f"No data found for {group} in {label}.")
+        return
+    print(f"Daily riders for {group}, {label}" + ("" if exact else " (within 1%)") + ":")
+    for distribution in distributions:
+        median, p90, p99 = distribution.riders
+        print(f"{distribution.day_type} ridership ({distribution.num_days:,} days): "
+              f"median {median:,.0f}, p90 {p90:,.0f}, p99 {p99:,.0f}")
+
+def get_stations_within_mile(analytics, latitude, longitude, radius=1):
+    # Exact haversine distance, nearest first
+    rows = analytics.stations_within(latitude, longitude, radius)
+
+    if rows:
+        print("List of Stations Within a Mile:" if radius == 1 else f"List of Stations Within {radius} Miles:")
+        x = []
+        y = []
+        for stop in rows:
+            print(f"{stop.stop_name} : ({stop.latitude}, {stop.longitude})")
+            x.append(stop.longitude)
+            y.append(stop.latitude)
+
+        # Plot option
+        plot_choice = input("Plot? (y/n) ")
+        if plot_choice.lower() == 'y':
+            plotting.plot_stations_on_map(plot_output, x, y)
+    else:
+        print("No stops found within the specified area.")
+
+
+def menu(analytics):
+    # Display general statistics
+    display_statistics(analytics)
+
+    while True:
+        command = input("Please enter a command (1-13,x to exit): ")
+
+        if command == "1":
+            partial_name = input("Enter partial station name (wildcards _ and %): ")
+            find_stations(analytics, partial_name)
+
+        elif command == "2":
+            station_name = input("Enter the name of the station you would like to analyze: ")
+            ridership_percentages(analytics, station_name)
+
+        elif command == "3":
+            weekday_ridership(analytics)
+
+        elif command == "4":
+            line_color = input("Enter a line color (e.g. Red or Yellow): ")
+            direction = input("Enter a direction (N/S/W/E): ")
+            stops_by_line_color(analytics, line_color, direction)
+
+        elif command == "5":
+            stops_count_by_color(analytics)
+
+        elif command == "6":
+            station_name = input("Enter a station name (wildcards _ and %): ")
+            yearly_ridership(analytics, station_name)
+
+        elif command == "7":  # Monthly ridership
+            monthly_ridership(analytics)
+
+        elif command == "8":  # Daily ridership comparison
+            daily_ridership_comparison(analytics)
+
+        elif command == '9':
+            latitude = float(input("Enter a latitude: "))
+            longitude = float(input("Enter a longitude: "))
+            get_stations_within_mile(analytics, latitude, longitude)
+
+        elif command == '10':  # Comparison matrix for any number of stations
+            station_comparison_matrix(analytics)
+
+        elif command == '11':  # Rolling, year-over-year and weekday-adjusted trends
+            ridership_trends(analytics)
+
+        elif command == '12':  # Ridership by line color
+            line_ridership(analytics)
+
+        elif command == '13':  # Median, p90 and p99 of daily riders per day type
+            ridership_distribution(analytics)
+
+        elif command.lower() == 'x':
+            break
+
+
+def main(argv=None):
+    global plot_output, daily_csv_path
+
+    parser = argparse.ArgumentParser(description="CTA L analysis app")
+    parser.add_argument('--plot-dir', help="save charts to this directory instead of opening a window")
+    parser.add_argument('--plot-format', choices=['png', 'svg'], default='png', help="file format for saved charts")
+    parser.add_argument('--render-workers', type=int, default=2,
+                        help="processes rendering saved charts in the background; 0 renders before returning (default: 2)")
+    parser.add_argument('--daily-csv', help="write the full series of each daily comparison to this CSV file")
+    parser.add_argument('--profile', action='store_true', help="time every query and print a summary on exit")
+    parser.add_argument('--profile-out', help="also write one JSON line per analysis call to this file")
+    parser.add_argument('--backend', choices=['sqlite', 'columnar'], default='sqlite',
+                        help="answer ridership analyses with SQL or from in-memory NumPy columns (default: sqlite)")
+    parser.add_argument('--slow-ms', type=float, default=100.0, help="report analyses slower than this while profiling (default: 100)")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="run the JSON-lines commands in FILE ('-' for stdin) instead of prompting; see batch.py")
+    parser.add_argument('--batch-out', metavar='FILE', help="write batch results to FILE instead of stdout")
+    parser.add_argument('--statement-cache', type=int, default=512,
+                        help="prepared statements kept on the connection (default: 512)")
+    parser.add_argument('--migrate', action='store_true',
+                        help="upgrade an older cta_database.db to the current schema first (it is backed up first)")
+    args = parser.parse_args(argv)
+    plot_output = plotting.PlotOutput(args.plot_dir, args.plot_format)
+    if plot_output.to_file and args.render_workers > 0:
+        # Charts are queued and the prompt comes straight back; exit waits for them
+        plot_output.renderer = plotting.ChartRenderer(args.render_workers)
+    daily_csv_path = args.daily_csv
+
+    analytics_class = CTAAnalytics
+    if args.backend == 'columnar':
+        # numpy is only imported when the columnar backend is asked for
+        from columnar import ColumnarAnalytics
+        analytics_class = ColumnarAnalytics
+    try:
+        analytics = analytics_class.open(cache=QueryCache(), cached_statements=args.statement_cache, migrate=args.migrate)
+    except (SchemaError, DuplicateRidershipError) as e:
+        plot_output.close()
+        sys.exit(str(e))
+
+    profiler = None
+    profile_file = None
+    if args.profile or args.profile_out:
+        import profiling
+        profile_file = open(args.profile_out, 'a') if args.profile_out else None
+        profiler = profiling.profile_analytics(analytics, profile_file, args.slow_ms)
+
+    if args.batch:
+        # JSON commands in, JSON results out, no prompts (see batch.py)
+        import batch
+        batch.run_batch_file(analytics, args.batch, args.batch_out)
+    else:
+        menu(analytics)
+
+    analytics.close()  # Close the database connection
+    plot_output.close()
+
+    if profiler is not None:
+        profiler.print_summary()
+        if profile_file is not None:
+            profile_file.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# Read-only HTTP/JSON service over cta_database.db.
+#
+# Queries run on a bounded pool of read-only SQLite connections in worker threads so the event
+# loop only parses requests and writes responses. Each request is limited by a concurrency
+# semaphore and a timeout; a query that overruns is interrupted with Connection.interrupt().
+# /nearby takes finite coordinates and at most MAX_RADIUS_MILES (50) or MAX_NEAREST (100) stops,
+# checked before the request is queued.
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import math
+import sqlite3
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from create_cta_database import SchemaError, readonly_uri
+from cta_analytics import DB_PATH, CTAAnalytics, connect_db, to_json
+from query_cache import QueryCache
+
+MAX_REQUEST_LINE = 8192
+MAX_HEADERS = 100
+# Upper bounds that keep /nearby cheap; the whole L system fits well inside a 50 mile radius
+MAX_RADIUS_MILES = 50.0
+MAX_NEAREST = 100
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, extra=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.extra = extra or {}
+
+
+def open_readonly(path):
+    conn = sqlite3.connect(readonly_uri(path), uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+class ConnectionPool:
+    # Fixed set of read-only CTAAnalytics instances; a connection is used by one thread at a time
+
+    def __init__(self, path=DB_PATH, size=8, cache=None):
+        # Switch to WAL once, so readers never block on a loader; an outdated schema raises SchemaError
+        conn = connect_db(path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.close()
+
+        self.size = size
+        self.cache = cache
+        self.members = [CTAAnalytics(open_readonly(path), cache) for _ in range(size)]
+        # Stop locations never change while serving; share one spatial index across the pool
+        stop_index = self.members[0].stop_index
+        for analytics in self.members[1:]:
+            analytics._stop_index = stop_index
+
+        self.idle = asyncio.Queue()
+        for analytics in self.members:
+            self.idle.put_nowait(analytics)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=size, thread_name_prefix='cta-db')
+
+    async def run(self, func, *args, timeout=None):
+        analytics = await self.idle.get()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func, analytics, *args)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            # Abort the running statement and answer now. interrupt() cannot stop Python-side
+            # work, so the connection only goes back to the pool once the worker is done with it
+            analytics.conn.interrupt()
+            future.add_done_callback(lambda done: self.release(analytics, done))
+            raise
+        except BaseException:
+            self.idle.put_nowait(analytics)
+            raise
+        self.idle.put_nowait(analytics)
+        return result
+
+    def release(self, analytics, future):
+        # Runs on the event loop when an abandoned call finishes; its outcome is discarded
+        if not future.cancelled():
+            future.exception()
+        self.idle.put_nowait(analytics)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for analytics in self.members:
+            analytics.close()
+
+
+def param(query, name, convert=str, default=None):
+    values = query.get(name)
+    if not values:
+        if default is not None:
+            return default
+        raise HTTPError(400, f"missing parameter '{name}'")
+    try:
+        return convert(values[0])
+    except ValueError:
+        raise HTTPError(400, f"invalid value for '{name}'")
+
+
+def resolve_station(analytics, query):
+    # Either an explicit station_id or a wildcard pattern that must match exactly one station
+    if 'station_id' in query:
+        return param(query, 'station_id', int)
+    matches = analytics.match_stations(param(query, 'station'))
+    if not matches:
+        raise HTTPError(404, "no station found")
+    if len(matches) > 1:
+        raise HTTPError(409, "multiple stations found", {'matches': to_json(matches)})
+    return matches[0].station_id
+
+
+def finite(value):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(value)
+    return number
+
+
+def nearby_params(query):
+    # (latitude, longitude, k, radius), with exactly one of k and radius set
+    latitude = param(query, 'lat', finite)
+    longitude = param(query, 'lon', finite)
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise HTTPError(400, "'lat' or 'lon' out of range")
+    if 'k' in query:
+        k = param(query, 'k', int)
+        if not 1 <= k <= MAX_NEAREST:
+            raise HTTPError(400, f"'k' must be between 1 and {MAX_NEAREST}")
+        return latitude, longitude, k, None
+    radius = param(query, 'radius', finite, 1.0)
+    if not 0 <= radius <= MAX_RADIUS_MILES:
+        raise HTTPError(400, f"'radius' must be between 0 and {MAX_RADIUS_MILES:g} miles")
+    return latitude, longitude, None, radius
+
+
+def nearby(analytics, query):
+    latitude, longitude, k, radius = nearby_params(query)
+    if k is not None:
+        return analytics.nearest_stops(latitude, longitude, k)
+    return analytics.stations_within(latitude, longitude, radius)
+
+
+# path -> function(analytics, query) run on a pooled connection
+ROUTES = {
+    '/stats': lambda a, q: a.statistics(),
+    '/stations': lambda a, q: a.find_stations(param(q, 'name')),
+    '/percentages': lambda a, q: a.ridership_percentages(param(q, 'station')),
+    '/weekday': lambda a, q: a.weekday_ridership(),
+    '/lines/stops': lambda a, q: a.stops_by_line_color(param(q, 'color'), param(q, 'direction')),
+    '/lines/counts': lambda a, q: a.stops_count_by_color(),
+    '/yearly': lambda a, q: a.yearly_ridership(param(q, 'station')),
+    '/monthly': lambda a, q: a.monthly_ridership(resolve_station(a, q), param(q, 'year', int)),
+    '/daily': lambda a, q: a.daily_ridership(resolve_station(a, q), param(q, 'year', int)),
+    '/nearby': nearby,
+}
+
+
+# path -> function(query) run on the event loop before a request takes a slot or a connection,
+# so requests with no upper bound on their cost are rejected up front
+VALIDATORS = {
+    '/nearby': nearby_params,
+}
+
+
+class CTAServer:
+    def __init__(self, pool, max_concurrency=256, request_timeout=5.0):
+        self.pool = pool
+        self.request_timeout = request_timeout
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.served = 0
+
+    async def handle_request(self, method, target):
+        if method != 'GET':
+            raise HTTPError(405, "only GET is supported")
+        url = urlsplit(target)
+        if url.path == '/cache':
+            return self.pool.cache.stats() if self.pool.cache is not None else {}
+        path = url.path.rstrip('/') or '/'
+        handler = ROUTES.get(path)
+        if handler is None:
+            raise HTTPError(404, f"unknown path {url.path}")
+        query = parse_qs(url.query)
+        if path in VALIDATORS:
+            VALIDATORS[path](query)
+
+        deadline = time.monotonic() + self.request_timeout
+        # Waiting for a slot counts against the request's timeout too
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.request_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(503, "server busy")
+        try:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            result = await self.pool.run(handler, query, timeout=remaining)
+        except asyncio.TimeoutError:
+            raise HTTPError(504, "query timed out")
+        finally:
+            self.slots.release()
+        return to_json(result)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                if len(request_line) > MAX_REQUEST_LINE:
+                    await self.respond(writer, 400, {'error': "request line too long"}, keep_alive=False)
+                    break
+
+                headers = {}
+                for _ in range(MAX_HEADERS):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {'error': "malformed request line"}, keep_alive=False)
+                    break
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+                try:
+                    status, body = 200, await self.handle_request(method, target)
+                except HTTPError as e:
+                    status, body = e.status, {'error': e.message, **e.extra}
+                except Exception as e:
+                    status, body = 500, {'error': str(e)}
+
+                self.served += 1
+                await self.respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, body, keep_alive):
+        payload = json.dumps(body).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+
+async def serve(path=DB_PATH, host='127.0.0.1', port=8080, pool_size=8, max_concurrency=256, request_timeout=5.0,
+                cache_size=4096, cache_ttl=300.0):
+    # One cache for the whole pool; cache_size=0 disables it
+    cache = QueryCache(cache_size, cache_ttl) if cache_size > 0 else None
+    pool = ConnectionPool(path, pool_size, cache)
+    app = CTAServer(pool, max_concurrency, request_timeout)
+    server = await asyncio.start_server(app.handle_connection, host, port, backlog=1024)
+    print(f"Serving {path} on http://{host}:{port} ({pool_size} connections)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read-only HTTP/JSON API for the CTA L analysis app")
+    parser.add_argument('--db', default=DB_PATH, help="database file (default: cta_database.db)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pool-size', type=int, default=8, help="read-only connections (default: 8)")
+    parser.add_argument('--max-concurrency', type=int, default=256, help="requests processed at once (default: 256)")
+    parser.add_argument('--timeout', type=float, default=5.0, help="per-request timeout in seconds (default: 5)")
+    parser.add_argument('--cache-size', type=int, default=4096, help="cached query results, 0 to disable (default: 4096)")
+    parser.add_argument('--cache-ttl', type=float, default=300.0, help="seconds a cached result stays valid (default: 300)")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.pool_size, args.max_concurrency, args.timeout,
+                          args.cache_size, args.cache_ttl))
+    except KeyboardInterrupt:
+        pass
+    except SchemaError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
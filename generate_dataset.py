@@ -0,0 +1,166 @@
+# Deterministic synthetic CTA dataset at full scale, for benchmarks.
+#
+# ~150 stations, ~300 stops on every line color and 20+ years of daily ridership (1M+ rows)
+# with weekday/Saturday/Sunday-holiday mixes, seasonality and a 2020 drop. The same seed always
+# produces the same database. Ridership goes through load_ridership.load_files like a real export.
+
+import argparse
+import csv
+import datetime
+import math
+import os
+import random
+import sqlite3
+import tempfile
+
+from create_cta_database import create_tables, migrate_schema
+import load_ridership
+
+LINE_COLORS = ['Red', 'Blue', 'Brown', 'Green', 'Orange', 'Pink', 'Purple', 'Yellow']
+
+STREETS = [
+    'Clark', 'Lake', 'Halsted', 'Sheridan', 'Addison', 'Belmont', 'Fullerton', 'Diversey', 'Armitage',
+    'Division', 'Chicago', 'Grand', 'Monroe', 'Jackson', 'Harrison', 'Roosevelt', 'Cermak', 'Western',
+    'Damen', 'Ashland', 'Racine', 'Pulaski', 'Kedzie', 'California', 'Cicero', 'Central', 'Austin',
+    'Irving Park', 'Montrose', 'Lawrence', 'Argyle', 'Berwyn', 'Bryn Mawr', 'Thorndale', 'Granville',
+    'Loyola', 'Morse', 'Jarvis', 'Howard', 'Wilson', 'Garfield', 'Kostner', 'Laramie', 'Pulaski',
+    'Wellington', 'Southport', 'Paulina', 'Francisco', 'Rockwell', 'Kimball', 'Washington', 'Madison',
+    'Randolph', 'State', 'Wabash', 'Adams', 'Quincy', 'LaSalle', 'Polk', 'Morgan', 'Merchandise Mart',
+]
+
+# US holidays the CTA runs a Sunday schedule on (Type_of_Day 'U')
+def holidays(year):
+    def nth_weekday(month, weekday, n):
+        day = datetime.date(year, month, 1)
+        day += datetime.timedelta(days=(weekday - day.weekday()) % 7)
+        return day + datetime.timedelta(weeks=n - 1)
+
+    def last_weekday(month, weekday):
+        day = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
+        return day - datetime.timedelta(days=(day.weekday() - weekday) % 7)
+
+    return {
+        datetime.date(year, 1, 1),
+        last_weekday(5, 0),          # Memorial Day
+        datetime.date(year, 7, 4),
+        nth_weekday(9, 0, 1),        # Labor Day
+        nth_weekday(11, 3, 4),       # Thanksgiving
+        datetime.date(year, 12, 25),
+    }
+
+
+def day_type(day, holiday_set):
+    if day in holiday_set or day.weekday() == 6:
+        return 'U'
+    if day.weekday() == 5:
+        return 'A'
+    return 'W'
+
+
+def station_names(rng, count):
+    names = []
+    seen = set()
+    streets = sorted(set(STREETS))
+    for street in streets:
+        if len(names) >= count:
+            break
+        names.append(street)
+        seen.add(street)
+    while len(names) < count:
+        name = f"{rng.choice(streets)}/{rng.choice(streets)}"
+        if name not in seen and name.split('/')[0] != name.split('/')[1]:
+            names.append(name)
+            seen.add(name)
+    return names
+
+
+def build_reference_tables(conn, rng, num_stations):
+    cursor = conn.cursor()
+    names = station_names(rng, num_stations)
+    cursor.executemany("INSERT INTO Stations (Station_ID, Station_Name) VALUES (?, ?)", list(enumerate(names, start=1)))
+    cursor.executemany("INSERT INTO Lines (Line_ID, Color) VALUES (?, ?)", list(enumerate(LINE_COLORS, start=1)))
+
+    # Two platforms per station in opposite directions, scattered over the map area
+    stops = []
+    stop_details = []
+    stop_id = 1
+    for station_id in range(1, num_stations + 1):
+        latitude = rng.uniform(41.72, 42.07)
+        longitude = rng.uniform(-87.90, -87.60)
+        directions = rng.choice([('N', 'S'), ('E', 'W')])
+        lines = rng.sample(range(1, len(LINE_COLORS) + 1), rng.choice([1, 1, 1, 2, 3]))
+        for direction in directions:
+            stops.append((stop_id, station_id, f"{names[station_id - 1]} ({direction}bound)", direction,
+                          rng.choice([0, 1]), round(latitude + rng.uniform(-0.0003, 0.0003), 6),
+                          round(longitude + rng.uniform(-0.0003, 0.0003), 6)))
+            stop_details.extend((stop_id, line_id) for line_id in lines)
+            stop_id += 1
+
+    cursor.executemany("INSERT INTO Stops (Stop_ID, Station_ID, Stop_Name, Direction, ADA, Latitude, Longitude) VALUES (?, ?, ?, ?, ?, ?, ?)", stops)
+    cursor.executemany("INSERT INTO StopDetails (Stop_ID, Line_ID) VALUES (?, ?)", stop_details)
+    conn.commit()
+    cursor.close()
+    return names
+
+
+def write_ridership_csv(path, rng, names, start, end):
+    # Per-station base volume is log-normal: a few very busy downtown stations, a long tail
+    base = [rng.lognormvariate(8.0, 0.8) for _ in names]
+    factors = {'W': 1.0, 'A': 0.55, 'U': 0.4}
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['station_id', 'stationname', 'date', 'daytype', 'rides'])
+        day = start
+        holiday_set = holidays(day.year)
+        while day <= end:
+            if day.month == 1 and day.day == 1:
+                holiday_set = holidays(day.year)
+            kind = day_type(day, holiday_set)
+            season = 1.0 + 0.12 * math.sin(2 * math.pi * (day.timetuple().tm_yday - 100) / 365.25)
+            trend = 1.0 + 0.01 * (day.year - start.year)
+            if datetime.date(2020, 3, 15) <= day <= datetime.date(2021, 6, 30):
+                trend *= 0.35
+            scale = factors[kind] * season * trend
+            date_text = f"{day.month:02d}/{day.day:02d}/{day.year}"
+            for index, name in enumerate(names):
+                riders = max(0, int(base[index] * scale * rng.gauss(1.0, 0.08)))
+                writer.writerow([40000 + index, name, date_text, kind, riders])
+                rows += 1
+            day += datetime.timedelta(days=1)
+    return rows
+
+
+def generate(path, seed=2024, num_stations=150, start_year=2001, end_year=2024):
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+
+    conn = sqlite3.connect(path)
+    create_tables(conn.cursor())
+    conn.commit()
+    migrate_schema(conn)
+    names = build_reference_tables(conn, rng, num_stations)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'ridership.csv')
+        rows = write_ridership_csv(csv_path, rng, names, datetime.date(start_year, 1, 1), datetime.date(end_year, 12, 31))
+        print(f"Generated {rows:,} ridership rows for {num_stations} stations")
+        load_ridership.load_files(conn, [csv_path])
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic full-scale CTA database for benchmarks")
+    parser.add_argument('--db', default='cta_database_bench.db', help="output database (default: cta_database_bench.db)")
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--stations', type=int, default=150)
+    parser.add_argument('--start-year', type=int, default=2001)
+    parser.add_argument('--end-year', type=int, default=2024)
+    args = parser.parse_args(argv)
+
+    generate(args.db, args.seed, args.stations, args.start_year, args.end_year)
+
+
+if __name__ == "__main__":
+    main()
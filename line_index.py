@@ -0,0 +1,93 @@
+# Station <-> line membership for line-level ridership.
+#
+# Built once from Stops, StopDetails and Lines (a few hundred rows). Each line is identified by
+# its case-normalized color (Lines.Color_Key), so several Lines rows of one color are one line,
+# and owns one bit; every station gets a bitmask of the lines stopping there, overall and per
+# direction. Line ridership is then summed from per-station rollup totals without joining back
+# to Ridership: a station shared by several lines is counted once in any union of them, and in
+# per-line tables either in full for every line it serves or split evenly between them.
+
+from station_catalog import fold
+
+LINES_SQL = """
+    SELECT Color_Key, Color FROM Lines ORDER BY Line_ID
+"""
+
+MEMBERSHIP_SQL = """
+    SELECT DISTINCT s.Station_ID, s.Direction, l.Color_Key
+    FROM Stops s
+    JOIN StopDetails sd ON sd.Stop_ID = s.Stop_ID
+    JOIN Lines l ON l.Line_ID = sd.Line_ID
+    WHERE s.Station_ID IS NOT NULL
+"""
+
+
+def color_key(color):
+    # Same normalization as the Lines.Color_Key column: LOWER(TRIM(Color)), ASCII only
+    return fold(color.strip())
+
+
+class LineIndex:
+    def __init__(self, lines, memberships, version=None):
+        # lines: (Color_Key, Color) in Line_ID order; memberships: (Station_ID, Direction, Color_Key)
+        self.version = version
+        self.keys = []
+        self.colors = {}  # key -> color as first written in Lines
+        for key, color in lines:
+            if key not in self.colors:
+                self.keys.append(key)
+                self.colors[key] = color
+        self.bits = {key: 1 << idx for idx, key in enumerate(self.keys)}
+        self.station_masks = {}
+        self.direction_masks = {}  # direction -> {Station_ID: mask}
+        for station_id, direction, key in memberships:
+            bit = self.bits[key]
+            self.station_masks[station_id] = self.station_masks.get(station_id, 0) | bit
+            masks = self.direction_masks.setdefault(direction, {})
+            masks[station_id] = masks.get(station_id, 0) | bit
+
+    @classmethod
+    def from_cursor(cls, cursor, version=None):
+        lines = cursor.execute(LINES_SQL).fetchall()
+        return cls(lines, cursor.execute(MEMBERSHIP_SQL).fetchall(), version)
+
+    def mask(self, colors):
+        # Bitmask of the given colors (any case); unknown colors contribute nothing
+        mask = 0
+        for color in colors:
+            mask |= self.bits.get(color_key(color), 0)
+        return mask
+
+    def unknown(self, colors):
+        return [color for color in colors if color_key(color) not in self.bits]
+
+    def stations(self, colors, direction=None, match_all=False):
+        # Station_IDs served by any (or, with match_all, every) given line, in the given
+        # direction if one is named, in Station_ID order
+        wanted = self.mask(colors)
+        if not wanted:
+            return []
+        masks = self.station_masks if direction is None else self.direction_masks.get(direction.strip().upper(), {})
+        if match_all:
+            return sorted(station_id for station_id, mask in masks.items() if mask & wanted == wanted)
+        return sorted(station_id for station_id, mask in masks.items() if mask & wanted)
+
+    def lines_of(self, station_id):
+        mask = self.station_masks.get(station_id, 0)
+        return [self.colors[key] for key in self.keys if mask & self.bits[key]]
+
+    def line_totals(self, station_totals, split=False):
+        # station_totals: {Station_ID: riders}. Returns {key: (stations, riders)} for every line;
+        # with split a shared station's riders are divided evenly between its lines, so the line
+        # totals add up to the riders of every station on a line
+        totals = {key: [0, 0] for key in self.keys}
+        for station_id, riders in station_totals.items():
+            mask = self.station_masks.get(station_id, 0)
+            if not mask:
+                continue
+            share = riders / bin(mask).count('1') if split else riders
+            for key in self.keys:
+                if mask & self.bits[key]:
+                    totals[key][0] += 1
+                    totals[key][1] += share
+        return {key: (stations, riders) for key, (stations, riders) in totals.items()}
@@ -0,0 +1,402 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # resource is not available on Windows
+    resource = None
+
+from create_cta_database import bump_data_version, create_tables, migrate_schema, update_load_state
+from partitions import drop_partitions, remove_file
+from rollups import create_rollup_triggers, drop_rollup_triggers, rebuild_rollups, refresh_rollups
+
+# Rows handed to executemany at a time; the file itself is never read whole
+CHUNK_SIZE = 50000
+# Rows per transaction; large transactions keep the journal overhead down
+COMMIT_EVERY = 1000000
+
+# Column names used by the official CTA "L" Station Entries - Daily Totals export
+CSV_COLUMNS = {
+    'station_name': ('stationname', 'station_name', 'Station_Name'),
+    'date': ('date', 'ride_date', 'Ride_Date'),
+    'day_type': ('daytype', 'day_type', 'Type_of_Day'),
+    'rides': ('rides', 'num_riders', 'Num_Riders'),
+}
+
+INSERT_RIDERSHIP = "INSERT INTO Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day) VALUES (?, ?, ?, ?)"
+
+# Only touches the stored row when the corrected values actually differ
+UPSERT_RIDERSHIP = """
+    INSERT INTO Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day) VALUES (?, ?, ?, ?)
+    ON CONFLICT (Station_ID, Ride_Date) DO UPDATE
+    SET Num_Riders = excluded.Num_Riders, Type_of_Day = excluded.Type_of_Day
+    WHERE Num_Riders IS NOT excluded.Num_Riders OR Type_of_Day IS NOT excluded.Type_of_Day
+"""
+
+
+DAY_TYPES = ('W', 'A', 'U')
+
+
+class LoadError(ValueError):
+    # A row that cannot be loaded, with where it came from
+    def __init__(self, path, line, message):
+        super().__init__(f"{path}:{line}: {message}")
+        self.path = path
+        self.line = line
+
+
+def normalize_date(value):
+    # The CTA exports use MM/DD/YYYY, the database stores sortable YYYY-MM-DD
+    value = value.strip()
+    if '/' in value:
+        month, day, year = value.split(' ')[0].split('/')
+        return f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
+    return value[:10]
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def tune_for_bulk_load(conn):
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")  # 256 MB page cache
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def restore_after_bulk_load(conn):
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -2000")
+
+
+def drop_ridership_indexes(conn):
+    # Remember the index definitions so they can be rebuilt once after the load
+    indexes = conn.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = 'Ridership' AND sql IS NOT NULL
+    """).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return indexes
+
+
+def rebuild_indexes(conn, indexes):
+    existing = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    for name, sql in indexes:
+        if name in existing:
+            continue
+        try:
+            conn.execute(sql)
+        except sqlite3.IntegrityError:
+            # The load repeated a (station, day); keep the last row read, as an upsert would
+            conn.execute("""
+                DELETE FROM Ridership
+                WHERE Ride_ID NOT IN (SELECT MAX(Ride_ID) FROM Ridership GROUP BY Station_ID, Ride_Date)
+            """)
+            conn.execute(sql)
+
+
+def load_station_map(conn):
+    # Station_Name -> Station_ID, the lowest id wins when a name is duplicated
+    station_map = {}
+    for station_id, station_name in conn.execute("SELECT Station_ID, Station_Name FROM Stations ORDER BY Station_ID"):
+        station_map.setdefault(station_name, station_id)
+    return station_map
+
+
+def resolve_station(conn, station_map, station_name):
+    station_id = station_map.get(station_name)
+    if station_id is None:
+        cursor = conn.execute("INSERT INTO Stations (Station_Name) VALUES (?)", (station_name,))
+        station_id = cursor.lastrowid
+        station_map[station_name] = station_id
+    return station_id
+
+
+def find_column(header, names):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    raise ValueError(f"Missing column, expected one of: {', '.join(names)}")
+
+
+def iter_csv_chunks(path, chunk_size=CHUNK_SIZE):
+    # Yields lists of (station_name, date, day_type, rides, line number) without reading the
+    # whole file
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [column.strip() for column in next(reader)]
+        positions = [find_column(header, CSV_COLUMNS[key]) for key in ('station_name', 'date', 'day_type', 'rides')]
+
+        chunk = []
+        for row in reader:
+            if not row:
+                continue
+            if len(row) <= max(positions):
+                raise LoadError(path, reader.line_num, f"expected {len(header)} columns, found {len(row)}")
+            chunk.append(tuple(row[i] for i in positions) + (reader.line_num,))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def iter_parquet_chunks(path, chunk_size=CHUNK_SIZE):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Loading Parquet files requires pyarrow (pip install pyarrow)")
+
+    parquet_file = pq.ParquetFile(path)
+    header = parquet_file.schema_arrow.names
+    columns = [header[find_column(header, CSV_COLUMNS[key])] for key in ('station_name', 'date', 'day_type', 'rides')]
+
+    # Row numbers stand in for line numbers
+    row_number = 1
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        values = [batch.column(i).to_pylist() for i in range(len(columns))]
+        yield [(name, str(date), day_type, rides, row_number + offset)
+               for offset, (name, date, day_type, rides) in enumerate(zip(*values))]
+        row_number += batch.num_rows
+
+
+def iter_chunks(path, chunk_size=CHUNK_SIZE):
+    if path.lower().endswith('.parquet'):
+        return iter_parquet_chunks(path, chunk_size)
+    return iter_csv_chunks(path, chunk_size)
+
+
+def archived_year_set(conn):
+    # Years moved into read-only partition files (partitions.py), as 'YYYY' strings
+    return {f"{year:04d}" for year, in conn.execute("SELECT Ride_Year FROM RidershipPartitions")}
+
+
+def without_archived(rows, archived):
+    # Rows for archived years cannot be written; returns (kept rows, number skipped)
+    if not archived:
+        return rows, 0
+    kept = [row for row in rows if row[1][:4] not in archived]
+    return kept, len(rows) - len(kept)
+
+
+def report_archived(skipped):
+    if skipped:
+        print(f"Skipped {skipped:,} rows in archived years; unarchive a year with partitions.py to change it")
+
+
+def prepare_rows(conn, station_map, chunk, path):
+    rows = []
+    for station_name, date, day_type, rides, line in chunk:
+        try:
+            row = (station_name.strip(), normalize_date(date), int(rides), day_type.strip().upper())
+        except (AttributeError, TypeError, ValueError) as e:
+            raise LoadError(path, line, f"invalid row ({e})") from None
+        if row[3] not in DAY_TYPES:
+            raise LoadError(path, line, f"invalid day type {day_type!r}")
+        rows.append((resolve_station(conn, station_map, row[0]),) + row[1:])
+    return rows
+
+
+def finish_load(conn, indexes):
+    # Indexes are built once over the loaded data instead of being maintained row by row
+    rebuild_indexes(conn, indexes)
+    update_load_state(conn.cursor())
+    rebuild_rollups(conn.cursor())
+    create_rollup_triggers(conn.cursor())
+    # Invalidates every cached query result computed before this load
+    bump_data_version(conn.cursor())
+
+
+def load_files(conn, paths, replace=False, chunk_size=CHUNK_SIZE, commit_every=COMMIT_EVERY):
+    # Transactions are managed explicitly below
+    conn.isolation_level = None
+    create_tables(conn.cursor())
+    migrate_schema(conn)
+
+    tune_for_bulk_load(conn)
+    start = time.perf_counter()
+    total_rows = 0
+
+    conn.execute("BEGIN")
+    indexes = drop_ridership_indexes(conn)
+    # Per-row rollup triggers would dominate a bulk load; the rollups are rebuilt once at the end
+    drop_rollup_triggers(conn.cursor())
+    dropped_partitions = []
+    if replace:
+        conn.execute("DELETE FROM Ridership")
+        dropped_partitions = drop_partitions(conn.cursor())
+    archived = archived_year_set(conn)
+
+    station_map = load_station_map(conn)
+    uncommitted = 0
+    committed_rows = 0
+    committed = False
+    skipped = 0
+    try:
+        for path in paths:
+            for chunk in iter_chunks(path, chunk_size):
+                rows, skipped_rows = without_archived(prepare_rows(conn, station_map, chunk, path), archived)
+                skipped += skipped_rows
+                conn.executemany(INSERT_RIDERSHIP, rows)
+                total_rows += len(rows)
+                uncommitted += len(rows)
+                if uncommitted >= commit_every:
+                    conn.commit()
+                    committed = True
+                    committed_rows = total_rows
+                    conn.execute("BEGIN")
+                    uncommitted = 0
+    except BaseException:
+        conn.rollback()
+        if committed:
+            # Earlier transactions are kept; the indexes, triggers and rollups they dropped are
+            # rebuilt around them so the database is usable again
+            conn.execute("BEGIN")
+            finish_load(conn, indexes)
+            conn.commit()
+            for partition_path in dropped_partitions:
+                remove_file(partition_path)
+            print(f"Load stopped early; kept the {committed_rows:,} rows committed before the error")
+        # Otherwise the rollback alone restored everything, indexes and triggers included
+        restore_after_bulk_load(conn)
+        raise
+
+    finish_load(conn, indexes)
+    conn.commit()
+    restore_after_bulk_load(conn)
+    # The replaced history no longer refers to them
+    for partition_path in dropped_partitions:
+        remove_file(partition_path)
+
+    elapsed = time.perf_counter() - start
+    report_load(total_rows, elapsed)
+    report_archived(skipped)
+    return total_rows
+
+
+def load_high_water_marks(conn):
+    return dict(conn.execute("SELECT Station_ID, Last_Ride_Date FROM LoadState"))
+
+
+def save_high_water_marks(conn, high_water_marks, station_ids):
+    conn.executemany("""
+        INSERT INTO LoadState (Station_ID, Last_Ride_Date) VALUES (?, ?)
+        ON CONFLICT (Station_ID) DO UPDATE SET Last_Ride_Date = MAX(Last_Ride_Date, excluded.Last_Ride_Date)
+    """, [(station_id, high_water_marks[station_id]) for station_id in station_ids])
+
+
+def append_files(conn, paths, chunk_size=CHUNK_SIZE):
+    # Incremental load: days after a station's high-water mark are appended, earlier days are
+    # treated as corrections and only rewritten when they differ from what is stored.
+    # Returns the set of (Station_ID, 'YYYY-MM') ranges whose data (and rollups) changed.
+    conn.isolation_level = None
+    create_tables(conn.cursor())
+    migrate_schema(conn)
+
+    start = time.perf_counter()
+    appended = 0
+    updated = 0
+    affected = set()
+    touched_stations = set()
+
+    conn.execute("BEGIN")
+    # Rollups are refreshed once per affected station-month below instead of once per row
+    drop_rollup_triggers(conn.cursor())
+    station_map = load_station_map(conn)
+    high_water_marks = load_high_water_marks(conn)
+    archived = archived_year_set(conn)
+    skipped = 0
+
+    try:
+        for path in paths:
+            for chunk in iter_chunks(path, chunk_size):
+                rows, skipped_rows = without_archived(prepare_rows(conn, station_map, chunk, path), archived)
+                skipped += skipped_rows
+                new_rows = []
+                for row in rows:
+                    station_id, ride_date = row[0], row[1]
+                    last_date = high_water_marks.get(station_id)
+                    if last_date is None or ride_date > last_date:
+                        new_rows.append(row)
+                    elif conn.execute(UPSERT_RIDERSHIP, row).rowcount:
+                        updated += 1
+                        affected.add((station_id, ride_date[:7]))
+
+                # New days go through the upsert too so a file repeating a day stays idempotent
+                conn.executemany(UPSERT_RIDERSHIP, new_rows)
+                appended += len(new_rows)
+                for station_id, ride_date, _, _ in new_rows:
+                    affected.add((station_id, ride_date[:7]))
+                    touched_stations.add(station_id)
+
+                # Marks advance per chunk, so a later chunk repeating a day is treated as a correction
+                for station_id, ride_date, _, _ in new_rows:
+                    if ride_date > high_water_marks.get(station_id, ''):
+                        high_water_marks[station_id] = ride_date
+
+        save_high_water_marks(conn, high_water_marks, touched_stations)
+        refresh_rollups(conn.cursor(), affected)
+        create_rollup_triggers(conn.cursor())
+        if affected:
+            bump_data_version(conn.cursor())
+        conn.commit()
+    except BaseException:
+        # One transaction: the rollback also restores the dropped triggers
+        conn.rollback()
+        raise
+
+    elapsed = time.perf_counter() - start
+    print(f"Appended {appended:,} new rows, updated {updated:,} corrected rows "
+          f"across {len(affected):,} station-months in {elapsed:.2f}s")
+    report_archived(skipped)
+    return affected
+
+
+def report_load(total_rows, elapsed):
+    rate = total_rows / elapsed if elapsed > 0 else 0
+    print(f"Loaded {total_rows:,} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"Peak memory: {peak:,.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream CTA daily ridership exports into the Ridership table")
+    parser.add_argument('files', nargs='+', help="CSV or Parquet exports to load")
+    parser.add_argument('--db', default='cta_database.db', help="database file (default: cta_database.db)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--replace', action='store_true', help="delete existing ridership rows before loading")
+    mode.add_argument('--append', action='store_true', help="incrementally add new days and apply corrections")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="rows read per chunk")
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        if not os.path.exists(path):
+            parser.error(f"No such file: {path}")
+
+    conn = sqlite3.connect(args.db, isolation_level=None, uri=True)
+    try:
+        if args.append:
+            append_files(conn, args.files, chunk_size=args.chunk_size)
+        else:
+            load_files(conn, args.files, replace=args.replace, chunk_size=args.chunk_size)
+    except LoadError as e:
+        sys.exit(f"Load failed: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
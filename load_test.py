@@ -0,0 +1,89 @@
+# Local load generator for cta_server.py: many concurrent keep-alive clients replaying a mix of
+# API requests, reporting throughput, latency percentiles and non-200 responses.
+
+import argparse
+import asyncio
+import itertools
+import time
+
+DEFAULT_PATHS = [
+    '/stats',
+    '/stations?name=%25Clark%25',
+    '/percentages?station=Clark/Lake',
+    '/weekday',
+    '/lines/stops?color=Red&direction=N',
+    '/lines/counts',
+    '/yearly?station=Clark%25',
+    '/nearby?lat=41.8781&lon=-87.6298&radius=1',
+    '/nearby?lat=41.8781&lon=-87.6298&k=5',
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def client(host, port, paths, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path in paths:
+            if time.monotonic() >= deadline:
+                break
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run(host, port, concurrency, duration, paths):
+    latencies = []
+    statuses = {}
+    deadline = time.monotonic() + duration
+    start = time.perf_counter()
+    # Each client cycles through the request mix from a different starting point
+    await asyncio.gather(*[
+        client(host, port, itertools.islice(itertools.cycle(paths), i, None), deadline, latencies, statuses)
+        for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(latencies):,} requests in {elapsed:.2f}s with {concurrency} clients ({len(latencies) / elapsed:,.0f} req/s)")
+    print(f"latency p50 {percentile(latencies, 0.50) * 1000:.2f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print("status counts:", dict(sorted(statuses.items())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running cta_server.py")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--concurrency', type=int, default=200, help="concurrent clients (default: 200)")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run (default: 10)")
+    parser.add_argument('paths', nargs='*', help="request paths to replay (default: a mix of every endpoint)")
+    args = parser.parse_args(argv)
+
+    asyncio.run(run(args.host, args.port, args.concurrency, args.duration, args.paths or DEFAULT_PATHS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+# Year partitions of Ridership in read-only side files.
+#
+# archive_years() moves every year before a cutoff out of Ridership into its own compact file,
+# <db>.partitions/ridership_<year>.db, which is then made read-only. The main file keeps the
+# rollups for those years (RidershipMonthly, and PartitionStationStats folded into StationStats),
+# so yearly, monthly and day-type totals never open a partition, and loads, vacuums and backups
+# of the main file only touch the years still being written.
+#
+# Queries that need raw daily rows go through PartitionRouter, which ATTACHes only the years a
+# date range covers. Ranges spanning several sources read a UNION ALL view, RidershipHistory;
+# SQLite allows 10 attached databases, so whole-history scans run in windows of MAX_ATTACHED years.
+#
+#   python partitions.py archive --before 2020   # every year up to 2019 into its own file
+#   python partitions.py list
+#   python partitions.py unarchive --year 2015   # back into Ridership, e.g. to correct it
+
+import argparse
+import os
+import re
+import sqlite3
+import stat
+
+from create_cta_database import bump_data_version, migrate_schema, readonly_uri
+from rollups import create_rollup_triggers, drop_rollup_triggers
+
+# Partitions attached to one connection at a time, leaving room for two more ATTACHes
+MAX_ATTACHED = 8
+PARTITION_SCHEMA = re.compile(r'ridership_\d+')
+# Date bounds of an unbounded scan
+MIN_DATE = '0000-01-01'
+MAX_DATE = '9999-12-31'
+
+PARTITION_TABLE_SQL = """
+    CREATE TABLE {schema}.Ridership (
+        Station_ID INTEGER NOT NULL,
+        Ride_Date TEXT NOT NULL,
+        Num_Riders INTEGER,
+        Type_of_Day TEXT,
+        PRIMARY KEY (Station_ID, Ride_Date)
+    ) WITHOUT ROWID
+"""
+
+# Years in the rollups that are still in Ridership
+ARCHIVABLE_YEARS_SQL = """
+    SELECT DISTINCT Ride_Year FROM RidershipMonthly
+    WHERE Ride_Year < ? AND Ride_Year NOT IN (SELECT Ride_Year FROM RidershipPartitions)
+    ORDER BY Ride_Year
+"""
+
+
+def partition_dir(conn):
+    # Directory next to the main database file; None for in-memory and temporary databases
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == 'main':
+            return f"{path}.partitions" if path else None
+    return None
+
+
+def partition_schema(year):
+    return f"ridership_{int(year)}"
+
+
+def attach_readonly(conn, path, schema):
+    # Attaches a partition through its mode=ro URI. URIs are only understood on connections
+    # opened with uri=True (connect_db does) or by SQLite builds with SQLITE_USE_URI; elsewhere
+    # SQLite takes the URI as a plain file name and creates that file, which is undone here
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (readonly_uri(path),))
+    attached = {name: file for _, name, file in conn.execute("PRAGMA database_list")}.get(schema)
+    if attached and os.path.realpath(attached) == os.path.realpath(path):
+        return
+    conn.execute(f"DETACH DATABASE {schema}")
+    if attached:
+        remove_file(attached)
+    raise RuntimeError("Partitions can only be attached on a connection opened with uri=True (see connect_db)")
+
+
+def archived_years(conn):
+    # {year: partition file path}
+    directory = partition_dir(conn)
+    rows = conn.execute("SELECT Ride_Year, File FROM RidershipPartitions ORDER BY Ride_Year").fetchall()
+    return {year: os.path.join(directory or '', file) for year, file in rows}
+
+
+def year_bounds(start_date, end_date):
+    # First and last calendar year touched by start_date <= day < end_date
+    last_year = int(end_date[:4])
+    if end_date[5:] <= '01-01':
+        last_year -= 1
+    return int(start_date[:4]), last_year
+
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+        os.remove(path)
+
+
+def archive_year(conn, directory, year):
+    file = f"{partition_schema(year)}.db"
+    path = os.path.join(directory, file)
+    remove_file(path)  # left over from an interrupted archive, never registered
+    start_date, end_date = f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+
+    conn.execute("ATTACH DATABASE ? AS partition_new", (path,))
+    try:
+        # The partition is written and committed first; until the main file registers it below
+        # it is just a stray file, so a crash in between loses nothing
+        conn.execute("BEGIN")
+        conn.execute(PARTITION_TABLE_SQL.format(schema='partition_new'))
+        conn.execute("""
+            INSERT INTO partition_new.Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day)
+            SELECT Station_ID, Ride_Date, Num_Riders, Type_of_Day
+            FROM main.Ridership
+            WHERE Ride_Date >= ? AND Ride_Date < ?
+            ORDER BY Station_ID, Ride_Date
+        """, (start_date, end_date))
+        conn.execute("COMMIT")
+
+        conn.execute("BEGIN")
+        conn.execute("""
+            INSERT INTO PartitionStationStats (Station_ID, Ride_Year, Num_Entries, First_Date, Last_Date)
+            SELECT Station_ID, ?, COUNT(*), MIN(Ride_Date), MAX(Ride_Date)
+            FROM partition_new.Ridership
+            GROUP BY Station_ID
+        """, (year,))
+        conn.execute("""
+            INSERT INTO RidershipPartitions (Ride_Year, File, Num_Entries, First_Date, Last_Date)
+            SELECT ?, ?, COUNT(*), MIN(Ride_Date), MAX(Ride_Date)
+            FROM partition_new.Ridership
+        """, (year, file))
+        # The year's rollups stay as they are; StationStats already counts the moved rows
+        drop_rollup_triggers(conn.cursor())
+        conn.execute("DELETE FROM main.Ridership WHERE Ride_Date >= ? AND Ride_Date < ?", (start_date, end_date))
+        create_rollup_triggers(conn.cursor())
+        bump_data_version(conn.cursor())
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("DETACH DATABASE partition_new")
+
+    # Rows were inserted in key order, but VACUUM also drops the journal's free pages
+    partition = sqlite3.connect(path)
+    try:
+        partition.execute("VACUUM")
+    finally:
+        partition.close()
+    os.chmod(path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+    return path
+
+
+def archive_years(conn, before_year, vacuum=False):
+    # Moves every year < before_year still in Ridership into its own read-only partition file;
+    # returns the years archived
+    directory = partition_dir(conn)
+    if directory is None:
+        raise ValueError("Only a database file can be partitioned")
+    conn.isolation_level = None
+    migrate_schema(conn)
+
+    years = [row[0] for row in conn.execute(ARCHIVABLE_YEARS_SQL, (before_year,))]
+    if years:
+        os.makedirs(directory, exist_ok=True)
+    for year in years:
+        archive_year(conn, directory, year)
+    if years and vacuum:
+        # Gives the freed pages back; otherwise later loads reuse them
+        conn.execute("VACUUM")
+    return years
+
+
+def unarchive_year(conn, year):
+    # Moves an archived year back into Ridership and deletes its partition file
+    conn.isolation_level = None
+    migrate_schema(conn)
+    path = archived_years(conn).get(year)
+    if path is None:
+        raise ValueError(f"{year} is not archived")
+
+    attach_readonly(conn, path, 'partition_old')
+    try:
+        conn.execute("BEGIN")
+        drop_rollup_triggers(conn.cursor())
+        conn.execute("""
+            INSERT INTO main.Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day)
+            SELECT Station_ID, Ride_Date, Num_Riders, Type_of_Day FROM partition_old.Ridership
+        """)
+        create_rollup_triggers(conn.cursor())
+        conn.execute("DELETE FROM PartitionStationStats WHERE Ride_Year = ?", (year,))
+        conn.execute("DELETE FROM RidershipPartitions WHERE Ride_Year = ?", (year,))
+        bump_data_version(conn.cursor())
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("DETACH DATABASE partition_old")
+    remove_file(path)
+
+
+def drop_partitions(cursor):
+    # Unregisters every partition (for a full reload); returns the files to delete after commit
+    directory = partition_dir(cursor.connection)
+    files = [os.path.join(directory or '', row[0]) for row in cursor.execute("SELECT File FROM RidershipPartitions")]
+    cursor.execute("DELETE FROM PartitionStationStats")
+    cursor.execute("DELETE FROM RidershipPartitions")
+    return files
+
+
+def history_view(sources):
+    # Inline UNION ALL view over several Ridership tables. SQLite pushes the query's WHERE into
+    # every branch, so each one is still an index search; being inline, it also works on
+    # query_only connections, which cannot create a temp view
+    selects = " UNION ALL ".join(f"SELECT Station_ID, Ride_Date, Num_Riders, Type_of_Day FROM {source}" for source in sources)
+    return f"({selects}) AS RidershipHistory"
+
+
+class PartitionRouter:
+    # Maps a date range to the Ridership tables holding it, attaching archived years on demand.
+    # Attachments belong to the connection, so routers sharing one connection see each other's;
+    # this router's least recently used partitions are detached first. With no
+    # partitions every scan is plain Ridership.
+
+    def __init__(self, conn, partitions, version=None):
+        # partitions: {year: partition file path}
+        self.conn = conn
+        self.partitions = partitions
+        self.version = version
+        self.recent = []  # schemas this router used, least recently used first
+
+    @classmethod
+    def from_connection(cls, conn, version=None):
+        return cls(conn, archived_years(conn), version)
+
+    def attached_partitions(self):
+        return [name for _, name, _ in self.conn.execute("PRAGMA database_list") if PARTITION_SCHEMA.fullmatch(name)]
+
+    def attach(self, years):
+        # Schema names for the partitions of years (at most MAX_ATTACHED), attaching any missing
+        wanted = [partition_schema(year) for year in years]
+        attached = self.attached_partitions()
+        missing = [(year, schema) for year, schema in zip(years, wanted) if schema not in attached]
+        if len(attached) + len(missing) > MAX_ATTACHED:
+            spare = [schema for schema in self.recent if schema in attached and schema not in wanted]
+            spare += [schema for schema in attached if schema not in spare and schema not in wanted]
+            for schema in spare[:len(attached) + len(missing) - MAX_ATTACHED]:
+                self.detach(schema)
+        for year, schema in missing:
+            attach_readonly(self.conn, self.partitions[year], schema)
+        self.recent = [schema for schema in self.recent if schema not in wanted] + wanted
+        return wanted
+
+    def detach(self, schema):
+        self.conn.execute(f"DETACH DATABASE {schema}")
+        if schema in self.recent:
+            self.recent.remove(schema)
+
+    def windows(self, start_date=None, end_date=None):
+        # [(archived years, includes main, window start, window end)] covering the range in date
+        # order, with at most MAX_ATTACHED archived years per window
+        start_date = start_date or MIN_DATE
+        end_date = end_date or MAX_DATE
+        first_year, last_year = year_bounds(start_date, end_date)
+        years = sorted(year for year in self.partitions if first_year <= year <= last_year)
+
+        windows = []
+        window_start = start_date
+        for offset in range(0, max(len(years), 1), MAX_ATTACHED):
+            group = years[offset:offset + MAX_ATTACHED]
+            following = years[offset + MAX_ATTACHED:offset + MAX_ATTACHED + 1]
+            window_end = f"{following[0]:04d}-01-01" if following else end_date
+            window_first, window_last = year_bounds(window_start, window_end)
+            # Main holds every year in the window that is not archived
+            windows.append((group, window_last - window_first + 1 > len(group), window_start, window_end))
+            window_start = window_end
+        return windows
+
+    def scans(self, start_date=None, end_date=None):
+        # Yields (table, start, end): run the query against table for start <= Ride_Date < end.
+        # Finish with each table before asking for the next; it may detach the previous one
+        if not self.partitions:
+            yield 'Ridership', start_date or MIN_DATE, end_date or MAX_DATE
+            return
+        for years, with_main, window_start, window_end in self.windows(start_date, end_date):
+            sources = tuple(f"{schema}.Ridership" for schema in self.attach(years))
+            if with_main:
+                sources += ('main.Ridership',)
+            if not sources:
+                continue
+            table = sources[0] if len(sources) == 1 else history_view(sources)
+            yield table, window_start, window_end
+
+    def close(self):
+        attached = self.attached_partitions()
+        for schema in self.recent[:]:
+            if schema in attached:
+                self.detach(schema)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move past years of ridership into read-only partition files")
+    parser.add_argument('--db', default='cta_database.db', help="database file (default: cta_database.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    archive = commands.add_parser('archive', help="archive every year before --before")
+    archive.add_argument('--before', type=int, required=True, help="first year to keep in the main file")
+    archive.add_argument('--vacuum', action='store_true', help="VACUUM the main file afterwards")
+    unarchive = commands.add_parser('unarchive', help="move an archived year back into the main file")
+    unarchive.add_argument('--year', type=int, required=True)
+    commands.add_parser('list', help="show the archived years")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"No such database: {args.db}")
+
+    conn = sqlite3.connect(args.db, isolation_level=None, uri=True)
+    try:
+        if args.command == 'archive':
+            years = archive_years(conn, args.before, args.vacuum)
+            print(f"Archived {len(years)} years" + (f": {', '.join(map(str, years))}" if years else ""))
+        elif args.command == 'unarchive':
+            try:
+                unarchive_year(conn, args.year)
+            except ValueError as error:
+                parser.error(str(error))
+            print(f"Moved {args.year} back into {args.db}")
+        else:
+            migrate_schema(conn)
+            rows = conn.execute("SELECT Ride_Year, File, Num_Entries, First_Date, Last_Date FROM RidershipPartitions ORDER BY Ride_Year")
+            for year, file, num_entries, first_date, last_date in rows:
+                print(f"{year}  {file}  {num_entries:,} rows  {first_date} to {last_date}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
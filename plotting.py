@@ -0,0 +1,251 @@
+# Chart drawing for the CLI.
+#
+# matplotlib is only imported the first time a chart is drawn, so starting the app (and any
+# scripted run that never plots) does not pay for it. Charts are either shown in a TkAgg window
+# or, with an output directory or on a machine without a display, rendered to PNG/SVG files.
+#
+# Each chart kind is a draw_* function that fills in a matplotlib Figure. File output never goes
+# through pyplot: every process keeps one template Figure per chart kind, cleared and redrawn for
+# each chart, plus the decoded base map, so rendering many charts neither re-reads chicago.png
+# nor leaks figures. With a ChartRenderer, files are rendered on a pool of worker processes and
+# the CLI goes straight back to the prompt.
+
+import os
+import re
+import sys
+
+MAP_IMAGE = "chicago.png"
+MAP_EXTENT = [-87.9277, -87.5569, 41.7012, 42.0868]  # area covered by the map
+
+_pyplot = None
+# Per process: decoded map images by path and one reusable Figure per chart kind
+_base_maps = {}
+_templates = {}
+
+
+def has_display():
+    if sys.platform.startswith('linux'):
+        return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return True
+
+
+def get_pyplot(interactive=True):
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        # Ensure the correct backend is used for plotting
+        matplotlib.use('TkAgg' if interactive and has_display() else 'Agg')
+        import matplotlib.pyplot as plt
+        _pyplot = plt
+    return _pyplot
+
+
+def base_map(path=MAP_IMAGE):
+    # chicago.png is decoded once per process
+    image = _base_maps.get(path)
+    if image is None:
+        from matplotlib.image import imread
+        image = _base_maps[path] = imread(path)
+    return image
+
+
+def draw_yearly(fig, title, years, totals):
+    ax = fig.add_subplot()
+    ax.plot(years, totals, marker='o', label='Total Ridership')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Total Ridership')
+    ax.set_title(title)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend()
+    fig.tight_layout()
+
+
+def draw_monthly(fig, title, months, totals):
+    ax = fig.add_subplot()
+    ax.plot(months, totals, marker='o', linestyle='-', color='b', label='Ridership')  # Draw the line with markers
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Total Ridership')
+    ax.set_title(title)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend()  # Add a legend to the plot
+    ax.grid(True)  # Add grid lines for clarity
+    fig.tight_layout()  # Ensure everything fits within the plot
+
+
+def draw_daily_comparison(fig, title, series):
+    # series: list of (label, dates, riders, marker)
+    ax = fig.add_subplot()
+    for label, dates, riders, marker in series:
+        ax.plot(dates, riders, label=label, marker=marker)
+
+    # Customize the plot
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Ridership')
+    ax.set_title(title)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+
+
+def draw_station_matrix(fig, title, names, dates, values):
+    # One line per station column of values; gaps where a station has no data
+    ax = fig.add_subplot()
+    for idx, name in enumerate(names):
+        ax.plot(dates, values[:, idx], label=name, linewidth=1)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Ridership')
+    ax.set_title(title)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend(fontsize='small', ncol=2)
+    ax.grid(True)
+    fig.tight_layout()
+
+
+def draw_stations_on_map(fig, title, x, y):
+    ax = fig.add_subplot()
+    ax.imshow(base_map(), extent=MAP_EXTENT)
+    ax.set_title(title)
+    ax.plot(x, y, 'ro')  # 'ro' for red points
+    ax.set_xlim(MAP_EXTENT[:2])
+    ax.set_ylim(MAP_EXTENT[2:])
+
+    # Annotate each point with station name
+    for (longitude, latitude) in zip(x, y):
+        ax.annotate(f"({latitude}, {longitude})", (longitude, latitude))
+
+
+# Chart kind: (draw function, figure size in inches)
+CHARTS = {
+    'yearly': (draw_yearly, (10, 5)),
+    'monthly': (draw_monthly, (8, 6)),
+    'daily_comparison': (draw_daily_comparison, (10, 6)),
+    'station_matrix': (draw_station_matrix, (12, 6)),
+    'stations_on_map': (draw_stations_on_map, (6.4, 4.8)),
+}
+
+
+def template_figure(kind):
+    # The same Figure is reused for every chart of a kind in this process
+    fig = _templates.get(kind)
+    if fig is None:
+        from matplotlib.figure import Figure
+        fig = _templates[kind] = Figure(figsize=CHARTS[kind][1])
+    return fig
+
+
+def render_to_file(kind, title, args, path, file_format):
+    # Draws one chart into its template figure and saves it; safe to call in worker processes
+    draw, _ = CHARTS[kind]
+    fig = template_figure(kind)
+    try:
+        draw(fig, title, *args)
+        fig.savefig(path, format=file_format)
+    finally:
+        fig.clear()
+    return path
+
+
+class ChartRenderer:
+    # Renders charts to files on a pool of worker processes, started on first use. Each worker
+    # keeps its own template figures and base map across all the charts it is given.
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.executor = None
+        self.pending = []
+
+    def submit(self, kind, title, args, path, file_format):
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(self.workers)
+        self.pending = [item for item in self.pending if not item[1].done() or item[1].exception()]
+        future = self.executor.submit(render_to_file, kind, title, args, path, file_format)
+        self.pending.append((path, future))
+        return future
+
+    def close(self):
+        # Waits for every queued chart; returns (path, error) for the ones that failed
+        failed = []
+        for path, future in self.pending:
+            try:
+                future.result()
+            except Exception as error:
+                failed.append((path, error))
+        self.pending = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return failed
+
+
+class PlotOutput:
+    # Where finished charts go: a window when output_dir is None and a display is available,
+    # otherwise files named after the chart title in output_dir (default: current directory),
+    # rendered in the background when a ChartRenderer is given
+    def __init__(self, output_dir=None, file_format='png', verbose=True, renderer=None):
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.verbose = verbose
+        self.renderer = renderer
+
+    @property
+    def to_file(self):
+        return self.output_dir is not None or not has_display()
+
+    def chart_path(self, title):
+        output_dir = self.output_dir or '.'
+        os.makedirs(output_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', title).strip('_').lower()
+        return os.path.join(output_dir, f"{slug}.{self.file_format}")
+
+    def render(self, kind, title, *args):
+        if not self.to_file:
+            draw, figsize = CHARTS[kind]
+            plt = get_pyplot(interactive=True)
+            fig = plt.figure(figsize=figsize)
+            draw(fig, title, *args)
+            plt.show()
+            plt.close(fig)
+            return None
+
+        path = self.chart_path(title)
+        if self.renderer is not None:
+            self.renderer.submit(kind, title, args, path, self.file_format)
+            if self.verbose:
+                print(f"Rendering plot to {path}")
+            return path
+
+        render_to_file(kind, title, args, path, self.file_format)
+        if self.verbose:
+            print(f"Saved plot to {path}")
+        return path
+
+    def close(self):
+        # Waits for background charts, reporting any that could not be rendered
+        if self.renderer is None:
+            return
+        for path, error in self.renderer.close():
+            print(f"**Could not render {path}: {error}")
+
+
+def plot_yearly(output, station_name, years, totals):
+    return output.render('yearly', f'Yearly Ridership at {station_name}', years, totals)
+
+
+def plot_monthly(output, station_name, year, months, totals):
+    return output.render('monthly', f'Monthly Ridership at {station_name} for {year}', months, totals)
+
+
+def plot_daily_comparison(output, year, series):
+    # series: list of (label, dates, riders, marker)
+    return output.render('daily_comparison', f'Daily Ridership Comparison for {year}', series)
+
+
+def plot_station_matrix(output, label, matrix):
+    # Every station of a comparison.StationMatrix on one chart
+    dates = matrix.dates.astype('datetime64[D]').astype(object)
+    return output.render('station_matrix', f'Station Comparison for {label}', matrix.names, dates, matrix.values)
+
+
+def plot_stations_on_map(output, x, y):
+    return output.render('stations_on_map', "Stations within a Mile", x, y)
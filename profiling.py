@@ -0,0 +1,264 @@
+# Opt-in query profiling for CTAAnalytics.
+#
+# ProfiledConnection wraps a sqlite3 connection and records, for every statement: wall time
+# (execute plus fetches), rows returned, SQLite VM steps counted by a progress handler (a proxy
+# for rows scanned) and the EXPLAIN QUERY PLAN, flagging plans that SCAN a table.
+# Profiler.instrument() wraps every public CTAAnalytics method so each call is attributed its
+# statements and the Python time spent outside SQL. The DataVersion lookup done by @cached is
+# recorded under 'data_version' instead of the analysis that triggered it. Calls are written as
+# JSON lines and/or summarized at exit.
+
+import inspect
+import json
+import sys
+import time
+
+# Progress handler granularity: one callback per this many VM instructions
+PROGRESS_STEP = 100
+
+# Public CTAAnalytics methods that are not analyses; data_version is profiled on its own
+NOT_ANALYSES = {'open', 'close', 'data_version'}
+
+
+def analysis_methods(cls):
+    # Every public method is an analysis, so new ones are profiled without being registered here
+    return [name for name, value in vars(cls).items()
+            if inspect.isfunction(value) and not name.startswith('_') and name not in NOT_ANALYSES]
+
+
+def compact_sql(sql):
+    return ' '.join(sql.split())
+
+
+class Profiler:
+    def __init__(self, output=None, slow_ms=100.0):
+        # output: file object for JSON lines, or None to only collect for the summary
+        self.output = output
+        self.slow_ms = slow_ms
+        self.records = []
+        self.plans = {}
+        self._current = None
+
+    def instrument(self, analytics):
+        for name in analysis_methods(type(analytics)):
+            method = getattr(analytics, name)
+            wrap = self._wrap_generator if inspect.isgeneratorfunction(method) else self._wrap
+            setattr(analytics, name, wrap(name, method))
+        analytics.data_version = self._detach(self._wrap('data_version', analytics.data_version))
+        return analytics
+
+    def _wrap(self, name, method):
+        def profiled(*args, **kwargs):
+            # Nested analysis calls are attributed to the outermost one
+            if self._current is not None:
+                return method(*args, **kwargs)
+            record = {'analysis': name, 'args': [repr(arg) for arg in args], 'statements': []}
+            self._current = record
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._current = None
+                self.finish_analysis(record, time.perf_counter() - start)
+        return profiled
+
+    def _wrap_generator(self, name, method):
+        # A streaming analysis runs its statements while it is consumed, so it is the current
+        # analysis only inside next(), and the consumer's time between rows is not counted
+        def profiled(*args, **kwargs):
+            record = {'analysis': name, 'args': [repr(arg) for arg in args], 'statements': []}
+            owner = self._current or record
+            iterator = method(*args, **kwargs)
+            elapsed = 0.0
+            try:
+                while True:
+                    outer, self._current = self._current, owner
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator, record)
+                    finally:
+                        elapsed += time.perf_counter() - start
+                        self._current = outer
+                    if item is record:
+                        return
+                    yield item
+            finally:
+                outer, self._current = self._current, owner
+                try:
+                    iterator.close()
+                finally:
+                    self._current = outer
+                    if owner is record:
+                        self.finish_analysis(record, elapsed)
+        return profiled
+
+    def _detach(self, profiled):
+        # Runs a wrapped call as its own record even inside an analysis, whose time excludes it
+        def detached(*args, **kwargs):
+            outer, self._current = self._current, None
+            start = time.perf_counter()
+            try:
+                return profiled(*args, **kwargs)
+            finally:
+                self._current = outer
+                if outer is not None:
+                    outer['detached_ms'] = outer.get('detached_ms', 0.0) + (time.perf_counter() - start) * 1000
+        return detached
+
+    def finish_analysis(self, record, elapsed):
+        sql_ms = sum(statement['ms'] for statement in record['statements'])
+        overhead_ms = sum(statement.get('overhead_ms', 0.0) for statement in record['statements'])
+        overhead_ms += record.pop('detached_ms', 0.0)
+        record['total_ms'] = round(elapsed * 1000 - overhead_ms, 3)
+        record['sql_ms'] = round(sql_ms, 3)
+        record['python_ms'] = round(max(record['total_ms'] - sql_ms, 0.0), 3)
+        record['slow'] = record['total_ms'] >= self.slow_ms
+        self.records.append(record)
+        if self.output is not None:
+            self.output.write(json.dumps(record) + '\n')
+            self.output.flush()
+        if record['slow']:
+            print(f"[profile] slow analysis {record['analysis']}: {record['total_ms']:.1f} ms "
+                  f"(sql {record['sql_ms']:.1f} ms, python {record['python_ms']:.1f} ms)", file=sys.stderr)
+
+    def record_statement(self, statement):
+        if self._current is not None:
+            self._current['statements'].append(statement)
+        else:
+            # Statements outside an analysis (startup, migrations) are kept as their own records
+            record = {'analysis': None, 'args': [], 'statements': [statement]}
+            self.finish_analysis(record, (statement['ms'] + statement.get('overhead_ms', 0.0)) / 1000)
+
+    def summary(self):
+        # Per-analysis count, total and worst time, sorted by total time
+        rows = {}
+        for record in self.records:
+            name = record['analysis'] or '(no analysis)'
+            row = rows.setdefault(name, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sql_ms': 0.0, 'python_ms': 0.0, 'scans': 0})
+            row['calls'] += 1
+            row['total_ms'] += record['total_ms']
+            row['max_ms'] = max(row['max_ms'], record['total_ms'])
+            row['sql_ms'] += record['sql_ms']
+            row['python_ms'] += record['python_ms']
+            row['scans'] += sum(1 for statement in record['statements'] if statement['full_scan'])
+        return sorted(rows.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+
+    def print_summary(self, file=sys.stderr):
+        print(f"{'analysis':<24}{'calls':>7}{'total ms':>11}{'max ms':>10}{'sql ms':>10}{'python ms':>11}{'scans':>7}", file=file)
+        for name, row in self.summary():
+            print(f"{name:<24}{row['calls']:>7}{row['total_ms']:>11.2f}{row['max_ms']:>10.2f}"
+                  f"{row['sql_ms']:>10.2f}{row['python_ms']:>11.2f}{row['scans']:>7}", file=file)
+
+
+class ProfiledCursor:
+    def __init__(self, connection, cursor):
+        self.connection = connection
+        self.cursor = cursor
+        self.pending = None
+
+    def execute(self, sql, params=()):
+        self._finish()
+        self.pending = {'sql': compact_sql(sql), 'ms': 0.0, 'rows': 0, 'vm_steps': 0}
+        # Time spent looking up the plan is profiler overhead, not part of the analysis
+        start = time.perf_counter()
+        self.pending.update(self.connection.plan_for(sql, params))
+        self.pending['overhead_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        self._timed(self.cursor.execute, sql, params)
+        return self
+
+    def _timed(self, func, *args):
+        self.connection.steps = 0
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            if self.pending is not None:
+                self.pending['ms'] += (time.perf_counter() - start) * 1000
+                self.pending['vm_steps'] += self.connection.steps * PROGRESS_STEP
+
+    def fetchone(self):
+        row = self._timed(self.cursor.fetchone)
+        if row is not None and self.pending is not None:
+            self.pending['rows'] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self.cursor.fetchmany, *(() if size is None else (size,)))
+        if self.pending is not None:
+            self.pending['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self.cursor.fetchall)
+        if self.pending is not None:
+            self.pending['rows'] += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                self._finish()
+                return
+            yield row
+
+    def _finish(self):
+        if self.pending is not None:
+            statement = self.pending
+            self.pending = None
+            statement['ms'] = round(statement['ms'], 3)
+            self.connection.profiler.record_statement(statement)
+
+    def close(self):
+        self._finish()
+        self.cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class ProfiledConnection:
+    def __init__(self, conn, profiler):
+        self.conn = conn
+        self.profiler = profiler
+        self.steps = 0
+        conn.set_progress_handler(self._progress, PROGRESS_STEP)
+
+    def _progress(self):
+        self.steps += 1
+        return 0
+
+    def plan_for(self, sql, params):
+        # Query plans are looked up once per distinct statement
+        key = compact_sql(sql)
+        plan = self.profiler.plans.get(key)
+        if plan is None:
+            try:
+                steps = [row[3] for row in self.conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+            except Exception:
+                steps = []  # PRAGMAs and DDL have no query plan
+            plan = {'plan': steps, 'full_scan': any(step.startswith('SCAN ') for step in steps)}
+            self.profiler.plans[key] = plan
+        return plan
+
+    def cursor(self):
+        return ProfiledCursor(self, self.conn.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def close(self):
+        self.conn.set_progress_handler(None, 0)
+        self.conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def profile_analytics(analytics, output=None, slow_ms=100.0):
+    # Switches an existing CTAAnalytics over to a profiled connection and returns the profiler
+    profiler = Profiler(output, slow_ms)
+    analytics.conn = ProfiledConnection(analytics.conn, profiler)
+    profiler.instrument(analytics)
+    return profiler
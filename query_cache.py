@@ -0,0 +1,103 @@
+# Memoization for CTAAnalytics queries.
+#
+# Entries are keyed on the method name and its normalized arguments and evicted LRU-first once
+# max_entries is reached, or when older than ttl seconds. Every entry also records the database's
+# data version (the DataVersion table the loaders bump); a lookup made after new ridership was
+# loaded sees a different version and misses, so cached answers are never stale. List and dict
+# arguments are keyed by their contents; a call with any other unhashable argument is not cached.
+
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    def __init__(self, max_entries=1024, ttl=300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        # Returns (True, value) on a hit, (False, None) on a miss
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, entry_version, value = entry
+                if entry_version == version and expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, version, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def freeze(value):
+    # Hashable stand-in for a list or dict argument, so ['a', 'b'] and ('a', 'b') share a key
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def cached(method):
+    # Decorator for CTAAnalytics methods; a no-op when the instance has no cache
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+
+        # Bind against the signature so f(x), f(x, radius=1) and f(x, 1) share a key
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        try:
+            key = (method.__name__, tuple((name, freeze(value)) for name, value in list(bound.arguments.items())[1:]))
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+
+        version = self.data_version()
+        hit, value = self.cache.get(key, version)
+        if hit:
+            return value
+        value = method(self, *args, **kwargs)
+        self.cache.put(key, version, value)
+        return value
+
+    return wrapper
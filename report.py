@@ -0,0 +1,210 @@
+# Batch ops report: yearly, monthly and day-type ridership for every station with data.
+#
+# Stations are fanned out over a process pool; each worker opens its own read-only connection
+# and writes one JSON file per station (plus PNG charts) as soon as that station is done, so an
+# interrupted run picks up where it stopped. When every station is finished the per-station
+# files are combined into CSV and/or JSON tables.
+#
+#   python report.py --out report --year 2024 --workers 8
+#   python report.py --out report --year 2024 --workers 8     # after Ctrl-C: resumes
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import time
+
+import plotting
+from create_cta_database import SchemaError, readonly_uri
+from cta_analytics import DB_PATH, CTAAnalytics, connect_db
+
+
+def station_file(out_dir, station_id):
+    return os.path.join(out_dir, 'stations', f"{station_id}.json")
+
+
+def write_json(path, data):
+    # Written under a temporary name and renamed, so a station file is either complete or absent
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def is_done(out_dir, station_id, year, data_version, charts):
+    # A station from an earlier run counts only when it was built for the same year and data
+    try:
+        with open(station_file(out_dir, station_id)) as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if result.get('year') != year or result.get('data_version') != data_version:
+        return False
+    return not charts or all(os.path.exists(path) for path in result.get('charts', []))
+
+
+def station_report(analytics, station_id, station_name, year, out_dir, charts):
+    yearly = analytics.station_yearly_ridership(station_id)
+    monthly = analytics.monthly_ridership(station_id, year)
+    percentages = analytics.station_ridership_percentages(station_id)
+    result = {
+        'station_id': station_id,
+        'station_name': station_name,
+        'year': year,
+        'yearly': [{'year': row.year, 'riders': row.riders} for row in yearly],
+        'monthly': [{'month': row.month, 'riders': row.riders} for row in monthly],
+        'day_types': [{'day_type': share.day_type, 'riders': share.riders, 'percentage': share.percentage}
+                      for share in percentages.shares],
+        'charts': [],
+    }
+
+    if charts:
+        output = plotting.PlotOutput(os.path.join(out_dir, 'charts', str(station_id)), 'png', verbose=False)
+        if yearly:
+            result['charts'].append(plotting.plot_yearly(output, station_name, [str(row.year) for row in yearly],
+                                                         [row.riders for row in yearly]))
+        result['charts'].append(plotting.plot_monthly(output, station_name, year, [f"{row.month:02d}/{year}" for row in monthly],
+                                                      [row.riders for row in monthly]))
+    return result
+
+
+# Each worker process opens one read-only connection in its initializer and reuses it for every
+# station it is given
+_worker_analytics = None
+_worker_options = None
+
+
+def _init_worker(path, options, pool_worker=True):
+    global _worker_analytics, _worker_options
+    if pool_worker:
+        # Ctrl-C is handled once, in the parent; finished stations are already on disk
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    conn = sqlite3.connect(readonly_uri(path), uri=True)
+    _worker_analytics = CTAAnalytics(conn)
+    _worker_options = options
+
+
+def _worker_station(station):
+    station_id, station_name = station
+    options = _worker_options
+    result = station_report(_worker_analytics, station_id, station_name, options['year'], options['out_dir'], options['charts'])
+    result['data_version'] = options['data_version']
+    write_json(station_file(options['out_dir'], station_id), result)
+    return station_id
+
+
+def print_progress(done, total, skipped, started):
+    elapsed = time.perf_counter() - started
+    rate = (done - skipped) / elapsed if elapsed > 0 else 0
+    eta = f", about {(total - done) / rate:.0f} s left" if rate > 0 else ""
+    print(f"\r{done}/{total} stations ({skipped} resumed), {rate:.1f}/s{eta}   ", end='', file=sys.stderr, flush=True)
+
+
+def run_report(path, out_dir, year, workers=1, charts=True, restart=False):
+    # Returns the station results in Station_ID order; only missing stations are computed
+    os.makedirs(os.path.join(out_dir, 'stations'), exist_ok=True)
+
+    # Workers only ever read, and so does this; an outdated schema raises SchemaError
+    analytics = CTAAnalytics(connect_db(path))
+    try:
+        stations = analytics.station_catalog.match('%', with_data=True)
+        data_version = analytics.data_version()
+        if year is None:
+            last_date = analytics.statistics().last_date
+            year = int(last_date[:4]) if last_date else None
+    finally:
+        analytics.close()
+    if year is None:
+        raise SystemExit("The database has no ridership to report on")
+
+    todo = [station for station in stations
+            if restart or not is_done(out_dir, station[0], year, data_version, charts)]
+    skipped = len(stations) - len(todo)
+    options = {'year': year, 'out_dir': out_dir, 'charts': charts, 'data_version': data_version}
+
+    started = time.perf_counter()
+    done = skipped
+    print_progress(done, len(stations), skipped, started)
+    try:
+        if workers <= 1:
+            _init_worker(path, options, pool_worker=False)
+            for station in todo:
+                _worker_station(station)
+                done += 1
+                print_progress(done, len(stations), skipped, started)
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(path, options)) as pool:
+                # One station per task keeps the pool balanced; stations differ in history length
+                for _ in pool.imap_unordered(_worker_station, todo, chunksize=1):
+                    done += 1
+                    print_progress(done, len(stations), skipped, started)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted after {done} of {len(stations)} stations; run again to resume", file=sys.stderr)
+        sys.exit(130)
+    print(file=sys.stderr)
+
+    results = []
+    for station_id, _ in stations:
+        with open(station_file(out_dir, station_id)) as f:
+            results.append(json.load(f))
+    return year, results
+
+
+def write_tables(out_dir, results, formats):
+    if 'json' in formats:
+        write_json(os.path.join(out_dir, 'report.json'), results)
+
+    if 'csv' in formats:
+        with open(os.path.join(out_dir, 'yearly.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['station_id', 'station_name', 'year', 'riders'])
+            for result in results:
+                for row in result['yearly']:
+                    writer.writerow([result['station_id'], result['station_name'], row['year'], row['riders']])
+
+        with open(os.path.join(out_dir, 'monthly.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['station_id', 'station_name', 'year', 'month', 'riders'])
+            for result in results:
+                for row in result['monthly']:
+                    writer.writerow([result['station_id'], result['station_name'], result['year'], row['month'], row['riders']])
+
+        with open(os.path.join(out_dir, 'day_types.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['station_id', 'station_name', 'day_type', 'riders', 'percentage'])
+            for result in results:
+                for row in result['day_types']:
+                    writer.writerow([result['station_id'], result['station_name'], row['day_type'], row['riders'],
+                                     f"{row['percentage']:.2f}"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Yearly, monthly and day-type ridership report for every station")
+    parser.add_argument('--db', default=DB_PATH, help=f"database file (default: {DB_PATH})")
+    parser.add_argument('--out', default='report', help="output directory (default: report)")
+    parser.add_argument('--year', type=int, help="year for the monthly breakdown (default: latest year with data)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes (default: one per CPU)")
+    parser.add_argument('--format', choices=['csv', 'json', 'both'], default='both', help="combined output tables (default: both)")
+    parser.add_argument('--no-charts', action='store_true', help="skip the per-station PNG charts")
+    parser.add_argument('--restart', action='store_true', help="recompute every station instead of resuming")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"No such database: {args.db}")
+
+    started = time.perf_counter()
+    try:
+        year, results = run_report(args.db, args.out, args.year, args.workers, not args.no_charts, args.restart)
+    except SchemaError as e:
+        sys.exit(str(e))
+    formats = ['csv', 'json'] if args.format == 'both' else [args.format]
+    write_tables(args.out, results, formats)
+    print(f"Reported {len(results)} stations for {year} in {time.perf_counter() - started:.1f} s to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
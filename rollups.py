@@ -0,0 +1,240 @@
+# Materialized aggregates over Ridership.
+#
+# RidershipMonthly holds one row per (station, year, month, day type), RidershipSketches the
+# quantile sketch of the same cells (sketches.py) and StationStats one row per station with
+# ridership data. Single-row writes are kept in sync by triggers: an insert adds its row to the
+# totals, an update or delete recomputes the station-months it touched. The bulk and incremental
+# loaders drop the triggers, write, and refresh only what they touched.
+#
+# Years archived to partition files (partitions.py) no longer have rows in Ridership: their
+# RidershipMonthly rows are frozen and their per-station counts live in PartitionStationStats,
+# which StationStats folds in.
+#
+# Schema migrations build the rollups before the partition catalog (v5) and the sketches (v7)
+# exist, so every statement here only touches the tables the database already has.
+
+from sketches import bucket_sql
+
+ROLLUP_TRIGGERS = [
+    'trg_ridership_rollup_insert',
+    'trg_ridership_rollup_delete',
+    'trg_ridership_rollup_update',
+    'trg_ridership_stats_update',
+]
+
+
+def table_exists(cursor, name):
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def refresh_month_sql(station, date, sketches=True):
+    # Recomputes one station-month from the (Station_ID, Ride_Date) index; '-32' sorts after
+    # every day of the month, so the range covers exactly that month
+    sql = f'''
+        DELETE FROM RidershipMonthly
+        WHERE Station_ID = {station}
+          AND Ride_Year = CAST(substr({date}, 1, 4) AS INTEGER)
+          AND Ride_Month = CAST(substr({date}, 6, 2) AS INTEGER);
+        INSERT INTO RidershipMonthly (Station_ID, Ride_Year, Ride_Month, Type_of_Day, Total_Riders, Num_Days)
+        SELECT Station_ID, Ride_Year, Ride_Month, Type_of_Day, COALESCE(SUM(Num_Riders), 0), COUNT(*)
+        FROM Ridership
+        WHERE Station_ID = {station}
+          AND Ride_Date >= substr({date}, 1, 7) || '-01'
+          AND Ride_Date < substr({date}, 1, 7) || '-32'
+        GROUP BY Type_of_Day;
+    '''
+    if not sketches:
+        return sql
+    return sql + f'''
+        DELETE FROM RidershipSketches
+        WHERE Station_ID = {station}
+          AND Ride_Year = CAST(substr({date}, 1, 4) AS INTEGER)
+          AND Ride_Month = CAST(substr({date}, 6, 2) AS INTEGER);
+        INSERT INTO RidershipSketches (Station_ID, Ride_Year, Ride_Month, Type_of_Day, Bucket, Num_Days)
+        SELECT Station_ID, Ride_Year, Ride_Month, Type_of_Day, Bucket, COUNT(*)
+        FROM (
+            SELECT Station_ID, Ride_Year, Ride_Month, Type_of_Day, {bucket_sql('Num_Riders')} AS Bucket
+            FROM Ridership
+            WHERE Station_ID = {station}
+              AND Ride_Date >= substr({date}, 1, 7) || '-01'
+              AND Ride_Date < substr({date}, 1, 7) || '-32'
+              AND Num_Riders IS NOT NULL
+        )
+        GROUP BY Type_of_Day, Bucket;
+    '''
+
+
+def add_day_sql(sketches=True):
+    # Folds one inserted row into its station-month and sketch bucket instead of recomputing the
+    # month; only usable in the insert trigger, where the row is known to be new
+    sql = '''
+        INSERT INTO RidershipMonthly (Station_ID, Ride_Year, Ride_Month, Type_of_Day, Total_Riders, Num_Days)
+        VALUES (NEW.Station_ID, CAST(substr(NEW.Ride_Date, 1, 4) AS INTEGER), CAST(substr(NEW.Ride_Date, 6, 2) AS INTEGER),
+                NEW.Type_of_Day, COALESCE(NEW.Num_Riders, 0), 1)
+        ON CONFLICT (Station_ID, Ride_Year, Ride_Month, Type_of_Day) DO UPDATE
+        SET Total_Riders = Total_Riders + excluded.Total_Riders,
+            Num_Days = Num_Days + 1;
+    '''
+    if not sketches:
+        return sql
+    # INSERT ... SELECT needs its WHERE clause before ON CONFLICT to parse as an upsert
+    return sql + f'''
+        INSERT INTO RidershipSketches (Station_ID, Ride_Year, Ride_Month, Type_of_Day, Bucket, Num_Days)
+        SELECT NEW.Station_ID, CAST(substr(NEW.Ride_Date, 1, 4) AS INTEGER), CAST(substr(NEW.Ride_Date, 6, 2) AS INTEGER),
+               NEW.Type_of_Day, {bucket_sql('NEW.Num_Riders')}, 1
+        WHERE NEW.Num_Riders IS NOT NULL
+        ON CONFLICT (Station_ID, Ride_Year, Ride_Month, Type_of_Day, Bucket) DO UPDATE
+        SET Num_Days = Num_Days + 1;
+    '''
+
+
+def refresh_station_stats_sql(station, partitions=True):
+    archived = f'''
+            UNION ALL
+            SELECT Station_ID, Num_Entries, First_Date, Last_Date
+            FROM PartitionStationStats
+            WHERE Station_ID = {station}''' if partitions else ''
+    return f'''
+        DELETE FROM StationStats WHERE Station_ID = {station};
+        INSERT INTO StationStats (Station_ID, Num_Entries, First_Date, Last_Date)
+        SELECT Station_ID, SUM(Num_Entries), MIN(First_Date), MAX(Last_Date)
+        FROM (
+            SELECT Station_ID, COUNT(*) AS Num_Entries, MIN(Ride_Date) AS First_Date, MAX(Ride_Date) AS Last_Date
+            FROM Ridership
+            WHERE Station_ID = {station}
+            GROUP BY Station_ID{archived}
+        )
+        GROUP BY Station_ID;
+    '''
+
+
+def create_rollup_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS RidershipMonthly (
+        Station_ID INTEGER NOT NULL,
+        Ride_Year INTEGER NOT NULL,
+        Ride_Month INTEGER NOT NULL,
+        Type_of_Day TEXT NOT NULL,
+        Total_Riders INTEGER NOT NULL,
+        Num_Days INTEGER NOT NULL,
+        PRIMARY KEY (Station_ID, Ride_Year, Ride_Month, Type_of_Day)
+    ) WITHOUT ROWID;
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS StationStats (
+        Station_ID INTEGER PRIMARY KEY,
+        Num_Entries INTEGER NOT NULL,
+        First_Date TEXT,
+        Last_Date TEXT
+    );
+    ''')
+
+
+def create_rollup_triggers(cursor):
+    partitions = table_exists(cursor, 'PartitionStationStats')
+    sketches = table_exists(cursor, 'RidershipSketches')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_ridership_rollup_insert AFTER INSERT ON Ridership
+    BEGIN
+        {add_day_sql(sketches)}
+        INSERT INTO StationStats (Station_ID, Num_Entries, First_Date, Last_Date)
+        VALUES (NEW.Station_ID, 1, NEW.Ride_Date, NEW.Ride_Date)
+        ON CONFLICT (Station_ID) DO UPDATE
+        SET Num_Entries = Num_Entries + 1,
+            First_Date = MIN(First_Date, excluded.First_Date),
+            Last_Date = MAX(Last_Date, excluded.Last_Date);
+    END;
+    ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_ridership_rollup_delete AFTER DELETE ON Ridership
+    BEGIN
+        {refresh_month_sql('OLD.Station_ID', 'OLD.Ride_Date', sketches)}
+        {refresh_station_stats_sql('OLD.Station_ID', partitions)}
+    END;
+    ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_ridership_rollup_update
+    AFTER UPDATE OF Station_ID, Ride_Date, Num_Riders, Type_of_Day ON Ridership
+    BEGIN
+        {refresh_month_sql('OLD.Station_ID', 'OLD.Ride_Date', sketches)}
+        {refresh_month_sql('NEW.Station_ID', 'NEW.Ride_Date', sketches)}
+    END;
+    ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_ridership_stats_update AFTER UPDATE OF Station_ID, Ride_Date ON Ridership
+    BEGIN
+        {refresh_station_stats_sql('OLD.Station_ID', partitions)}
+        {refresh_station_stats_sql('NEW.Station_ID', partitions)}
+    END;
+    ''')
+
+
+def drop_rollup_triggers(cursor):
+    for name in ROLLUP_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild_rollups(cursor):
+    # Full recompute of everything still in Ridership, used after bulk loads; archived years keep
+    # the rollups they were archived with
+    partitions = table_exists(cursor, 'RidershipPartitions')
+    live = "Ride_Year NOT IN (SELECT Ride_Year FROM RidershipPartitions)" if partitions else "1"
+
+    cursor.execute(f"DELETE FROM RidershipMonthly WHERE {live}")
+    cursor.execute(f'''
+    INSERT INTO RidershipMonthly (Station_ID, Ride_Year, Ride_Month, Type_of_Day, Total_Riders, Num_Days)
+    SELECT Station_ID, Ride_Year, Ride_Month, Type_of_Day, COALESCE(SUM(Num_Riders), 0), COUNT(*)
+    FROM Ridership
+    WHERE {live}
+    GROUP BY Station_ID, Ride_Year, Ride_Month, Type_of_Day
+    ''')
+
+    if table_exists(cursor, 'RidershipSketches'):
+        cursor.execute(f"DELETE FROM RidershipSketches WHERE {live}")
+        cursor.execute(f'''
+        INSERT INTO RidershipSketches (Station_ID, Ride_Year, Ride_Month, Type_of_Day, Bucket, Num_Days)
+        SELECT Station_ID, Ride_Year, Ride_Month, Type_of_Day, Bucket, COUNT(*)
+        FROM (
+            SELECT Station_ID, Ride_Year, Ride_Month, Type_of_Day, {bucket_sql('Num_Riders')} AS Bucket
+            FROM Ridership
+            WHERE {live} AND Num_Riders IS NOT NULL
+        )
+        GROUP BY Station_ID, Ride_Year, Ride_Month, Type_of_Day, Bucket
+        ''')
+
+    archived = '''
+        UNION ALL
+        SELECT Station_ID, Num_Entries, First_Date, Last_Date
+        FROM PartitionStationStats''' if partitions else ''
+    cursor.execute("DELETE FROM StationStats")
+    cursor.execute(f'''
+    INSERT INTO StationStats (Station_ID, Num_Entries, First_Date, Last_Date)
+    SELECT Station_ID, SUM(Num_Entries), MIN(First_Date), MAX(Last_Date)
+    FROM (
+        SELECT Station_ID, COUNT(*) AS Num_Entries, MIN(Ride_Date) AS First_Date, MAX(Ride_Date) AS Last_Date
+        FROM Ridership
+        GROUP BY Station_ID{archived}
+    )
+    GROUP BY Station_ID
+    ''')
+
+
+def refresh_rollups(cursor, affected):
+    # affected is a set of (Station_ID, 'YYYY-MM') as returned by the incremental loader
+    month_sql = refresh_month_sql(':station', ':date', table_exists(cursor, 'RidershipSketches'))
+    stats_sql = refresh_station_stats_sql(':station', table_exists(cursor, 'PartitionStationStats'))
+    for station_id, month in sorted(affected):
+        params = {'station': station_id, 'date': f"{month}-01"}
+        for statement in month_sql.split(';'):
+            if statement.strip():
+                cursor.execute(statement, params)
+
+    for station_id in sorted({station_id for station_id, _ in affected}):
+        for statement in stats_sql.split(';'):
+            if statement.strip():
+                cursor.execute(statement, {'station': station_id})
@@ -0,0 +1,158 @@
+# Mergeable quantile sketches of daily riders per (station, year, month, day type).
+#
+# A sketch is a histogram over fixed, logarithmically growing buckets of rider counts (the
+# DDSketch construction). Bucket bounds are integers with Upper <= GAMMA * Lower, and a bucket is
+# reported by 2 * Lower * Upper / (Lower + Upper), so any quantile read from a sketch is within
+# RELATIVE_ERROR (1%) of the true value at that rank; counts below ~50 get a bucket each and are
+# exact. Because the buckets never change, sketches merge by adding counts: RidershipSketches
+# stores one row per (station, year, month, day type, bucket) and a percentile over any set of
+# stations and whole months is one indexed GROUP BY Bucket, never a sort of raw rows.
+#
+# The rows are written wherever RidershipMonthly is (rollups.py), so they stay current through
+# the triggers, the incremental loader and full rebuilds; archived years keep theirs.
+#
+# Quantiles use the nearest-rank definition: the q-quantile of n values is the ceil(q * n)-th
+# smallest. The exact mode of CTAAnalytics.ridership_distribution() sorts the raw rows with
+# the same definition, for verification.
+
+import bisect
+import math
+
+RELATIVE_ERROR = 0.01
+GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+# Counts above the last bound are stored as their own bucket, so they stay exact
+MAX_BUCKETED = 10 ** 9
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def bucket_bounds(gamma=GAMMA, limit=MAX_BUCKETED):
+    # [(Lower, Upper)] covering every integer 0..limit
+    bounds = [(0, 0)]
+    lower = 1
+    while lower <= limit:
+        upper = max(lower, math.floor(lower * gamma))
+        bounds.append((lower, upper))
+        lower = upper + 1
+    return bounds
+
+
+BOUNDS = bucket_bounds()
+UPPERS = [upper for _, upper in BOUNDS]
+LOWERS = {upper: lower for lower, upper in BOUNDS}
+
+
+def create_sketch_tables(cursor):
+    # Bucket bounds keyed by their upper bound, which is also the bucket's id
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS SketchBuckets (
+        Upper INTEGER PRIMARY KEY,
+        Lower INTEGER NOT NULL
+    );
+    ''')
+    cursor.executemany("INSERT OR IGNORE INTO SketchBuckets (Upper, Lower) VALUES (?, ?)",
+                       [(upper, lower) for lower, upper in BOUNDS])
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS RidershipSketches (
+        Station_ID INTEGER NOT NULL,
+        Ride_Year INTEGER NOT NULL,
+        Ride_Month INTEGER NOT NULL,
+        Type_of_Day TEXT NOT NULL,
+        Bucket INTEGER NOT NULL,
+        Num_Days INTEGER NOT NULL,
+        PRIMARY KEY (Station_ID, Ride_Year, Ride_Month, Type_of_Day, Bucket)
+    ) WITHOUT ROWID;
+    ''')
+
+
+def bucket_sql(value):
+    # Bucket (upper bound) of a rider count, as a rowid search in SketchBuckets
+    return f"COALESCE((SELECT Upper FROM SketchBuckets WHERE Upper >= {value} ORDER BY Upper LIMIT 1), {value})"
+
+
+def bucket_of(value):
+    # Python twin of bucket_sql()
+    index = bisect.bisect_left(UPPERS, value)
+    return UPPERS[index] if index < len(UPPERS) else value
+
+
+def representative(bucket):
+    lower = LOWERS.get(bucket, bucket)
+    if lower == bucket:
+        return float(bucket)
+    return 2 * lower * bucket / (lower + bucket)
+
+
+def rank(fraction, count):
+    # 1-based nearest rank; rounding first keeps 0.9 * 10 from ranking as 10
+    return min(max(1, math.ceil(round(fraction * count, 9))), count)
+
+
+class QuantileSketch:
+    def __init__(self, counts=None):
+        self.counts = dict(counts or {})  # bucket -> number of days
+
+    def add(self, riders, count=1):
+        bucket = bucket_of(riders)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        return self
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def quantiles(self, fractions):
+        # Estimated values at the given fractions, each within RELATIVE_ERROR of the exact one
+        total = len(self)
+        if not total:
+            return [None for _ in fractions]
+        buckets = sorted(self.counts)
+        results = []
+        for fraction in fractions:
+            wanted = rank(fraction, total)
+            seen = 0
+            for bucket in buckets:
+                seen += self.counts[bucket]
+                if seen >= wanted:
+                    results.append(representative(bucket))
+                    break
+        return results
+
+
+def exact_quantiles(values, fractions):
+    values = sorted(values)
+    if not values:
+        return [None for _ in fractions]
+    return [float(values[rank(fraction, len(values)) - 1]) for fraction in fractions]
+
+
+def month_start(date):
+    return date[:7] + '-01'
+
+
+def next_month(date):
+    year, month = int(date[:4]), int(date[5:7])
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+
+
+def split_months(start_date, end_date):
+    # Splits start_date <= day < end_date (None = unbounded) into the whole months the sketches
+    # answer, as ((year, month), (year, month)) with the end exclusive or None if there are none,
+    # and the partial months at either edge that have to be read row by row
+    first = None if start_date is None else (start_date if start_date == month_start(start_date) else next_month(start_date))
+    last = None if end_date is None else month_start(end_date)
+    if first is not None and last is not None and first >= last:
+        return None, [(start_date, end_date)]
+
+    edges = []
+    if start_date is not None and first != start_date:
+        edges.append((start_date, first))
+    if end_date is not None and last != end_date:
+        edges.append((last, end_date))
+    whole_start = (0, 0) if first is None else (int(first[:4]), int(first[5:7]))
+    whole_end = (10000, 1) if last is None else (int(last[:4]), int(last[5:7]))
+    return (whole_start, whole_end), edges
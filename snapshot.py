@@ -0,0 +1,189 @@
+# Memory-mapped snapshot of the columnar ridership arrays (see columnar.py).
+#
+# One file next to the database: an 8-byte magic, the header length, a JSON header (format
+# version, database fingerprint, date range, the Station_ID dictionary and one entry per column
+# with its dtype, offset, length and CRC-32), then each fixed-width column at a 64-byte aligned offset.
+# Loading mmaps the file read-only and wraps the columns with np.frombuffer, so nothing is
+# copied and concurrent processes share the same page-cache pages. A snapshot is only used when
+# its fingerprint (data version plus StationStats totals) matches the database.
+#
+#   python snapshot.py --db cta_database.db           # (re)write cta_database.db.snapshot
+#   python snapshot.py --db cta_database.db --verify  # check header, fingerprint and checksums
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from create_cta_database import SchemaError, get_data_version
+from cta_analytics import STATISTICS_SQL, connect_db
+
+MAGIC = b'CTACOLS\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+# Magic plus the header length as a little-endian uint32
+PREFIX = struct.Struct('<8sI')
+
+# (attribute of columnar.RidershipColumns, stored dtype); all little-endian fixed width. The
+# station dictionary (ids) lives in the header
+COLUMNS = [
+    ('starts', '<i8'),
+    ('station', '<i2'),
+    ('day', '<i4'),
+    ('riders', '<i4'),
+    ('day_type', '|u1'),
+]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_file(db_path):
+    return db_path + '.snapshot'
+
+
+def fingerprint(cursor):
+    # Identifies the data a snapshot was built from; the version alone would not notice a
+    # database file that was regenerated from scratch
+    num_stations, num_entries, first_date, last_date = cursor.execute(STATISTICS_SQL).fetchone()
+    return [get_data_version(cursor), num_stations, num_entries or 0, first_date, last_date]
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(path, columns, db_fingerprint):
+    # columns: a columnar.RidershipColumns. Written to a temporary file and renamed into place,
+    # so readers see either the old snapshot or the complete new one
+    arrays = [(name, np.ascontiguousarray(getattr(columns, name), dtype=dtype)) for name, dtype in COLUMNS]
+    entries = {}
+    offset = 0
+    for name, array in arrays:
+        entries[name] = {'dtype': array.dtype.str, 'count': len(array), 'offset': offset,
+                         'crc32': zlib.crc32(array)}
+        offset = align(offset + array.nbytes)
+
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'fingerprint': db_fingerprint,
+        'rows': len(columns),
+        'first_day': columns.first_day,
+        'last_day': columns.last_day,
+        'station_ids': columns.ids.tolist(),
+        'columns': entries,
+    }).encode()
+    data_start = align(PREFIX.size + len(header))
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(PREFIX.pack(MAGIC, len(header)))
+            f.write(header)
+            for name, array in arrays:
+                f.seek(data_start + entries[name]['offset'])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_snapshot(path, verify=True):
+    # Returns (header, arrays) with the arrays as read-only views of the mapped file; raises
+    # SnapshotError when the file is not a usable snapshot
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SnapshotError(f"{path} is empty")
+
+    if len(mapped) < PREFIX.size:
+        raise SnapshotError(f"{path} is truncated")
+    magic, header_length = PREFIX.unpack_from(mapped)
+    if magic != MAGIC:
+        raise SnapshotError(f"{path} is not a ridership snapshot")
+    try:
+        header = json.loads(mapped[PREFIX.size:PREFIX.size + header_length])
+    except ValueError:
+        raise SnapshotError(f"{path} has a corrupt header")
+    if header.get('format_version') != FORMAT_VERSION:
+        raise SnapshotError(f"{path} has format version {header.get('format_version')}, expected {FORMAT_VERSION}")
+
+    data_start = align(PREFIX.size + header_length)
+    arrays = {}
+    for name, dtype in COLUMNS:
+        entry = header['columns'].get(name)
+        if entry is None or np.dtype(entry['dtype']) != np.dtype(dtype):
+            raise SnapshotError(f"{path} has no {dtype} column {name}")
+        start = data_start + entry['offset']
+        if start + entry['count'] * np.dtype(dtype).itemsize > len(mapped):
+            raise SnapshotError(f"{path} is truncated in column {name}")
+        array = np.frombuffer(mapped, dtype=dtype, count=entry['count'], offset=start)
+        if verify and zlib.crc32(array) != entry['crc32']:
+            raise SnapshotError(f"{path} fails the checksum of column {name}")
+        arrays[name] = array
+    return header, arrays
+
+
+def load_snapshot(path, db_fingerprint, verify=True):
+    # Keyword arguments for columnar.RidershipColumns, or None when the snapshot is missing,
+    # unreadable or was built from different data
+    try:
+        header, arrays = read_snapshot(path, verify)
+    except (OSError, SnapshotError):
+        return None
+    if header['fingerprint'] != db_fingerprint:
+        return None
+    return dict(arrays, ids=np.array(header['station_ids'], dtype=np.int64),
+                first_day=header['first_day'], last_day=header['last_day'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write or verify the columnar ridership snapshot")
+    parser.add_argument('--db', default='cta_database.db', help="database to snapshot (default: cta_database.db)")
+    parser.add_argument('--out', help="snapshot file (default: <db>.snapshot)")
+    parser.add_argument('--verify', action='store_true', help="check an existing snapshot instead of writing one")
+    args = parser.parse_args(argv)
+    path = args.out or snapshot_file(args.db)
+
+    from columnar import RidershipColumns
+
+    try:
+        conn = connect_db(args.db)
+    except SchemaError as e:
+        sys.exit(str(e))
+    cursor = conn.cursor()
+    try:
+        current = fingerprint(cursor)
+        if args.verify:
+            try:
+                header, _ = read_snapshot(path)
+            except (OSError, SnapshotError) as error:
+                print(f"FAIL: {error}")
+                sys.exit(1)
+            if header['fingerprint'] != current:
+                print(f"STALE: {path} was built from {header['fingerprint']}, database is {current}")
+                sys.exit(1)
+            print(f"OK: {path} ({header['rows']:,} rows, {len(header['station_ids'])} stations)")
+            return
+
+        columns = RidershipColumns.from_cursor(cursor, current[0])
+        write_snapshot(path, columns, current)
+        print(f"Wrote {path} ({len(columns):,} rows, {os.path.getsize(path) / 1e6:.1f} MB)")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import math
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = EARTH_RADIUS_MILES * math.pi / 180
+
+# Grid cell edge in degrees (~0.7 miles of latitude), small enough that a 1 mile lookup only
+# visits a handful of cells
+CELL_SIZE = 0.01
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+class StopIndex:
+    # In-memory uniform grid over the Stops table, built once and queried many times.
+    # Grid cells only prune candidates; every result is checked with the exact haversine distance.
+
+    def __init__(self, stops, cell_size=CELL_SIZE):
+        # stops: iterable of (Stop_Name, Latitude, Longitude)
+        self.cell_size = cell_size
+        self.cells = {}
+        self.size = 0
+        for name, latitude, longitude in stops:
+            if latitude is None or longitude is None:
+                continue
+            self.cells.setdefault(self._cell(latitude, longitude), []).append((name, latitude, longitude))
+            self.size += 1
+
+        if self.cells:
+            rows = [row for row, _ in self.cells]
+            cols = [col for _, col in self.cells]
+            self.bounds = (min(rows), max(rows), min(cols), max(cols))
+        else:
+            self.bounds = None
+
+    @classmethod
+    def from_cursor(cls, cursor, cell_size=CELL_SIZE):
+        cursor.execute("SELECT Stop_Name, Latitude, Longitude FROM Stops")
+        return cls(cursor.fetchall(), cell_size)
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size))
+
+    def _cell_span(self, latitude, radius):
+        # Number of cells a radius covers in each direction at this latitude
+        lat_degrees = radius / MILES_PER_DEGREE_LAT
+        lon_degrees = lat_degrees / max(math.cos(math.radians(latitude)), 1e-6)
+        return math.ceil(lat_degrees / self.cell_size), math.ceil(lon_degrees / self.cell_size)
+
+    def _ring(self, center, distance):
+        # Cells exactly `distance` steps (Chebyshev) away from center
+        row, col = center
+        if distance == 0:
+            yield center
+            return
+        for d_col in range(-distance, distance + 1):
+            yield (row - distance, col + d_col)
+            yield (row + distance, col + d_col)
+        for d_row in range(-distance + 1, distance):
+            yield (row + d_row, col - distance)
+            yield (row + d_row, col + distance)
+
+    def _outside(self, cell):
+        min_row, max_row, min_col, max_col = self.bounds
+        return not (min_row <= cell[0] <= max_row and min_col <= cell[1] <= max_col)
+
+    def within(self, latitude, longitude, radius=1):
+        # All stops within `radius` miles, nearest first, as (distance, name, latitude, longitude)
+        if self.bounds is None:
+            return []
+        row, col = self._cell(latitude, longitude)
+        row_span, col_span = self._cell_span(latitude, radius)
+
+        # Only cells inside the occupied bounds can hold a stop; if the radius still covers more
+        # cells than are occupied, checking every occupied cell is cheaper
+        min_row, max_row, min_col, max_col = self.bounds
+        rows = range(max(row - row_span, min_row), min(row + row_span, max_row) + 1)
+        cols = range(max(col - col_span, min_col), min(col + col_span, max_col) + 1)
+        # The grid does not wrap, so a circle over the antimeridian or a pole checks them all too
+        lat_reach = row_span * self.cell_size
+        lon_reach = col_span * self.cell_size
+        wraps = abs(latitude) + lat_reach > 90 or abs(longitude) + lon_reach > 180
+        if wraps or len(rows) * len(cols) > len(self.cells):
+            cells = self.cells.values()
+        else:
+            cells = [self.cells.get((r, c), ()) for r in rows for c in cols]
+
+        results = []
+        for stops in cells:
+            for name, stop_lat, stop_lon in stops:
+                distance = haversine_miles(latitude, longitude, stop_lat, stop_lon)
+                if distance <= radius:
+                    results.append((distance, name, stop_lat, stop_lon))
+        results.sort()
+        return results
+
+    def nearest(self, latitude, longitude, k=1):
+        # The k closest stops, nearest first, as (distance, name, latitude, longitude)
+        if self.bounds is None or k <= 0:
+            return []
+
+        center = self._cell(latitude, longitude)
+        if self._outside(center):
+            # Rings from a point outside the grid would mostly cover empty cells
+            candidates = [(haversine_miles(latitude, longitude, stop_lat, stop_lon), name, stop_lat, stop_lon)
+                          for stops in self.cells.values() for name, stop_lat, stop_lon in stops]
+            candidates.sort()
+            return candidates[:k]
+        min_row, max_row, min_col, max_col = self.bounds
+        max_distance = max(abs(center[0] - min_row), abs(center[0] - max_row),
+                           abs(center[1] - min_col), abs(center[1] - max_col))
+        # Miles covered by one cell step in the narrower (longitude) direction
+        cell_miles = self.cell_size * MILES_PER_DEGREE_LAT * math.cos(math.radians(min(abs(latitude), 89.0)))
+
+        candidates = []
+        for distance in range(max_distance + 1):
+            for cell in self._ring(center, distance):
+                for name, stop_lat, stop_lon in self.cells.get(cell, ()):
+                    candidates.append((haversine_miles(latitude, longitude, stop_lat, stop_lon), name, stop_lat, stop_lon))
+
+            # Anything in an unvisited ring is at least `distance` whole cells away
+            if len(candidates) >= k:
+                candidates.sort()
+                if candidates[k - 1][0] <= distance * cell_miles:
+                    break
+        candidates.sort()
+        return candidates[:k]
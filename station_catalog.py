@@ -0,0 +1,116 @@
+# In-memory station name index for wildcard, prefix, substring and typo-tolerant lookups.
+#
+# The catalog is a few hundred names loaded once (Stations plus whether StationStats has the
+# station), so resolving a name costs microseconds whatever the size of Ridership.
+
+import bisect
+import difflib
+import re
+from functools import lru_cache
+
+# The columns a catalog is loaded from; Has_Data comes from the StationStats rollup so building
+# the catalog never touches Ridership
+CATALOG_SQL = """
+    SELECT s.Station_ID, s.Station_Name, st.Station_ID IS NOT NULL
+    FROM Stations s
+    LEFT JOIN StationStats st ON st.Station_ID = s.Station_ID
+    ORDER BY s.Station_ID
+"""
+
+# SQLite's LIKE only folds ASCII letters, so the catalog does the same
+ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def fold(text):
+    return text.translate(ASCII_LOWER)
+
+
+@lru_cache(maxsize=256)
+def like_regex(pattern):
+    # Translates a LIKE pattern (% = any run, _ = any one character, no escape character)
+    parts = []
+    for char in pattern:
+        if char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts), re.ASCII | re.IGNORECASE | re.DOTALL)
+
+
+class StationCatalog:
+    # In-memory station names, loaded once, answering Station_Name LIKE ? without SQLite.
+    # Patterns without wildcards are dictionary lookups, "prefix%" is a binary search over the
+    # sorted folded names, "%text%" a substring test; anything else falls back to a regex.
+
+    def __init__(self, stations, version=None):
+        # stations: iterable of (Station_ID, Station_Name, Has_Data), in Station_ID order
+        self.version = version
+        self.stations = [(station_id, name, bool(has_data)) for station_id, name, has_data in stations]
+        self.folded = [(fold(entry[1]), entry) for entry in self.stations]
+        self.by_name = {}
+        for entry in self.stations:
+            self.by_name.setdefault(fold(entry[1]), []).append(entry)
+        self.sorted_names = sorted(self.by_name)
+
+    @classmethod
+    def from_cursor(cls, cursor, version=None):
+        cursor.execute(CATALOG_SQL)
+        return cls(cursor.fetchall(), version)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def _matches(self, pattern):
+        if '%' not in pattern and '_' not in pattern:
+            return self.by_name.get(fold(pattern), [])
+
+        body = pattern.rstrip('%')
+        if body and pattern != body and '%' not in body and '_' not in body:
+            # "prefix%": every folded name in [prefix, next prefix) on the sorted list
+            prefix = fold(body)
+            start = bisect.bisect_left(self.sorted_names, prefix)
+            names = []
+            for name in self.sorted_names[start:]:
+                if not name.startswith(prefix):
+                    break
+                names.append(name)
+            return sorted(entry for name in names for entry in self.by_name[name])
+
+        inner = pattern.strip('%')
+        if inner and pattern.startswith('%') and pattern.endswith('%') and '%' not in inner and '_' not in inner:
+            text = fold(inner)
+            return [entry for name, entry in self.folded if text in name]
+
+        regex = like_regex(pattern)
+        match = regex.fullmatch
+        return [entry for entry in self.stations if match(entry[1])]
+
+    def match(self, pattern, with_data=False):
+        # (Station_ID, Station_Name) pairs matching a LIKE pattern, in Station_ID order
+        return [(station_id, name) for station_id, name, has_data in self._matches(pattern) if has_data or not with_data]
+
+    def exact(self, name, with_data=False):
+        # Station_Name = ? (case sensitive, unlike LIKE)
+        return [(station_id, station_name) for station_id, station_name, has_data in self.by_name.get(fold(name), [])
+                if station_name == name and (has_data or not with_data)]
+
+    def suggest(self, text, limit=5, cutoff=0.6):
+        # Typo-tolerant lookup for when a pattern matched nothing: closest names first
+        query = fold(text.replace('%', '').replace('_', ' ').strip())
+        if not query:
+            return []
+        close = difflib.get_close_matches(query, self.sorted_names, n=limit, cutoff=cutoff)
+        # Also offer names containing a word that is close to the query ("clrk" -> "Clark/Lake")
+        if len(close) < limit:
+            words = {}
+            for name in self.sorted_names:
+                for word in re.split(r'[^a-z0-9]+', name):
+                    if word:
+                        words.setdefault(word, []).append(name)
+            for word in difflib.get_close_matches(query, list(words), n=limit, cutoff=cutoff):
+                for name in words[word]:
+                    if name not in close:
+                        close.append(name)
+        return [entry[1] for name in close[:limit] for entry in self.by_name[name][:1]]
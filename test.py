@@ -1,28 +1,459 @@
-import sqlite3
-
-# Connect to the database
-conn = sqlite3.connect('cta_database.db')
-cursor = conn.cursor()
-
-# Query data from the Stations table
-cursor.execute("SELECT * FROM Stations")
-stations = cursor.fetchall()
-print("Stations:", stations)
-
-# Query data from the Stops table
-cursor.execute("SELECT * FROM Stops")
-stops = cursor.fetchall()
-print("Stops:", stops)
-
-# Query data from the Ridership table
-cursor.execute("SELECT * FROM Ridership")
-ridership = cursor.fetchall()
-print("Ridership:", ridership)
-
-cursor.execute("SELECT Station_ID, Station_Name FROM Stations")
-stations = cursor.fetchall()
-print("Stations in the database:", stations)
-
-
-# Close connection
-conn.close()
+import sqlite3
+import sys
+
+from create_cta_database import DuplicateRidershipError, create_tables, migrate_schema
+import cta_analytics
+import cta_database
+
+# Connect to the database
+conn = sqlite3.connect('cta_database.db')
+cursor = conn.cursor()
+
+# Query data from the Stations table
+cursor.execute("SELECT * FROM Stations")
+stations = cursor.fetchall()
+print("Stations:", stations)
+
+# Query data from the Stops table
+cursor.execute("SELECT * FROM Stops")
+stops = cursor.fetchall()
+print("Stops:", stops)
+
+# Query data from the Ridership table
+cursor.execute("SELECT * FROM Ridership")
+ridership = cursor.fetchall()
+print("Ridership:", ridership)
+
+cursor.execute("SELECT Station_ID, Station_Name FROM Stations")
+stations = cursor.fetchall()
+print("Stations in the database:", stations)
+
+
+# Close connection
+conn.close()
+
+
+# Every per-station ridership query must be answered from an index; a full scan of Ridership
+# (or of the RidershipMonthly rollup) means a predicate like strftime('%Y', Ride_Date) = ?
+# slipped back in
+check_conn = sqlite3.connect(':memory:')
+create_tables(check_conn.cursor())
+migrate_schema(check_conn)
+
+plan_checks = [
+    ("ridership_percentages", cta_analytics.ridership_percentages_sql(1), (1,)),
+    ("yearly_ridership", cta_analytics.yearly_ridership_sql(2), (1, 2)),
+    ("monthly_ridership", cta_analytics.MONTHLY_RIDERSHIP_SQL, (1, 2021)),
+    ("daily_ridership_comparison", cta_analytics.DAILY_RIDERSHIP_SQL.format(ridership='Ridership'), (1, '2021-01-01', '2022-01-01')),
+    ("iter_daily_ridership", cta_analytics.daily_comparison_sql(3).format(ridership='Ridership'), (1, 2, 3, 1, 2, 3, '2021-01-01', '2022-01-01')),
+]
+for name, sql, params in plan_checks:
+    plan = [row[3] for row in check_conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    assert not any(step.startswith("SCAN Ridership") for step in plan), f"{name} scans Ridership: {plan}"
+    print(f"{name} query plan:", plan)
+
+# Across partitions the range must still be pushed into each table's index
+import partitions
+check_conn.execute("ATTACH DATABASE ':memory:' AS ridership_2020")
+check_conn.execute(partitions.PARTITION_TABLE_SQL.format(schema='ridership_2020'))
+history = partitions.history_view(('ridership_2020.Ridership', 'main.Ridership'))
+plan = [row[3] for row in check_conn.execute("EXPLAIN QUERY PLAN " + cta_analytics.daily_comparison_sql(2).format(ridership=history),
+                                             (1, 2, 1, 2, '2020-01-01', '2022-01-01'))]
+assert not any(step.startswith("SCAN") and step != "SCAN RidershipHistory" for step in plan), f"partitioned daily scan: {plan}"
+print("partitioned iter_daily_ridership query plan:", plan)
+
+# Line color lookups must use the Color_Key index instead of scanning Lines with LOWER(Color)
+for name, sql in (("LINE_EXISTS_SQL", cta_analytics.LINE_EXISTS_SQL), ("STOPS_BY_LINE_SQL", cta_analytics.STOPS_BY_LINE_SQL)):
+    plan = [row[3] for row in check_conn.execute("EXPLAIN QUERY PLAN " + sql, ('red',) * sql.count('?'))]
+    assert not any(step.startswith("SCAN l") or step.startswith("SCAN Lines") for step in plan), f"{name} scans Lines: {plan}"
+    print(f"{name} query plan:", plan)
+
+check_conn.close()
+
+# The in-memory station catalog must resolve names exactly like SQLite's LIKE (and = for exact names)
+# (checked on a migrated in-memory copy so the sample database file is left as it is)
+catalog_conn = sqlite3.connect(':memory:')
+with sqlite3.connect('cta_database.db') as sample_conn:
+    sample_conn.backup(catalog_conn)
+sample_conn.close()
+# The sample file repeats its rows; v1 must stop on them without touching anything, and the
+# opt-in merge must keep every total
+totals_sql = "SELECT COUNT(*), SUM(Num_Riders), COUNT(DISTINCT Station_ID || Ride_Date) FROM Ridership"
+num_rows, total_riders, num_keys = catalog_conn.execute(totals_sql).fetchone()
+try:
+    migrate_schema(catalog_conn)
+    assert num_rows == num_keys, "v1 accepted repeated (Station_ID, Ride_Date) rows"
+except DuplicateRidershipError as e:
+    assert e.num_keys > 0 and catalog_conn.execute(totals_sql).fetchone() == (num_rows, total_riders, num_keys), \
+        "v1 changed the data before stopping"
+    assert catalog_conn.execute("PRAGMA user_version").fetchone()[0] == 0, "v1 stopped halfway"
+migrate_schema(catalog_conn, merge_duplicates=True)
+assert catalog_conn.execute(totals_sql).fetchone() == (num_keys, total_riders, num_keys), "merging duplicates changed the totals"
+print("v1 reports repeated ridership keys and merges them only when asked")
+
+# A migration that fails partway must leave nothing behind, so the next attempt can run it again
+import create_cta_database
+failing_conn = sqlite3.connect(':memory:')
+create_tables(failing_conn.cursor())
+migrate_to_v2 = create_cta_database.MIGRATIONS[1]
+def failing_v2(cursor):
+    migrate_to_v2(cursor)
+    raise sqlite3.OperationalError("simulated failure after the ALTER TABLE steps")
+create_cta_database.MIGRATIONS[1] = failing_v2
+try:
+    migrate_schema(failing_conn)
+    raise AssertionError("the failing migration did not raise")
+except sqlite3.OperationalError:
+    pass
+finally:
+    create_cta_database.MIGRATIONS[1] = migrate_to_v2
+assert failing_conn.execute("PRAGMA user_version").fetchone()[0] == 1, "a failed migration moved user_version"
+assert 'Ride_Year' not in [row[1] for row in failing_conn.execute("PRAGMA table_xinfo(Ridership)")], "a failed migration kept its ALTER TABLE"
+migrate_schema(failing_conn)
+assert failing_conn.execute("PRAGMA user_version").fetchone()[0] == len(create_cta_database.MIGRATIONS), "the retried migration failed"
+failing_conn.close()
+print("a failed migration is rolled back and retried cleanly")
+
+# Opening a database to read it must never migrate it; an old schema is refused until migrated
+import os
+import shutil
+import tempfile
+from create_cta_database import SchemaError
+with tempfile.TemporaryDirectory() as tmp:
+    old_path = os.path.join(tmp, 'old.db')
+    shutil.copy('cta_database.db', old_path)
+    try:
+        cta_analytics.connect_db(old_path).close()
+        raise AssertionError("connect_db opened a database at an old schema")
+    except SchemaError:
+        pass
+    with sqlite3.connect(old_path) as old_conn:
+        assert old_conn.execute("PRAGMA user_version").fetchone()[0] == 0, "connect_db migrated the database"
+    old_conn.close()
+    assert os.listdir(tmp) == ['old.db'], "opening the database wrote files next to it"
+print("connect_db refuses an old schema without changing it")
+analytics = cta_analytics.CTAAnalytics(catalog_conn)
+catalog = analytics.station_catalog
+for pattern in ['%', 'clark/lake', 'Clark%', '%lake', '%LAKE%', 'U_C%', '%-%', 'c%k/%e', '_', 'Nowhere', '']:
+    expected = [tuple(row) for row in analytics.conn.execute(
+        "SELECT Station_ID, Station_Name FROM Stations WHERE Station_Name LIKE ? ORDER BY Station_ID", (pattern,))]
+    assert catalog.match(pattern) == expected, f"catalog.match({pattern!r}) != LIKE: {catalog.match(pattern)} vs {expected}"
+    with_data = [tuple(row) for row in analytics.conn.execute(
+        "SELECT DISTINCT s.Station_ID, s.Station_Name FROM Stations s JOIN Ridership r ON s.Station_ID = r.Station_ID "
+        "WHERE s.Station_Name LIKE ? ORDER BY s.Station_ID", (pattern,))]
+    assert catalog.match(pattern, with_data=True) == with_data, f"catalog.match({pattern!r}, with_data=True) != LIKE"
+print("station catalog matches LIKE for", len(catalog), "stations")
+print("suggestions for 'Clrk/Lake':", analytics.suggest_stations('Clrk/Lake'))
+
+# The stop grid must agree with a brute-force scan, at radius edges and far outside the grid
+from spatial import haversine_miles
+all_stops = [tuple(row) for row in catalog_conn.execute("SELECT Stop_Name, Latitude, Longitude FROM Stops WHERE Latitude IS NOT NULL")]
+stop_index = analytics.stop_index
+for latitude, longitude in [(41.8721, -87.6505), (41.9, -87.64), (41.0, -88.5), (-33.9, 151.2), (89.9, 179.9)]:
+    brute = sorted((haversine_miles(latitude, longitude, lat, lon), name, lat, lon) for name, lat, lon in all_stops)
+    edges = [distance for distance, _, _, _ in brute]
+    for radius in edges + [0, 0.5, 3000, 13000]:
+        expected = [stop for stop in brute if stop[0] <= radius]
+        assert stop_index.within(latitude, longitude, radius) == expected, f"within({latitude}, {longitude}, {radius}) != brute force"
+    for k in range(1, len(brute) + 2):
+        assert stop_index.nearest(latitude, longitude, k) == brute[:k], f"nearest({latitude}, {longitude}, {k}) != brute force"
+print("stop grid matches a brute-force scan for", len(all_stops), "stops")
+
+# The columnar NumPy backend must give the same answers as SQL for every ridership analysis
+from columnar import ColumnarAnalytics
+columnar = ColumnarAnalytics(catalog_conn)
+station_ids = [station_id for station_id, _ in catalog.match('%', with_data=True)]
+names = [name for _, name in catalog.match('%', with_data=True)]
+parity_checks = [("statistics", lambda a: a.statistics()),
+                 ("weekday_ridership", lambda a: sorted(a.weekday_ridership(), key=lambda row: (-row.riders, row.station_name)))]
+for name in names + ['Nowhere']:
+    parity_checks.append((f"ridership_percentages({name!r})", lambda a, name=name: a.ridership_percentages(name)))
+for pattern in ['%', '%a%', 'Nowhere']:
+    parity_checks.append((f"yearly_ridership({pattern!r})", lambda a, pattern=pattern: a.yearly_ridership(pattern)))
+for station_id in station_ids:
+    for year in (2020, 2021, 2024):
+        parity_checks.append((f"monthly_ridership({station_id}, {year})", lambda a, s=station_id, y=year: a.monthly_ridership(s, y)))
+        parity_checks.append((f"daily_ridership({station_id}, {year})", lambda a, s=station_id, y=year: a.daily_ridership(s, y)))
+    parity_checks.append((f"station_yearly_ridership({station_id})", lambda a, s=station_id: a.station_yearly_ridership(s)))
+    parity_checks.append((f"station_ridership_percentages({station_id})", lambda a, s=station_id: a.station_ridership_percentages(s)))
+parity_checks.append(("ridership_distribution", lambda a: a.ridership_distribution(tuple(station_ids), '2021-01-02', '2024-09-01')))
+parity_checks.append(("iter_daily_ridership", lambda a: list(a.iter_daily_ridership(station_ids + [-1], '2021-01-01', '2025-01-01'))))
+for name, check in parity_checks:
+    assert check(analytics) == check(columnar), f"columnar {name} differs from SQL: {check(columnar)} vs {check(analytics)}"
+print("columnar backend matches SQL on", len(parity_checks), "analyses over", len(columnar.columns), "rows")
+
+# Station reports are keyed by Station_ID: stations that share a name, or whose name is a LIKE
+# pattern matching another station, must not pick up each other's riders
+import report
+report_conn = sqlite3.connect(':memory:')
+catalog_conn.backup(report_conn)
+report_conn.execute("INSERT INTO Stations (Station_ID, Station_Name) VALUES (99, 'UIC_Halsted')")
+report_conn.executemany("INSERT INTO Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day) VALUES (?, ?, ?, ?)",
+                        [(4, '2023-05-06', 40, 'A'), (4, '2024-09-01', 50, 'W'), (99, '2024-09-02', 7, 'U')])
+report_conn.commit()
+stations = [tuple(row) for row in report_conn.execute(
+    "SELECT DISTINCT s.Station_ID, s.Station_Name FROM Stations s JOIN Ridership r ON s.Station_ID = r.Station_ID")]
+assert len({name for _, name in stations}) < len(stations), "the sample no longer has stations sharing a name"
+for backend in (cta_analytics.CTAAnalytics(report_conn), ColumnarAnalytics(report_conn)):
+    for station_id, station_name in stations:
+        result = report.station_report(backend, station_id, station_name, 2024, None, False)
+        yearly = [(row['year'], row['riders']) for row in result['yearly']]
+        expected = [tuple(row) for row in report_conn.execute(
+            "SELECT CAST(strftime('%Y', Ride_Date) AS INTEGER), SUM(Num_Riders) FROM Ridership WHERE Station_ID = ? "
+            "GROUP BY 1 ORDER BY 1", (station_id,))]
+        assert yearly == expected, f"report yearly for station {station_id} is {yearly}, expected {expected}"
+        day_types = [(row['day_type'], row['riders']) for row in result['day_types']]
+        expected = [tuple(row) for row in report_conn.execute(
+            "SELECT Type_of_Day, SUM(Num_Riders) FROM Ridership WHERE Station_ID = ? GROUP BY 1 ORDER BY 1", (station_id,))]
+        assert day_types == expected, f"report day types for station {station_id} are {day_types}, expected {expected}"
+report_conn.close()
+print("station reports count each of", len(stations), "stations by id")
+
+# A snapshot must round-trip the columns, and must be rejected once corrupt or stale
+import os
+import tempfile
+import snapshot
+with tempfile.TemporaryDirectory() as tmp:
+    snapshot_path = os.path.join(tmp, 'sample.snapshot')
+    cursor = catalog_conn.cursor()
+    current = snapshot.fingerprint(cursor)
+    cursor.close()
+    snapshot.write_snapshot(snapshot_path, columnar.columns, current)
+    mapped = ColumnarAnalytics(catalog_conn, snapshot_path=snapshot_path)
+    for name, check in parity_checks:
+        assert check(mapped) == check(analytics), f"snapshot-backed {name} differs from SQL"
+    assert snapshot.load_snapshot(snapshot_path, current[:1] + [-1] + current[2:]) is None, "stale snapshot was accepted"
+    header, _ = snapshot.read_snapshot(snapshot_path)
+    with open(snapshot_path, 'r+b') as f:
+        header_length = snapshot.PREFIX.unpack(f.read(snapshot.PREFIX.size))[1]
+        f.seek(snapshot.align(snapshot.PREFIX.size + header_length) + header['columns']['riders']['offset'])
+        first = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([first[0] ^ 0xFF]))
+    assert snapshot.load_snapshot(snapshot_path, current) is None, "corrupt snapshot was accepted"
+    del mapped
+print("snapshot round-trips and rejects stale or corrupt files")
+
+# Archiving past years into partition files must not change any answer, and archived years must
+# be read-only
+from load_ridership import append_files
+with tempfile.TemporaryDirectory() as tmp:
+    partitioned_path = os.path.join(tmp, 'partitioned.db')
+    with sqlite3.connect(partitioned_path) as partitioned_conn:
+        catalog_conn.backup(partitioned_conn)
+    partitioned_conn.close()
+    partitioned_conn = sqlite3.connect(partitioned_path, uri=True)
+    assert partitions.archive_years(partitioned_conn, 2024) == [2021, 2022], "expected 2021 and 2022 to be archived"
+    for partitioned in (cta_analytics.CTAAnalytics(partitioned_conn), ColumnarAnalytics(partitioned_conn)):
+        for name, check in parity_checks:
+            assert check(partitioned) == check(analytics), f"partitioned {type(partitioned).__name__} {name} differs"
+    try:
+        partitions.attach_readonly(partitioned_conn, partitions.archived_years(partitioned_conn)[2021], 'archived')
+        partitioned_conn.execute("DELETE FROM archived.Ridership")
+        raise AssertionError("an archived partition accepted a write")
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        partitioned_conn.execute("DETACH DATABASE archived")
+
+    correction_path = os.path.join(tmp, 'correction.csv')
+    with open(correction_path, 'w') as f:
+        f.write("stationname,date,daytype,rides\n")
+        f.write(f"{names[0]},2021-01-04,W,1\n")
+    assert append_files(partitioned_conn, [correction_path]) == set(), "a row in an archived year was written"
+    partitions.unarchive_year(partitioned_conn, 2021)
+    unarchived = cta_analytics.CTAAnalytics(partitioned_conn)
+    for name, check in parity_checks:
+        assert check(unarchived) == check(analytics), f"{name} differs after unarchiving 2021"
+    partitioned_conn.close()
+print("partitioned storage matches the single-file database")
+
+# A bulk load that hits a bad row must name it, and must leave the indexes, triggers and rollups
+# in place whether or not earlier rows were already committed
+from load_ridership import LoadError, load_files
+schema_sql = "SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY name"
+with tempfile.TemporaryDirectory() as tmp:
+    failed_path = os.path.join(tmp, 'failed.db')
+    bad_path = os.path.join(tmp, 'bad.csv')
+    with open(bad_path, 'w') as f:
+        f.write("stationname,date,daytype,rides\n")
+        for day in range(1, 16):
+            f.write(f"{names[0]},2023-03-{day:02d},W,{1000 + day}\n")
+        f.write(f"{names[0]},2023-03-16,W,many\n")
+    for commit_every, kept in ((5, 15), (1000, 0)):
+        with sqlite3.connect(failed_path) as failed_conn:
+            catalog_conn.backup(failed_conn)
+        failed_conn.close()
+        failed_conn = sqlite3.connect(failed_path)
+        schema = failed_conn.execute(schema_sql).fetchall()
+        try:
+            load_files(failed_conn, [bad_path], chunk_size=5, commit_every=commit_every)
+            raise AssertionError("a bad row was loaded")
+        except LoadError as e:
+            assert e.line == 17, f"bad row reported at line {e.line}"
+        assert failed_conn.execute(schema_sql).fetchall() == schema, "a failed load left indexes or triggers missing"
+        monthly = failed_conn.execute("SELECT SUM(Total_Riders), SUM(Num_Days) FROM RidershipMonthly WHERE Ride_Year = 2023").fetchone()
+        assert monthly == ((sum(1000 + day for day in range(1, 16)), 15) if kept else (None, None)), f"2023 rollups: {monthly}"
+        failed_conn.close()
+        os.remove(failed_path)
+print("failed bulk loads report the bad row and leave the database usable")
+
+# Trends must agree between backends and with a plain Python rolling mean, and a refresh after
+# an append must equal a full reload
+import numpy as np
+table = analytics.trends()
+columnar_table = columnar.trends()
+for name in table.SERIES:
+    assert np.array_equal(table.series[name], columnar_table.series[name], equal_nan=True), f"columnar trends {name} differ"
+riders_by_day = {row.ride_date: row.riders for row in analytics.daily_ridership(station_ids[0], 2024)}
+last_day = max(riders_by_day)
+week = [riders_by_day[str(np.datetime64(last_day) - offset)] for offset in range(7) if str(np.datetime64(last_day) - offset) in riders_by_day]
+assert table.latest(station_ids[0])['mean_7'] == sum(week) / len(week), "7-day mean differs from a plain rolling mean"
+
+trends_conn = sqlite3.connect(':memory:')
+catalog_conn.backup(trends_conn)
+trends_analytics = cta_analytics.CTAAnalytics(trends_conn)
+incremental = trends_analytics.trends()
+with tempfile.TemporaryDirectory() as tmp:
+    appended_path = os.path.join(tmp, 'appended.csv')
+    with open(appended_path, 'w') as f:
+        f.write("stationname,date,daytype,rides\n")
+        f.write(f"{names[0]},2024-09-03,W,5000\n")
+        f.write(f"{names[1]},2021-01-04,W,1\n")
+    append_files(trends_conn, [appended_path])
+assert incremental.refresh(trends_analytics) == '2021-01-01', "refresh did not start at the corrected month"
+reloaded = trends_analytics.trends()
+for name in reloaded.SERIES:
+    assert np.allclose(incremental.series[name], reloaded.series[name], equal_nan=True), f"refreshed trends {name} differ"
+trends_analytics.close()
+print("trends match across backends and refresh incrementally;", len(table.anomalies()), "anomalies at |z| > 3")
+# Line totals from the membership index must equal a join back to Ridership, with a station
+# shared by several lines counted once in their union
+naive_lines = {color: riders for color, riders in catalog_conn.execute(
+    "SELECT MIN(l.Color), SUM(r.Num_Riders) FROM Lines l "
+    "JOIN (SELECT DISTINCT sd.Line_ID, s.Station_ID FROM StopDetails sd JOIN Stops s ON s.Stop_ID = sd.Stop_ID) m ON m.Line_ID = l.Line_ID "
+    "JOIN Ridership r ON r.Station_ID = m.Station_ID GROUP BY l.Color_Key")}
+lines = analytics.line_ridership()
+assert {line.color: line.riders for line in lines} == naive_lines, f"line_ridership differs from a join: {lines} vs {naive_lines}"
+line_index = analytics.line_index
+colors = [line.color for line in lines]
+union = sum(row.riders for row in analytics.line_monthly_ridership(tuple(colors)))
+on_any_line = sum(riders for station_id, riders in catalog_conn.execute(
+    "SELECT Station_ID, SUM(Num_Riders) FROM Ridership GROUP BY Station_ID") if station_id in line_index.station_masks)
+assert union == on_any_line, f"union of every line counts a shared station more than once: {union} vs {on_any_line}"
+assert round(sum(line.riders for line in analytics.line_ridership(split=True))) == on_any_line, "split line totals do not add up"
+print("line ridership matches a join over", len(lines), "lines")
+
+# Percentiles merged from the monthly sketches must be within the documented error of the exact
+# ones, and sketches kept current by the triggers must equal a full rebuild
+import sketches
+from rollups import rebuild_rollups, refresh_rollups
+fractions = (0.0, 0.5, 0.9, 0.99, 1.0)
+for group, start_date, end_date in [(None, None, None), (tuple(station_ids[:1]), '2021-01-05', None), (tuple(station_ids), '2021-01-03', '2021-01-10')]:
+    estimated = analytics.ridership_distribution(group, start_date, end_date, fractions)
+    exact = analytics.ridership_distribution(group, start_date, end_date, fractions, exact=True)
+    assert [(d.day_type, d.num_days) for d in estimated] == [(d.day_type, d.num_days) for d in exact], "sketch day counts differ"
+    for sketched, truth in zip(estimated, exact):
+        for value, true_value in zip(sketched.riders, truth.riders):
+            assert abs(value - true_value) <= sketches.RELATIVE_ERROR * true_value, f"sketch {value} vs exact {true_value}"
+low, high = sketches.QuantileSketch(), sketches.QuantileSketch()
+for riders in range(0, 50, 2):
+    low.add(riders)
+    high.add(riders + 1)
+assert low.merge(high).quantiles(fractions) == sketches.exact_quantiles(range(50), fractions), "merged small counts are not exact"
+sketch_conn = sqlite3.connect(':memory:')
+catalog_conn.backup(sketch_conn)
+# Inserts into an existing month, a new month and a row without a count, then a delete
+sketch_conn.executemany("INSERT INTO Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day) VALUES (?, ?, ?, 'W')",
+                        [(station_ids[0], '2021-02-04', 1234567), (station_ids[0], '2021-02-05', 1234567),
+                         (station_ids[0], '1999-03-01', 7), (station_ids[0], '2021-02-08', None)])
+sketch_conn.execute("DELETE FROM Ridership WHERE Station_ID = ? AND Ride_Date = '2021-01-05'", (station_ids[0],))
+# A month whose rows all lack a count goes through every trigger and the loader's refresh
+sketch_conn.executemany("INSERT INTO Ridership (Station_ID, Ride_Date, Num_Riders, Type_of_Day) VALUES (?, ?, NULL, 'A')",
+                        [(station_ids[0], '1998-05-02'), (station_ids[0], '1998-05-03'), (station_ids[0], '1998-05-04')])
+sketch_conn.execute("DELETE FROM Ridership WHERE Station_ID = ? AND Ride_Date = '1998-05-02'", (station_ids[0],))
+sketch_conn.execute("UPDATE Ridership SET Ride_Date = '1998-05-09' WHERE Station_ID = ? AND Ride_Date = '1998-05-03'", (station_ids[0],))
+refresh_rollups(sketch_conn.cursor(), {(station_ids[0], '1998-05')})
+assert sketch_conn.execute("SELECT Total_Riders, Num_Days FROM RidershipMonthly WHERE Station_ID = ? AND Ride_Year = 1998",
+                           (station_ids[0],)).fetchall() == [(0, 2)], "a month without counts is not a zero total"
+rollup_tables = ("SELECT * FROM RidershipMonthly ORDER BY 1, 2, 3, 4", "SELECT * FROM RidershipSketches ORDER BY 1, 2, 3, 4, 5",
+                 "SELECT * FROM StationStats ORDER BY 1")
+maintained = [sketch_conn.execute(sql).fetchall() for sql in rollup_tables]
+rebuild_rollups(sketch_conn.cursor())
+assert maintained == [sketch_conn.execute(sql).fetchall() for sql in rollup_tables], "triggers left the rollups or sketches stale"
+sketch_conn.close()
+print("sketch percentiles are within", sketches.RELATIVE_ERROR, "of exact and maintained by the triggers")
+
+# A database already past v3 (here stopped at v4) must still get the partition catalog and the
+# sketches from their own migrations, and v3 must not depend on either
+from create_cta_database import MIGRATIONS, merge_duplicate_ridership
+from rollups import table_exists
+upgrade_conn = sqlite3.connect(':memory:')
+with sqlite3.connect('cta_database.db') as sample_conn:
+    sample_conn.backup(upgrade_conn)
+sample_conn.close()
+merge_duplicate_ridership(upgrade_conn.cursor())
+for number, migration in enumerate(MIGRATIONS[:4], start=1):
+    migration(upgrade_conn.cursor())
+    upgrade_conn.execute(f"PRAGMA user_version = {number}")
+    if number == 3:
+        assert not table_exists(upgrade_conn, 'RidershipPartitions') and not table_exists(upgrade_conn, 'RidershipSketches'), "v3 creates later tables"
+        assert upgrade_conn.execute("SELECT COUNT(*) FROM RidershipMonthly").fetchone()[0] > 0, "v3 left the rollups empty"
+upgrade_conn.commit()
+migrate_schema(upgrade_conn)
+upgraded = upgrade_conn.execute("SELECT * FROM RidershipSketches ORDER BY 1, 2, 3, 4, 5").fetchall()
+assert upgraded and upgraded == catalog_conn.execute("SELECT * FROM RidershipSketches ORDER BY 1, 2, 3, 4, 5").fetchall(), "v4 database has no sketches"
+assert table_exists(upgrade_conn, 'PartitionStationStats'), "v4 database has no partition catalog"
+upgrade_conn.close()
+print("a v4 database migrates to the partition catalog and the sketches")
+
+# Batch mode must answer like direct calls, one JSON line per command, and keep going past bad lines
+import io
+import json
+import batch
+from cta_analytics import to_json
+commands = [{'id': 'a', 'command': 'monthly_ridership', 'station_id': station_ids[0], 'year': 2021},
+            {'command': 'daily_comparison', 'stations': station_ids[:2], 'year': 2024},
+            {'command': 'line_ridership', 'year': 2021, 'split': True},
+            {'command': 'monthly_ridership', 'station': '%', 'year': 2021},
+            {'command': 'no_such_command'}]
+out = io.StringIO()
+malformed = ['{"command": ["monthly_ridership"]}', '[1, 2]',
+             '{"command": "daily_comparison", "stations": [1], "start_date": "soon", "end_date": "2022-01-01"}',
+             '{"command":"monthly_ridership","station_id":1,"year":100000000000000000000000}',
+             '{"command":"daily_ridership","station_id":100000000000000000000000,"year":2021}']
+assert batch.run_batch(analytics, [json.dumps(command) for command in commands] + ['', '{not json'] + malformed, out) == (11, 8), \
+    "batch counts differ"
+records = [json.loads(line) for line in out.getvalue().splitlines()]
+assert all('error' in record for record in records[6:]), f"malformed lines were not reported: {records[6:]}"
+assert records[0]['id'] == 'a' and records[0]['result'] == to_json(analytics.monthly_ridership(station_ids[0], 2021)), "batch monthly differs"
+assert records[1]['result']['rows'] == json.loads(json.dumps(to_json(list(analytics.iter_daily_ridership(station_ids[:2], '2024-01-01', '2025-01-01'))))), \
+    "batch daily comparison differs"
+assert records[2]['result'] == to_json(analytics.line_ridership(2021, None, True)), "batch line ridership differs"
+assert 'matches' in records[3] and 'error' in records[4] and records[5]['line'] == 7 and 'error' in records[5], f"batch errors: {records[3:]}"
+assert 'cta_server' not in sys.modules, "batch mode imports the HTTP server"
+print("batch mode answers", len(records), "commands like direct calls")
+
+# The profiler must cover every public analysis, including streamed ones, and keep the cache's
+# DataVersion lookup out of the analysis that triggered it
+import profiling
+from query_cache import QueryCache
+profiled = cta_analytics.CTAAnalytics(catalog_conn, QueryCache(16, 60))
+# List arguments (as batch mode and JSON callers pass them) are cached by their contents
+assert profiled.line_monthly_ridership(['red'], 2021) == profiled.line_monthly_ridership(('red',), 2021), "list key differs"
+assert profiled.cache.stats()['hits'] == 1, "a list argument was not cached"
+profiler = profiling.profile_analytics(profiled)
+for name in ('line_ridership', 'ridership_distribution', 'iter_daily_ridership', 'station_matrix', 'trends'):
+    assert name in profiling.analysis_methods(cta_analytics.CTAAnalytics), f"{name} is not profiled"
+profiled.weekday_ridership()
+assert len(list(profiled.iter_daily_ridership(station_ids[:2], '2021-01-01', '2022-01-01', batch_size=2))) > 0
+by_name = {record['analysis']: record for record in profiler.records}
+assert by_name['data_version']['statements'] and all('DataVersion' not in statement['sql'] for statement in by_name['weekday_ridership']['statements']), \
+    "the DataVersion lookup is credited to the analysis"
+assert by_name['iter_daily_ridership']['statements'], "streamed statements are not attributed"
+print("profiler records", sorted(name for name in by_name if name), "separately")
+analytics.close()
+
+# matplotlib must stay a lazy import; loading it at startup costs hundreds of milliseconds and
+# breaks headless runs (bench_startup.py measures the full cold-start budget)
+assert 'matplotlib' not in sys.modules, "cta_database imports matplotlib at startup"
@@ -0,0 +1,286 @@
+# Rolling-window, year-over-year and weekday-adjusted ridership trends.
+#
+# TrendTable lays daily riders out as a dense date x station float64 grid (NaN where a station
+# has no row) and derives every series from trailing-window sums taken with one cumulative sum
+# per column, so all stations are computed together in a few vectorized passes:
+#
+#   mean_7, mean_28  trailing 7/28-day mean of the days with data
+#   yoy_pct          mean_28 against mean_28 364 days earlier (same weekday), in percent
+#   adjusted         riders divided by the station's day-type factor: the trailing-year mean for
+#                    the day's Type_of_Day over the trailing-year mean of all days
+#   trend            trailing 28-day mean of adjusted, i.e. the weekday-adjusted trend
+#   zscore           adjusted against the mean and standard deviation of the 28 days before it
+#
+# Every series only looks back a bounded number of days, so refresh() re-reads the months that
+# changed since the table was built (new days, or corrections caught by the monthly rollups) and
+# recomputes from there instead of starting over.
+
+import csv
+
+import numpy as np
+
+WEEK_DAYS = 7
+MONTH_DAYS = 28
+YEAR_DAYS = 364  # 52 weeks, so year-over-year compares the same weekday
+DAY_TYPE_CODES = 3  # Type_of_Day codes as loaded: 0 = A, 1 = U, 2 = W
+# Days with data needed in the trailing window before a z-score is given
+MIN_ZSCORE_DAYS = 14
+# How far back a recompute from a given day has to read raw riders
+LOOKBACK_DAYS = YEAR_DAYS + MONTH_DAYS + 1
+
+# Monthly totals per station from the rollups, to find months that changed since a load
+MONTH_TOTALS_SQL = """
+    SELECT Station_ID, Ride_Year, Ride_Month, SUM(Total_Riders), SUM(Num_Days)
+    FROM RidershipMonthly
+    WHERE Ride_Year >= ? AND Ride_Year <= ?
+    GROUP BY Station_ID, Ride_Year, Ride_Month
+"""
+
+
+def day_number(date):
+    return int(np.datetime64(date, 'D').astype(np.int64))
+
+
+def day_string(day):
+    return str(np.datetime64(int(day), 'D'))
+
+
+def trailing_sums(values, window):
+    # Sums and counts of the non-NaN values in the trailing window ending at each row
+    present = ~np.isnan(values)
+    sums = np.zeros((len(values) + 1, values.shape[1]))
+    counts = np.zeros((len(values) + 1, values.shape[1]))
+    np.cumsum(np.where(present, values, 0), axis=0, out=sums[1:])
+    np.cumsum(present, axis=0, out=counts[1:])
+    lower = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    return sums[1:] - sums[lower], counts[1:] - counts[lower]
+
+
+def trailing_mean(values, window):
+    sums, counts = trailing_sums(values, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def shifted(values, periods):
+    # values moved down by periods rows, NaN-filled at the top
+    result = np.full_like(values, np.nan)
+    if periods < len(values):
+        result[periods:] = values[:len(values) - periods]
+    return result
+
+
+def compute(riders, day_type):
+    # Every derived series for a (days, stations) block; rows near the top lack history
+    present = ~np.isnan(riders)
+    mean_7 = trailing_mean(riders, WEEK_DAYS)
+    mean_28 = trailing_mean(riders, MONTH_DAYS)
+
+    all_mean = trailing_mean(riders, YEAR_DAYS)
+    factor = np.full_like(riders, np.nan)
+    for code in range(DAY_TYPE_CODES):
+        of_type = day_type == code
+        type_mean = trailing_mean(np.where(of_type, riders, np.nan), YEAR_DAYS)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            factor = np.where(of_type, type_mean / all_mean, factor)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        adjusted = np.where(present & (factor > 0), riders / factor, np.nan)
+    trend = trailing_mean(adjusted, MONTH_DAYS)
+
+    # Mean and spread of the 28 days before each day, so a spike does not dampen its own score
+    sums, counts = trailing_sums(adjusted, MONTH_DAYS)
+    squares, _ = trailing_sums(adjusted * adjusted, MONTH_DAYS)
+    sums, counts, squares = shifted(sums, 1), shifted(counts, 1), shifted(squares, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / counts
+        std = np.sqrt(np.maximum(squares / counts - mean * mean, 0))
+        zscore = np.where((counts >= MIN_ZSCORE_DAYS) & (std > 0), (adjusted - mean) / std, np.nan)
+    return {'mean_7': mean_7, 'mean_28': mean_28, 'adjusted': adjusted, 'trend': trend, 'zscore': zscore}
+
+
+def year_over_year(mean_28):
+    previous = shifted(mean_28, YEAR_DAYS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(previous > 0, (mean_28 - previous) / previous * 100, np.nan)
+
+
+class TrendTable:
+    SERIES = ['mean_7', 'mean_28', 'yoy_pct', 'adjusted', 'trend', 'zscore']
+
+    def __init__(self, station_ids, first_day, riders, day_type, end_date=None, version=None, every_station=False):
+        # riders: float64 (days, stations), NaN = no row; day_type: int8 codes, -1 = no row.
+        # end_date None means the table follows the data as it grows (see refresh());
+        # every_station reads all of Ridership and keeps the rows of station_ids
+        self.station_ids = list(station_ids)
+        self.every_station = every_station
+        self.first_day = first_day
+        self.riders = riders
+        self.day_type = day_type
+        self.end_date = end_date
+        self.version = version
+        # Derived (days, stations) arrays by name, see SERIES
+        self.series = {}
+
+    @classmethod
+    def load(cls, analytics, station_ids=None, start_date=None, end_date=None):
+        # station_ids: Station_IDs to include (default: every station with ridership);
+        # start_date/end_date: ISO dates, end exclusive (default: the whole history)
+        version = analytics.data_version()
+        every_station = station_ids is None
+        if every_station:
+            station_ids = [station_id for station_id, _ in analytics.station_catalog.match('%', with_data=True)]
+        stats = analytics.statistics()
+        first_date = start_date or stats.first_date
+        last_day = day_number(end_date) - 1 if end_date else (day_number(stats.last_date) if stats.last_date else None)
+        if first_date is None or last_day is None:
+            first_day, num_days = 0, 0
+        else:
+            first_day = day_number(first_date)
+            num_days = max(last_day - first_day + 1, 0)
+
+        table = cls(station_ids, first_day, np.full((num_days, len(station_ids)), np.nan),
+                    np.full((num_days, len(station_ids)), -1, dtype=np.int8), end_date, version, every_station)
+        table.fill(analytics, first_day)
+        table.recompute(0)
+        return table
+
+    def __len__(self):
+        return len(self.riders)
+
+    @property
+    def dates(self):
+        return (np.arange(len(self.riders)) + self.first_day).astype('datetime64[D]')
+
+    def fill(self, analytics, from_day):
+        # (Re)reads every row from from_day to the end of the grid
+        if not self.station_ids or from_day >= self.first_day + len(self.riders):
+            return
+        self.riders[from_day - self.first_day:] = np.nan
+        self.day_type[from_day - self.first_day:] = -1
+        end_day = self.first_day + len(self.riders)
+        station_ids, days, riders, day_types = analytics.daily_columns(None if self.every_station else self.station_ids,
+                                                                        day_string(from_day), day_string(end_day))
+        order = np.argsort(self.station_ids)
+        sorted_ids = np.asarray(self.station_ids)[order]
+        found = np.minimum(np.searchsorted(sorted_ids, station_ids), len(sorted_ids) - 1)
+        # Stations that got their first rows after the table was built are left out
+        known = sorted_ids[found] == station_ids
+        positions = order[found[known]]
+        self.riders[days[known] - self.first_day, positions] = riders[known]
+        self.day_type[days[known] - self.first_day, positions] = day_types[known]
+
+    def recompute(self, from_row):
+        # Derived series for rows >= from_row, reading only the history they depend on
+        start = max(from_row - LOOKBACK_DAYS, 0)
+        block = compute(self.riders[start:], self.day_type[start:])
+        for name, values in block.items():
+            previous = self.series.get(name, self.riders[:0])
+            if len(previous) != len(self.riders):
+                # The grid grew; earlier rows keep their values
+                self.series[name] = np.concatenate([previous, np.full((len(self.riders) - len(previous), self.riders.shape[1]), np.nan)])
+            self.series[name][from_row:] = values[from_row - start:]
+        self.series['yoy_pct'] = year_over_year(self.series['mean_28'])
+
+    def changed_since(self, analytics):
+        # First day whose month totals in the rollups no longer match the grid, or None
+        if not len(self.riders):
+            return self.first_day
+        index = {station_id: idx for idx, station_id in enumerate(self.station_ids)}
+        months = self.dates.astype('datetime64[M]')
+        month_numbers = months.astype(np.int64) - months[0].astype(np.int64)
+        present = ~np.isnan(self.riders)
+        totals = np.zeros((month_numbers[-1] + 1, len(self.station_ids)))
+        counts = np.zeros_like(totals)
+        np.add.at(totals, month_numbers, np.where(present, self.riders, 0))
+        np.add.at(counts, month_numbers, present)
+
+        # Months cut off by either end of the grid cannot be compared with the rollups
+        first_month = 0 if self.dates[0] == months[0] else 1
+        last_month = len(totals) - 1
+        if self.end_date is not None and (self.dates[-1] + 1).astype('datetime64[M]') == months[-1]:
+            last_month -= 1
+
+        matched = np.zeros(totals.shape, dtype=bool)
+        first_year, first_month_of_year = (int(part) for part in str(months[0]).split('-'))
+        cursor = analytics.conn.cursor()
+        try:
+            cursor.execute(MONTH_TOTALS_SQL, (first_year, int(str(months[-1])[:4])))
+            for station_id, year, month, total, num_days in cursor:
+                idx = index.get(station_id)
+                offset = (year - first_year) * 12 + month - first_month_of_year
+                if idx is None or not first_month <= offset <= last_month:
+                    continue
+                matched[offset, idx] = totals[offset, idx] == (total or 0) and counts[offset, idx] == num_days
+                # A month the rollups have but the grid does not is a change too
+                counts[offset, idx] = max(counts[offset, idx], 1)
+        finally:
+            cursor.close()
+
+        changed = np.flatnonzero(((counts > 0) & ~matched)[first_month:last_month + 1].any(axis=1))
+        if not len(changed):
+            return None
+        month_start = (months[0] + first_month + int(changed[0])).astype('datetime64[D]').astype(np.int64)
+        return max(int(month_start), self.first_day)
+
+    def refresh(self, analytics):
+        # Brings the table up to date with the database: appended days extend it (unless it was
+        # loaded with an end date) and changed months are re-read, recomputing only from the
+        # earliest change. Returns the first recomputed date, or None when nothing changed.
+        version = analytics.data_version()
+        if version == self.version:
+            return None
+        grown = 0
+        if self.end_date is None:
+            last_date = analytics.statistics().last_date
+            if last_date:
+                grown = max(day_number(last_date) - (self.first_day + len(self.riders) - 1), 0)
+        if grown:
+            self.riders = np.concatenate([self.riders, np.full((grown, len(self.station_ids)), np.nan)])
+            self.day_type = np.concatenate([self.day_type, np.full((grown, len(self.station_ids)), -1, dtype=np.int8)])
+
+        since = self.changed_since(analytics)
+        self.version = version
+        if since is None:
+            return None
+        self.fill(analytics, since)
+        self.recompute(since - self.first_day)
+        return day_string(since)
+
+    def column(self, station_id):
+        return self.station_ids.index(station_id)
+
+    def latest(self, station_id):
+        # The last day the station has data: {'date', 'riders', series...}
+        idx = self.column(station_id)
+        rows = np.flatnonzero(~np.isnan(self.riders[:, idx]))
+        if not len(rows):
+            return None
+        row = rows[-1]
+        result = {'date': day_string(self.first_day + row), 'riders': int(self.riders[row, idx])}
+        for name in self.SERIES:
+            value = self.series[name][row, idx]
+            result[name] = None if np.isnan(value) else float(value)
+        return result
+
+    def anomalies(self, threshold=3.0):
+        # (date, Station_ID, riders, z-score) for every day with |z| > threshold, largest first
+        with np.errstate(invalid='ignore'):
+            rows, columns = np.nonzero(np.abs(self.series['zscore']) > threshold)
+        scores = self.series['zscore'][rows, columns]
+        order = np.argsort(-np.abs(scores), kind='stable')
+        return [(day_string(self.first_day + rows[i]), self.station_ids[columns[i]], int(self.riders[rows[i], columns[i]]), float(scores[i]))
+                for i in order]
+
+    def write_csv(self, path, threshold=3.0):
+        # One row per station and day with data
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Station_ID', 'Ride_Date', 'Riders', *self.SERIES, 'Anomaly'])
+            dates = self.dates.astype(str)
+            for idx, station_id in enumerate(self.station_ids):
+                for row in np.flatnonzero(~np.isnan(self.riders[:, idx])):
+                    values = [self.series[name][row, idx] for name in self.SERIES]
+                    z = self.series['zscore'][row, idx]
+                    writer.writerow([station_id, dates[row], int(self.riders[row, idx]),
+                                     *('' if np.isnan(value) else f"{value:.2f}" for value in values),
+                                     int(not np.isnan(z) and abs(z) > threshold)])